@@ -56,6 +56,7 @@ from models import (
     FloSearchName,
     TeamNameMapping,
     AthleteMediaCoverage,
+    SlowQuery,
 )
 from livestream_frame_archive import (
     DEFAULT_ERROR_RETRY_BACKOFF_SECONDS,
@@ -3437,6 +3438,23 @@ def team_name_mappings_settings():
     )
 
 
+@app.route("/slow_queries", methods=["GET", "POST"])
+def slow_queries():
+    if request.method == "POST":
+        action = request.form.get("action")
+        if action == "delete":
+            SlowQuery.query.filter_by(
+                fingerprint=request.form.get("fingerprint", "")
+            ).delete()
+        elif action == "clear":
+            SlowQuery.query.delete()
+        db.session.commit()
+        return redirect(url_for("slow_queries"))
+
+    queries = SlowQuery.query.order_by(SlowQuery.total_seconds.desc()).limit(100).all()
+    return render_template("slow_queries.html", queries=queries)
+
+
 @app.route("/athletes")
 @app.route("/athletes", methods=["GET", "POST"])
 def athletes():
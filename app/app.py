@@ -1,6 +1,6 @@
 import os
 import logging
-from flask import Flask, request, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 from extensions import db, migrate
 from seo import (
     render_index_with_fallback,
@@ -17,6 +17,11 @@ from routes.news import news_route
 from routes.teams import teams_route
 from routes.highlights import highlights_route
 from site_statistics import refresh_covered_match_count
+from rate_limiter import get_rate_limiter
+from request_metrics import init_request_metrics, render_metrics
+from response_cache import get_response_cache
+from slow_queries import init_slow_queries
+from warmup import warm_up
 
 logger = logging.getLogger("ibjjf")
 log_level = logging.DEBUG if os.getenv("DEBUG") else logging.INFO
@@ -42,6 +47,10 @@ else:
 
 db.init_app(app)
 migrate.init_app(app, db)
+init_request_metrics(app)
+init_slow_queries(app)
+# heavy dependencies load on first use unless WARMUP_MODULES names them
+warm_up(os.getenv("WARMUP_MODULES"))
 
 
 @app.cli.command("refresh-site-statistics")
@@ -51,6 +60,42 @@ def refresh_site_statistics_command():
     print(f"Cached {covered_count:,} covered matches.")
 
 
+@app.cli.command("response-cache-stats")
+def response_cache_stats_command():
+    for namespace, counters in sorted(get_response_cache().stats().items()):
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        print(
+            f"{namespace}: {hits:,} hits, {misses:,} misses"
+            f" ({hits / lookups if lookups else 0:.0%} hit rate),"
+            f" {counters.get('evictions', 0):,} evictions,"
+            f" {counters.get('entries', 0):,} entries"
+            f" ({counters.get('bytes') or 0:,} bytes)"
+        )
+
+
+@app.cli.command("rate-limit-stats")
+def rate_limit_stats_command():
+    for namespace, counters in sorted(get_rate_limiter().stats().items()):
+        print(
+            f"{namespace}: {counters.get('allowed', 0):,} allowed,"
+            f" {counters.get('rejected', 0):,} rejected,"
+            f" {counters.get('penalized', 0):,} penalties,"
+            f" {counters.get('clients', 0):,} clients"
+            f" ({counters.get('penalized_clients') or 0:,} penalized now)"
+        )
+
+
+@app.route("/metrics")
+def metrics():
+    # only for scrapers given METRICS_TOKEN; without one the endpoint is off
+    token = app.config.get("METRICS_TOKEN") or os.getenv("METRICS_TOKEN")
+    if not token or request.headers.get("Authorization") != f"Bearer {token}":
+        return Response(status=404)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/")
 def index():
     return render_index_with_fallback(app)
@@ -117,8 +162,14 @@ def add_cache_control_headers(response):
         request.path.startswith("/api/highlights/v1/assets/")
         and response.status_code == 200
     )
+    # responses of http_caching.conditional_get carry their own policy
+    conditional_response = (
+        response.status_code in (200, 304) and "ETag" in response.headers
+    )
     if (
-        request.path.startswith("/api/") and not cacheable_highlight_asset
+        request.path.startswith("/api/")
+        and not cacheable_highlight_asset
+        and not conditional_response
     ) or response.mimetype == "text/html":
         response.headers["Cache-Control"] = (
             "no-store, no-cache, must-revalidate, max-age=0"
@@ -0,0 +1,727 @@
+import copy
+import logging
+import math
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from constants import (
+    BLACK,
+    BLUE,
+    WHITE,
+    age_progression_index,
+    belt_order,
+    rated_ages,
+    weight_class_order,
+)
+from elo import (
+    AGE_K_FACTOR_MODIFIERS,
+    BLACK_PROMOTION_RATING_BUMP,
+    BLACK_WEIGHT_HANDICAPS,
+    COLOR_PROMOTION_RATING_BUMP,
+    COLOR_WEIGHT_HANDICAPS,
+    DEFAULT_RATINGS,
+    RATING_IMMATURE_COUNT,
+    RATING_VERY_IMMATURE_COUNT,
+    AthleteHistory,
+    EloCompetitor,
+    is_open_class,
+)
+from replay import (
+    RatingReplay,
+    ReplayMatch,
+    ReplayParticipant,
+    load_suspensions_by_id,
+    partition_genders,
+)
+
+log = logging.getLogger("ibjjf")
+
+# The backtest replays the rating history once with the real replay engine and
+# keeps only what the Elo parameters do not change: who met whom, who won,
+# match counts, weight differences and which start rating rule applies. Any
+# grid of parameter sets is then replayed from those arrays, with the ratings
+# of every parameter set held side by side in one NumPy row per athlete.
+# Matches still have to be replayed in order, so the vectorization is across
+# parameter sets; the grid is split over processes for more cores.
+
+CALIBRATION_BUCKETS = 10
+METRICS_BLOCK_SIZE = 4096
+PROBABILITY_EPSILON = 1e-15
+
+# row kinds
+TWO_SIDED = 0
+FIXED = 1  # a match without exactly two participants keeps its stored rating
+UNRATED_AGE = 2
+
+# outcomes of a two-sided row
+UNRATED = 0
+RED_WON = 1
+BLUE_WON = 2
+TIED = 3
+
+# start rating rules, as in elo.compute_start_rating
+START_DEFAULT = 0
+START_CARRY = 1
+START_PROMOTED = 2
+START_NEW_AGE = 3  # default rating if the carried rating falls between defaults
+
+NO_HANDICAP = -1
+
+
+@dataclass
+class EloParameters:
+    name: str
+    default_ratings: Dict[str, Dict[str, float]]
+    age_k_factor_modifiers: Dict[str, float]
+    black_weight_handicaps: List[float]
+    color_weight_handicaps: List[float]
+    color_promotion_rating_bump: float
+    black_promotion_rating_bump: float
+
+    @classmethod
+    def current(cls, name: str = "current") -> "EloParameters":
+        """The parameters elo.py rates with."""
+        return cls(
+            name,
+            copy.deepcopy(DEFAULT_RATINGS),
+            dict(AGE_K_FACTOR_MODIFIERS),
+            list(BLACK_WEIGHT_HANDICAPS),
+            list(COLOR_WEIGHT_HANDICAPS),
+            COLOR_PROMOTION_RATING_BUMP,
+            BLACK_PROMOTION_RATING_BUMP,
+        )
+
+    def with_overrides(self, overrides: dict) -> "EloParameters":
+        """A copy with the values of a grid entry applied.
+
+        default_ratings and age_k_factor_modifiers are merged per belt and age,
+        the other values are replaced.
+        """
+        parameters = copy.deepcopy(self)
+        for key, value in overrides.items():
+            if key == "name":
+                parameters.name = value
+            elif key == "default_ratings":
+                for belt, ratings in value.items():
+                    if belt not in parameters.default_ratings:
+                        raise ValueError(f"Unknown belt {belt} in default_ratings")
+                    parameters.default_ratings[belt].update(ratings)
+            elif key == "age_k_factor_modifiers":
+                parameters.age_k_factor_modifiers.update(value)
+            elif key in ("black_weight_handicaps", "color_weight_handicaps"):
+                if len(value) != len(getattr(parameters, key)):
+                    raise ValueError(
+                        f"{key} must have {len(getattr(parameters, key))} values"
+                    )
+                setattr(parameters, key, list(value))
+            elif key in (
+                "color_promotion_rating_bump",
+                "black_promotion_rating_bump",
+            ):
+                setattr(parameters, key, value)
+            else:
+                raise ValueError(f"Unknown Elo parameter {key}")
+        return parameters
+
+
+def parameter_grid(entries: List[dict]) -> List[EloParameters]:
+    """The current parameters followed by one parameter set per grid entry."""
+    current = EloParameters.current()
+    grid = [current]
+    for index, entry in enumerate(entries):
+        parameters = current.with_overrides(entry)
+        if "name" not in entry:
+            parameters.name = f"grid-{index + 1}"
+        grid.append(parameters)
+    names = [parameters.name for parameters in grid]
+    if len(set(names)) != len(names):
+        raise ValueError("Parameter set names must be unique")
+    return grid
+
+
+@dataclass
+class BacktestHistory:
+    """The parameter-independent part of one gi/gender partition's history."""
+
+    gi: bool
+    gender: str
+    athlete_ids: List[uuid.UUID] = field(default_factory=list)
+    # (belt, age) keys into DEFAULT_RATINGS, and ages for the K factor modifiers
+    default_keys: List[Tuple[str, str]] = field(default_factory=list)
+    ages: List[str] = field(default_factory=list)
+    columns: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.columns["kind"]) if self.columns else 0
+
+
+HISTORY_COLUMNS = {
+    "happened_at": "datetime64[us]",
+    "kind": np.int8,
+    "red": np.int32,
+    "blue": np.int32,
+    "outcome": np.int8,
+    "winner_only": np.bool_,
+    "black": np.bool_,
+    "key": np.int16,
+    "age": np.int16,
+    "red_start": np.int8,
+    "blue_start": np.int8,
+    "red_previous_key": np.int16,
+    "blue_previous_key": np.int16,
+    "red_k_factor": np.float64,
+    "blue_k_factor": np.float64,
+    "handicap": np.int8,
+    "red_handicapped": np.bool_,
+    "fixed_rating": np.float64,
+}
+
+
+class _DiscardChanges:
+    def participant(self, *args) -> None:
+        pass
+
+    def match(self, *args) -> None:
+        pass
+
+    def touch(self, *args) -> None:
+        pass
+
+
+def base_k_factor(match_count: int, unknown_open: bool) -> float:
+    # elo.compute_k_factor before the age modifier
+    if unknown_open:
+        return 32
+    if match_count <= RATING_VERY_IMMATURE_COUNT:
+        return 64
+    if match_count <= RATING_IMMATURE_COUNT:
+        return 48
+    return 32
+
+
+class HistoryRecorder(RatingReplay):
+    """A replay that records each rescored match as one backtest row."""
+
+    def __init__(
+        self,
+        session: Session,
+        gi: bool,
+        gender: str,
+        suspensions_by_id: Dict,
+    ):
+        super().__init__(session, gi, gender, suspensions_by_id, _DiscardChanges())
+        self.recorded = BacktestHistory(gi, gender)
+        self.rows: Dict[str, list] = {column: [] for column in HISTORY_COLUMNS}
+        self.slots: Dict[uuid.UUID, int] = {}
+        self.key_indexes: Dict[Tuple[str, str], int] = {}
+        self.age_indexes: Dict[str, int] = {}
+
+    def slot(self, athlete_id: uuid.UUID) -> int:
+        slot = self.slots.get(athlete_id)
+        if slot is None:
+            slot = self.slots[athlete_id] = len(self.recorded.athlete_ids)
+            self.recorded.athlete_ids.append(athlete_id)
+        return slot
+
+    def key_index(self, belt: str, age: str) -> int:
+        index = self.key_indexes.get((belt, age))
+        if index is None:
+            index = self.key_indexes[(belt, age)] = len(self.recorded.default_keys)
+            self.recorded.default_keys.append((belt, age))
+        return index
+
+    def age_index(self, age: str) -> int:
+        index = self.age_indexes.get(age)
+        if index is None:
+            index = self.age_indexes[age] = len(self.recorded.ages)
+            self.recorded.ages.append(age)
+        return index
+
+    def add_row(self, **values) -> None:
+        for column, items in self.rows.items():
+            items.append(values.get(column, 0))
+
+    def start_rule(
+        self, match: ReplayMatch, history: AthleteHistory
+    ) -> Tuple[int, int]:
+        # which branch of compute_start_rating applies, and the previous
+        # division's default rating key for the new age rule
+        division = match.division
+        last_match = history.last_match
+        if last_match is None or history.match_count == 0:
+            return START_DEFAULT, -1
+
+        current_belt_num = belt_order.index(division.belt)
+        previous_belt_num = min(
+            belt_order.index(last_match.match.division.belt), current_belt_num
+        )
+        if current_belt_num != previous_belt_num:
+            white_to_blue = current_belt_num == belt_order.index(
+                BLUE
+            ) and previous_belt_num == belt_order.index(WHITE)
+            if not white_to_blue and current_belt_num - previous_belt_num > 1:
+                return START_DEFAULT, -1
+            return START_PROMOTED, -1
+
+        previous = last_match.match.division
+        if (
+            age_progression_index(previous.age) < age_progression_index(division.age)
+            and not history.has_same_or_higher_age_match
+            and history.match_count <= RATING_VERY_IMMATURE_COUNT
+        ):
+            return START_NEW_AGE, self.key_index(previous.belt, previous.age)
+        return START_CARRY, -1
+
+    def rescore(
+        self, match: ReplayMatch, athlete_id: Optional[uuid.UUID] = None
+    ) -> List[ReplayParticipant]:
+        red, blue = match.participants
+        division = match.division
+        if division.age not in rated_ages:
+            changed = super().rescore(match, athlete_id)
+            self.add_row(
+                happened_at=match.happened_at,
+                kind=UNRATED_AGE,
+                red=self.slot(red.athlete_id),
+                blue=self.slot(blue.athlete_id),
+            )
+            return changed
+
+        red_history = self.history(match, red)
+        blue_history = self.history(match, blue)
+        red_start, red_previous_key = self.start_rule(match, red_history)
+        blue_start, blue_previous_key = self.start_rule(match, blue_history)
+
+        unknown_open = False
+        handicap = NO_HANDICAP
+        red_handicapped = False
+        if is_open_class(division):
+            if red_history.weight is None or blue_history.weight is None:
+                unknown_open = True
+            else:
+                red_weight_index = weight_class_order.index(red_history.weight)
+                blue_weight_index = weight_class_order.index(blue_history.weight)
+                handicap = abs(red_weight_index - blue_weight_index)
+                red_handicapped = red_weight_index >= blue_weight_index
+
+        changed = super().rescore(match, athlete_id)
+
+        if not match.rated:
+            outcome = UNRATED
+        elif red.winner:
+            outcome = RED_WON
+        elif blue.winner:
+            outcome = BLUE_WON
+        else:
+            outcome = TIED
+
+        self.add_row(
+            happened_at=match.happened_at,
+            kind=TWO_SIDED,
+            red=self.slot(red.athlete_id),
+            blue=self.slot(blue.athlete_id),
+            outcome=outcome,
+            winner_only=bool(match.rated_winner_only),
+            black=division.belt == BLACK,
+            key=self.key_index(division.belt, division.age),
+            age=self.age_index(division.age),
+            red_start=red_start,
+            blue_start=blue_start,
+            red_previous_key=red_previous_key,
+            blue_previous_key=blue_previous_key,
+            red_k_factor=base_k_factor(red_history.match_count, unknown_open),
+            blue_k_factor=base_k_factor(blue_history.match_count, unknown_open),
+            handicap=handicap,
+            red_handicapped=red_handicapped,
+        )
+        return changed
+
+    def fixed(self, match: ReplayMatch) -> None:
+        for participant in match.participants:
+            self.add_row(
+                happened_at=match.happened_at,
+                kind=FIXED,
+                red=self.slot(participant.athlete_id),
+                fixed_rating=participant.end_rating,
+            )
+
+    def arrays(self) -> BacktestHistory:
+        self.recorded.columns = {
+            column: np.array(self.rows[column], dtype=dtype)
+            for column, dtype in HISTORY_COLUMNS.items()
+        }
+        return self.recorded
+
+
+def load_backtest_history(
+    session: Session, gi: bool, gender: str, suspensions_by_id: Dict
+) -> BacktestHistory:
+    """Replay one partition with the current ratings and record its history."""
+    recorder = HistoryRecorder(session, gi, gender, suspensions_by_id)
+    recorder.load()
+    for match in recorder.matches:
+        if len(match.participants) == 2:
+            recorder.rescore(match)
+        else:
+            recorder.fixed(match)
+        recorder.record(match)
+    history = recorder.arrays()
+    log.info(
+        f"Loaded {len(history)} {'gi' if gi else 'no-gi'} {gender} backtest rows "
+        f"for {len(history.athlete_ids)} athletes"
+    )
+    return history
+
+
+@dataclass
+class BacktestMetrics:
+    """How well one parameter set's expected scores predicted the winners.
+
+    Predictions are the red athlete's EloCompetitor.expected_score before each
+    rated match with a winner, handicaps included.
+    """
+
+    name: str
+    matches: int = 0
+    log_loss_total: float = 0.0
+    brier_total: float = 0.0
+    bucket_matches: List[int] = field(default_factory=lambda: [0] * CALIBRATION_BUCKETS)
+    bucket_expected: List[float] = field(
+        default_factory=lambda: [0.0] * CALIBRATION_BUCKETS
+    )
+    bucket_wins: List[int] = field(default_factory=lambda: [0] * CALIBRATION_BUCKETS)
+
+    @property
+    def log_loss(self) -> Optional[float]:
+        if not self.matches:
+            return None
+        return self.log_loss_total / self.matches
+
+    @property
+    def brier_score(self) -> Optional[float]:
+        if not self.matches:
+            return None
+        return self.brier_total / self.matches
+
+    def add(self, other: "BacktestMetrics") -> None:
+        self.matches += other.matches
+        self.log_loss_total += other.log_loss_total
+        self.brier_total += other.brier_total
+        for bucket in range(CALIBRATION_BUCKETS):
+            self.bucket_matches[bucket] += other.bucket_matches[bucket]
+            self.bucket_expected[bucket] += other.bucket_expected[bucket]
+            self.bucket_wins[bucket] += other.bucket_wins[bucket]
+
+    def to_dict(self) -> dict:
+        calibration = []
+        for bucket in range(CALIBRATION_BUCKETS):
+            matches = self.bucket_matches[bucket]
+            calibration.append(
+                {
+                    "low": bucket / CALIBRATION_BUCKETS,
+                    "high": (bucket + 1) / CALIBRATION_BUCKETS,
+                    "matches": matches,
+                    "mean_expected": (
+                        self.bucket_expected[bucket] / matches if matches else None
+                    ),
+                    "win_rate": self.bucket_wins[bucket] / matches if matches else None,
+                }
+            )
+        return {
+            "name": self.name,
+            "matches": self.matches,
+            "log_loss": self.log_loss,
+            "brier_score": self.brier_score,
+            "calibration": calibration,
+        }
+
+
+class _MetricsAccumulator:
+    # expected scores are buffered in blocks and reduced with array operations
+    def __init__(self, parameter_count: int):
+        self.matches = 0
+        self.log_loss = np.zeros(parameter_count)
+        self.brier = np.zeros(parameter_count)
+        self.bucket_matches = np.zeros((parameter_count, CALIBRATION_BUCKETS), np.int64)
+        self.bucket_expected = np.zeros((parameter_count, CALIBRATION_BUCKETS))
+        self.bucket_wins = np.zeros((parameter_count, CALIBRATION_BUCKETS), np.int64)
+        self.expected = np.empty((METRICS_BLOCK_SIZE, parameter_count))
+        self.red_won = np.empty(METRICS_BLOCK_SIZE)
+        self.buffered = 0
+
+    def add(self, expected: np.ndarray, red_won: bool) -> None:
+        self.expected[self.buffered] = expected
+        self.red_won[self.buffered] = red_won
+        self.buffered += 1
+        if self.buffered == METRICS_BLOCK_SIZE:
+            self.reduce()
+
+    def reduce(self) -> None:
+        if not self.buffered:
+            return
+        expected = self.expected[: self.buffered]
+        red_won = self.red_won[: self.buffered, np.newaxis]
+        clipped = np.clip(expected, PROBABILITY_EPSILON, 1 - PROBABILITY_EPSILON)
+        self.log_loss -= (
+            red_won * np.log(clipped) + (1 - red_won) * np.log(1 - clipped)
+        ).sum(axis=0)
+        self.brier += ((expected - red_won) ** 2).sum(axis=0)
+        buckets = np.minimum(
+            (expected * CALIBRATION_BUCKETS).astype(np.int64), CALIBRATION_BUCKETS - 1
+        )
+        for bucket in range(CALIBRATION_BUCKETS):
+            in_bucket = buckets == bucket
+            self.bucket_matches[:, bucket] += in_bucket.sum(axis=0)
+            self.bucket_expected[:, bucket] += (expected * in_bucket).sum(axis=0)
+            self.bucket_wins[:, bucket] += (in_bucket & (red_won == 1)).sum(axis=0)
+        self.matches += self.buffered
+        self.buffered = 0
+
+    def metrics(self, parameters: List[EloParameters]) -> List[BacktestMetrics]:
+        self.reduce()
+        return [
+            BacktestMetrics(
+                p.name,
+                self.matches,
+                float(self.log_loss[index]),
+                float(self.brier[index]),
+                self.bucket_matches[index].tolist(),
+                self.bucket_expected[index].tolist(),
+                self.bucket_wins[index].tolist(),
+            )
+            for index, p in enumerate(parameters)
+        ]
+
+
+def expected_scores(red_ratings: np.ndarray, blue_ratings: np.ndarray) -> np.ndarray:
+    """EloCompetitor.expected_score of red against blue, elementwise."""
+    base = EloCompetitor._base_rating
+    red = 10 ** (red_ratings / base)
+    return red / (10 ** (blue_ratings / base) + red)
+
+
+def replay_history(
+    history: BacktestHistory,
+    parameters: List[EloParameters],
+    evaluate_from: Optional[datetime] = None,
+    metrics: Optional[_MetricsAccumulator] = None,
+) -> np.ndarray:
+    """Replay the history under every parameter set at once.
+
+    Returns each athlete's last rating, one row per athlete and one column per
+    parameter set. Expected scores of rated matches from evaluate_from on are
+    added to metrics.
+    """
+    count = len(parameters)
+    defaults = np.array(
+        [
+            [p.default_ratings.get(belt, {}).get(age, math.nan) for p in parameters]
+            for belt, age in history.default_keys
+        ]
+    ).reshape(len(history.default_keys), count)
+    k_factor_modifiers = np.array(
+        [
+            [p.age_k_factor_modifiers.get(age, 1.0) for p in parameters]
+            for age in history.ages
+        ]
+    ).reshape(len(history.ages), count)
+    # indexed by the division being black belt
+    handicaps = (
+        np.array([p.color_weight_handicaps for p in parameters]).T,
+        np.array([p.black_weight_handicaps for p in parameters]).T,
+    )
+    promotion_bumps = (
+        np.array([p.color_promotion_rating_bump for p in parameters], dtype=float),
+        np.array([p.black_promotion_rating_bump for p in parameters], dtype=float),
+    )
+    zeros = np.zeros(count)
+    ratings = np.zeros((len(history.athlete_ids), count))
+
+    def start_rating(rule, slot, key, previous_key, black):
+        if rule == START_DEFAULT:
+            return defaults[key]
+        last = ratings[slot]
+        if rule == START_CARRY:
+            return last
+        if rule == START_PROMOTED:
+            return last + promotion_bumps[black]
+        return np.where(
+            (last < defaults[previous_key]) & (last > defaults[key]),
+            defaults[key],
+            last,
+        )
+
+    columns = {column: values.tolist() for column, values in history.columns.items()}
+    evaluated = [True] * len(history)
+    if evaluate_from is not None:
+        evaluated = (
+            history.columns["happened_at"] >= np.datetime64(evaluate_from, "us")
+        ).tolist()
+
+    for (
+        kind,
+        red,
+        blue,
+        outcome,
+        winner_only,
+        black,
+        key,
+        age,
+        red_rule,
+        blue_rule,
+        red_previous_key,
+        blue_previous_key,
+        red_k_factor,
+        blue_k_factor,
+        handicap,
+        red_handicapped,
+        fixed_rating,
+        evaluate,
+    ) in zip(
+        columns["kind"],
+        columns["red"],
+        columns["blue"],
+        columns["outcome"],
+        columns["winner_only"],
+        columns["black"],
+        columns["key"],
+        columns["age"],
+        columns["red_start"],
+        columns["blue_start"],
+        columns["red_previous_key"],
+        columns["blue_previous_key"],
+        columns["red_k_factor"],
+        columns["blue_k_factor"],
+        columns["handicap"],
+        columns["red_handicapped"],
+        columns["fixed_rating"],
+        evaluated,
+    ):
+        if kind == FIXED:
+            ratings[red] = fixed_rating
+            continue
+        if kind == UNRATED_AGE:
+            ratings[red] = 0.0
+            ratings[blue] = 0.0
+            continue
+
+        red_start = start_rating(red_rule, red, key, red_previous_key, black)
+        blue_start = start_rating(blue_rule, blue, key, blue_previous_key, black)
+        if outcome == UNRATED:
+            ratings[red] = red_start
+            ratings[blue] = blue_start
+            continue
+
+        red_handicap = blue_handicap = zeros
+        if handicap != NO_HANDICAP:
+            table = handicaps[black]
+            weight_handicap = table[min(handicap, len(table) - 1)]
+            if red_handicapped:
+                red_handicap = weight_handicap
+            else:
+                blue_handicap = weight_handicap
+        red_rating = red_start + red_handicap
+        blue_rating = blue_start + blue_handicap
+        red_expected = expected_scores(red_rating, blue_rating)
+        blue_expected = expected_scores(blue_rating, red_rating)
+        if evaluate and metrics is not None and outcome != TIED:
+            metrics.add(red_expected, outcome == RED_WON)
+
+        modifier = k_factor_modifiers[age]
+        red_score = 0.5 if outcome == TIED else float(outcome == RED_WON)
+        red_end = (
+            red_rating + red_k_factor * modifier * (red_score - red_expected)
+        ) - red_handicap
+        blue_end = (
+            blue_rating + blue_k_factor * modifier * (1 - red_score - blue_expected)
+        ) - blue_handicap
+
+        # winners never lose points, and nobody goes below 0
+        if outcome == RED_WON:
+            lost = red_end < red_start
+        elif outcome == BLUE_WON:
+            lost = blue_end < blue_start
+        else:
+            lost = None
+        if lost is not None:
+            red_end = np.where(lost, red_start, red_end)
+            blue_end = np.where(lost, blue_start, blue_end)
+        red_end = np.where(red_end < 0, 0.0, red_end)
+        blue_end = np.where(blue_end < 0, 0.0, blue_end)
+
+        if winner_only:
+            if outcome == RED_WON:
+                blue_end = blue_start
+            elif outcome == BLUE_WON:
+                red_end = red_start
+
+        ratings[red] = red_end
+        ratings[blue] = blue_end
+
+    return ratings
+
+
+def run_backtest(
+    history: BacktestHistory,
+    parameters: List[EloParameters],
+    evaluate_from: Optional[datetime] = None,
+) -> List[BacktestMetrics]:
+    metrics = _MetricsAccumulator(len(parameters))
+    replay_history(history, parameters, evaluate_from, metrics)
+    return metrics.metrics(parameters)
+
+
+def backtest(
+    session: Session,
+    gis: List[bool],
+    parameters: List[EloParameters],
+    gender: Optional[str] = None,
+    jobs: int = 1,
+    evaluate_from: Optional[datetime] = None,
+) -> List[BacktestMetrics]:
+    """Score every parameter set against the stored match history.
+
+    The history of each gi/gender partition is loaded once. With jobs > 1 the
+    parameter sets are split into chunks and replayed in separate processes.
+    """
+    suspensions_by_id = load_suspensions_by_id(session)
+    histories = [
+        load_backtest_history(session, gi, partition_gender, suspensions_by_id)
+        for gi in gis
+        for partition_gender in partition_genders(session, gi, gender)
+    ]
+
+    chunk_size = math.ceil(len(parameters) / jobs)
+    chunks = [
+        (start, parameters[start : start + chunk_size])
+        for start in range(0, len(parameters), chunk_size)
+    ]
+    totals = [BacktestMetrics(p.name) for p in parameters]
+
+    def add(start: int, results: List[BacktestMetrics]) -> None:
+        for offset, result in enumerate(results):
+            totals[start + offset].add(result)
+
+    if jobs == 1:
+        for history in histories:
+            add(0, run_backtest(history, parameters, evaluate_from))
+        return totals
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        futures = [
+            (start, pool.submit(run_backtest, history, chunk, evaluate_from))
+            for history in histories
+            for start, chunk in chunks
+        ]
+        for start, future in futures:
+            add(start, future.result())
+    return totals
@@ -1,10 +1,29 @@
 import os
+import uuid
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional, List
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import text
+from sqlalchemy import bindparam, func, insert, text
 from flask_sqlalchemy import SQLAlchemy
-from models import Suspension
+from models import AthleteRating, Division, Match, RankingSnapshot, Suspension
+from ranking_generations import (
+    INCREMENTAL_MAX_TOUCHED_FRACTION,
+    earliest_dirty_at,
+    load_generations,
+    ranking_inputs_fingerprint,
+    save_generations,
+)
+from ranking_snapshots import (
+    delete_snapshots,
+    invalidate_snapshots,
+    load_snapshots,
+    snapshot_fingerprint,
+)
+from ranking_archive import archive_boards
+from rating_profile import timed
+from response_cache import get_response_cache
+from shadow_tables import copy_rows, create_shadow_table, swap_shadow_table
 from normalize import normalize
 from constants import (
     OPEN_CLASS,
@@ -13,6 +32,7 @@ from constants import (
     JUVENILE,
     JUVENILE_1,
     JUVENILE_2,
+    rated_ages,
     rated_ages_in,
 )
 from elo import (
@@ -32,6 +52,24 @@ def _public_age_sql(alias: str) -> str:
     )
 
 
+# a ranking board is one (gender, age, belt, gi, weight) ranking
+BOARD_COLUMNS = ("gender", "age", "belt", "gi", "weight")
+
+# boards only include athletes with a rated match in this period before the
+# board date
+ACTIVITY_PERIOD = relativedelta(years=1, months=1)
+
+
+def _board_join(left: str, right: str) -> str:
+    return " AND ".join(f"{left}.{c} = {right}.{c}" for c in BOARD_COLUMNS)
+
+
+def _athlete_filter(athletes: Optional[str], column: str) -> str:
+    if athletes is None:
+        return ""
+    return f"AND {column} IN (SELECT athlete_id FROM {athletes})"
+
+
 def create_ratings_tables(
     session,
     gi_in: str,
@@ -41,7 +79,12 @@ def create_ratings_tables(
     previous_date: Optional[datetime],
     name: str,
     match_data_source: Optional[str] = None,
+    athletes: Optional[str] = None,
 ) -> str:
+    # With athletes, a table of athlete ids, only those athletes' rows are
+    # built. Every stage but the final ranking is per athlete, so their rows
+    # come out as in a full build; only rank and percentile need the rest of
+    # the board.
     # Every ranking stage needs the same participant/match/division facts. Keep
     # that join and the board-date filter in one materialized temp table so the
     # growing match history is read once instead of once per stage.
@@ -70,6 +113,7 @@ def create_ratings_tables(
                 JOIN athletes a ON a.id = mp.athlete_id
                 WHERE {date_where}
                 AND d.age IN ({rated_ages_in})
+                {_athlete_filter(athletes, "mp.athlete_id")}
                 """
             ),
             {"previous_date": previous_date},
@@ -82,6 +126,7 @@ def create_ratings_tables(
                 SELECT *
                 FROM {match_data_source} md
                 WHERE {date_where.replace("m.", "md.")}
+                {_athlete_filter(athletes, "md.athlete_id")}
                 """
             ),
             {"previous_date": previous_date},
@@ -141,6 +186,7 @@ def create_ratings_tables(
                             ELSE 5 END AS belt_num, athlete_id
                 FROM manual_promotions
                 WHERE {date_where.replace("m.happened_at", "promoted_at")}
+                {_athlete_filter(athletes, "athlete_id")}
             ),
             registration_belts AS (
                 SELECT CASE WHEN d.belt = 'WHITE' THEN 1
@@ -153,6 +199,7 @@ def create_ratings_tables(
                 JOIN athletes a ON a.name = r.athlete_name
                 WHERE d.age IN ({rated_ages_in})
                 AND d.age NOT IN (:JUVENILE, :JUVENILE_1, :JUVENILE_2)
+                {_athlete_filter(athletes, "a.id")}
                 AND {
                     "false" if date_where != "true" else "true"
                 }
@@ -277,6 +324,7 @@ def create_ratings_tables(
                 WHERE d.age IN ({rated_ages_in})
                 AND d.age NOT IN (:JUVENILE, :JUVENILE_1, :JUVENILE_2)
                 AND a.normalized_name NOT IN ({','.join("'" + b + "'" for b in banned)})
+                {_athlete_filter(athletes, "a.id")}
                 AND {
                     "false" if date_where != "true" else "true"
                 }
@@ -406,6 +454,7 @@ def create_ratings_tables(
                 AND d.age NOT IN (:JUVENILE, :JUVENILE_1, :JUVENILE_2)
                 AND d.weight NOT IN (:OPEN_CLASS, :OPEN_CLASS_LIGHT, :OPEN_CLASS_HEAVY)
                 AND a.normalized_name NOT IN ({','.join("'" + b + "'" for b in banned)})
+                {_athlete_filter(athletes, "a.id")}
                 AND {
                     "false" if date_where != "true" else "true"
                 }
@@ -431,6 +480,7 @@ def create_ratings_tables(
                 AND d.age NOT IN (:JUVENILE, :JUVENILE_1, :JUVENILE_2)
                 AND d.weight NOT IN (:OPEN_CLASS, :OPEN_CLASS_LIGHT, :OPEN_CLASS_HEAVY)
                 AND a.normalized_name NOT IN ({','.join("'" + b + "'" for b in banned)})
+                {_athlete_filter(athletes, "a.id")}
                 AND {
                     "false" if date_where != "true" else "true"
                 }
@@ -663,6 +713,136 @@ def drop_ratings_tables(session, name: str) -> None:
     session.execute(text(f"DROP TABLE {name}"))
 
 
+def refresh_latest_ratings(
+    session, source: str, gi_in: str, athletes: Optional[str] = None
+) -> None:
+    """Rebuild athlete_latest_ratings from the board rows in source.
+
+    athletes limits the refresh to the athletes in that table, for boards
+    only rewritten for them.
+    """
+    athlete_filter = _athlete_filter(athletes, "athlete_id")
+    session.execute(
+        text(
+            f"""
+            DELETE FROM athlete_latest_ratings
+            WHERE gi IN ({gi_in}) {athlete_filter}
+            """
+        )
+    )
+    # the row of the athlete's most recent match
+    session.execute(
+        text(
+            f"""
+            INSERT INTO athlete_latest_ratings (athlete_id, gi, rating, match_count)
+            SELECT athlete_id, gi, rating, match_count
+            FROM (
+                SELECT
+                    athlete_id,
+                    gi,
+                    rating,
+                    match_count,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY athlete_id, gi
+                        ORDER BY match_happened_at DESC, id DESC
+                    ) AS row_num
+                FROM {source}
+                WHERE gi IN ({gi_in}) {athlete_filter}
+            ) ratings
+            WHERE row_num = 1
+            """
+        )
+    )
+
+
+def create_previous_ratings_table(
+    session,
+    gis: List[bool],
+    banned: List[str],
+    previous_date: datetime,
+    name: str,
+    match_data_source: Optional[str] = None,
+    athletes: Optional[str] = None,
+) -> None:
+    """Create temp table name with the boards as of previous_date.
+
+    The rows come from the stored ranking snapshots; missing or stale ones are
+    built first, with the activity period ending on previous_date. athletes
+    limits the table, not the snapshots, to the athletes in that table.
+    """
+    fingerprint = snapshot_fingerprint(session, banned)
+    snapshots = load_snapshots(session, gis, previous_date)
+    stale = [s.id for s in snapshots.values() if s.fingerprint != fingerprint]
+    delete_snapshots(session, stale)
+    missing = [gi for gi in gis if gi not in snapshots or snapshots[gi].id in stale]
+
+    if missing:
+        log.info(f"Building the ranking snapshot for {previous_date}")
+        with timed("snapshot"):
+            create_ratings_tables(
+                session,
+                ", ".join("true" if gi else "false" for gi in missing),
+                "m.happened_at < :previous_date",
+                banned,
+                previous_date - ACTIVITY_PERIOD,
+                previous_date,
+                "temp_snapshot_ratings",
+                match_data_source=match_data_source,
+            )
+            for gi in missing:
+                snapshot_id = uuid.uuid4()
+                session.execute(
+                    insert(RankingSnapshot.__table__),
+                    {
+                        "id": snapshot_id,
+                        "gi": gi,
+                        "snapshot_date": previous_date,
+                        "fingerprint": fingerprint,
+                        "created_at": datetime.now(),
+                    },
+                )
+                session.execute(
+                    text(
+                        """
+                        INSERT INTO ranking_snapshot_rows (snapshot_id, athlete_id, gender, age, weight,
+                                                           belt, rating, rank, match_count, percentile)
+                        SELECT :snapshot_id, athlete_id, gender, age, weight,
+                               belt, end_rating, rank, end_match_count, percentile
+                        FROM temp_snapshot_ratings
+                        WHERE gi = :gi
+                        """
+                    ).bindparams(
+                        bindparam("snapshot_id", type_=RankingSnapshot.id.type)
+                    ),
+                    {"snapshot_id": snapshot_id, "gi": gi},
+                )
+            drop_ratings_tables(session, "temp_snapshot_ratings")
+
+    gi_in = ", ".join("true" if gi else "false" for gi in gis)
+    session.execute(
+        text(
+            f"""
+            CREATE TEMPORARY TABLE {name} AS
+            SELECT r.athlete_id, r.gender, r.age, r.belt, s.gi, r.weight,
+                   r.rating AS end_rating, r.match_count AS end_match_count,
+                   r.rank, r.percentile
+            FROM ranking_snapshot_rows r
+            JOIN ranking_snapshots s ON s.id = r.snapshot_id
+            WHERE s.snapshot_date = :previous_date
+            AND s.gi IN ({gi_in})
+            {_athlete_filter(athletes, "r.athlete_id")}
+            """
+        ).bindparams(
+            bindparam("previous_date", type_=RankingSnapshot.snapshot_date.type)
+        ),
+        {"previous_date": previous_date},
+    )
+    session.execute(
+        text(f"CREATE INDEX {name}_ix ON {name} (athlete_id, gender, age, gi, weight)")
+    )
+    session.execute(text(f"ANALYZE {name}"))
+
+
 def previous_tuesday(dt: datetime) -> datetime:
     # if today is tuesday, go back one day
     if dt.weekday() == 1:
@@ -673,9 +853,274 @@ def previous_tuesday(dt: datetime) -> datetime:
     return dt.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
+def regenerate_touched_ratings(
+    session,
+    gis: List[bool],
+    gi_in: str,
+    banned: List[str],
+    activity_period: datetime,
+    previous_date: datetime,
+    fingerprint: str,
+    id_generate: str,
+) -> Optional["BoardRegeneration"]:
+    """Rebuild the board rows of athletes touched since the last generation.
+
+    Returns None, having changed nothing, when a full regeneration is needed.
+    The previous ranking columns of the touched athletes come from the ranking
+    snapshot for previous_date, as in a full regeneration.
+    """
+    generations = load_generations(session, gis)
+    reason = None
+    if len(generations) < len(gis):
+        reason = "there is no earlier generation"
+    elif any(g.previous_date != previous_date for g in generations.values()):
+        reason = "the previous ranking date changed"
+    elif any(g.fingerprint != fingerprint for g in generations.values()):
+        reason = "suspensions, promotions or registrations changed"
+    elif any(g.last_match_at is None for g in generations.values()):
+        reason = "the earlier generation had no matches"
+    else:
+        earliest = earliest_dirty_at(session, gis)
+        if earliest is not None and earliest < previous_date:
+            reason = "matches before the previous ranking date changed"
+    if reason is not None:
+        log.info(f"Regenerating the full ranking boards because {reason}")
+        return None
+
+    # athletes with logged changes, with matches newer than the last
+    # generation saw, or with matches that left the activity period since
+    session.execute(
+        text(
+            f"""
+            CREATE TEMPORARY TABLE temp_touched_athletes AS
+            SELECT athlete_id
+            FROM ranking_dirty_athletes
+            WHERE gi IN ({gi_in})
+            UNION
+            SELECT mp.athlete_id
+            FROM matches m
+            JOIN match_participants mp ON mp.match_id = m.id
+            JOIN divisions d ON d.id = m.division_id
+            WHERE d.age IN ({rated_ages_in})
+            AND (
+                m.happened_at > :last_match_at
+                OR (
+                    d.gi IN ({gi_in})
+                    AND m.happened_at >= :previous_activity_period
+                    AND m.happened_at < :activity_period
+                )
+            )
+            """
+        ),
+        {
+            "last_match_at": min(g.last_match_at for g in generations.values()),
+            "previous_activity_period": min(
+                g.activity_period for g in generations.values()
+            ),
+            "activity_period": activity_period,
+        },
+    )
+    touched = session.execute(
+        text("SELECT COUNT(*) FROM temp_touched_athletes")
+    ).scalar()
+    ranked = session.execute(
+        text(
+            f"SELECT COUNT(DISTINCT athlete_id) FROM athlete_ratings WHERE gi IN ({gi_in})"
+        )
+    ).scalar()
+    if touched > ranked * INCREMENTAL_MAX_TOUCHED_FRACTION:
+        session.execute(text("DROP TABLE temp_touched_athletes"))
+        log.info(
+            f"Regenerating the full ranking boards because {touched} of "
+            f"{ranked} ranked athletes changed"
+        )
+        return None
+
+    with timed("touched"):
+        create_ratings_tables(
+            session,
+            gi_in,
+            "true",
+            banned,
+            activity_period,
+            None,
+            "temp_touched_ratings",
+            athletes="temp_touched_athletes",
+        )
+
+    board_join = _board_join("b", "r")
+    session.execute(
+        text(
+            f"""
+            CREATE TEMPORARY TABLE temp_touched_boards AS
+            SELECT gender, age, belt, gi, weight
+            FROM athlete_ratings
+            WHERE gi IN ({gi_in})
+            AND athlete_id IN (SELECT athlete_id FROM temp_touched_athletes)
+            UNION
+            SELECT gender, age, belt, gi, weight
+            FROM temp_touched_ratings
+            """
+        )
+    )
+    # the same snapshot rows as a full regeneration, which differ from the
+    # old rows' for a board the athlete was not on before this generation
+    with timed("previous"):
+        create_previous_ratings_table(
+            session,
+            gis,
+            banned,
+            previous_date,
+            "temp_touched_previous",
+            athletes="temp_touched_athletes",
+        )
+    session.execute(
+        text(
+            f"""
+            DELETE FROM athlete_ratings
+            WHERE gi IN ({gi_in})
+            AND athlete_id IN (SELECT athlete_id FROM temp_touched_athletes)
+            """
+        )
+    )
+    session.execute(
+        text(
+            f"""
+        INSERT INTO athlete_ratings (id, athlete_id, gender, age, belt, gi, weight,
+                                     rating, match_count, match_happened_at, rank, percentile, previous_rating, previous_rank, previous_match_count, previous_percentile)
+        SELECT {id_generate}, c.*, p.end_rating, p.rank, p.end_match_count, p.percentile
+        FROM temp_touched_ratings c
+        LEFT JOIN temp_touched_previous p ON c.athlete_id = p.athlete_id AND c.gender = p.gender AND c.age = p.age AND
+                                             c.belt = p.belt AND c.gi = p.gi AND c.weight = p.weight
+            """
+        )
+    )
+
+    # rank and percentile as in create_ratings_tables, over the whole board
+    with timed("rerank"):
+        session.execute(
+            text(
+                f"""
+                CREATE TEMPORARY TABLE temp_touched_ranks AS
+                SELECT
+                    r.id,
+                    RANK() OVER (
+                        PARTITION BY r.gender, r.age, r.belt, r.gi, r.weight
+                        ORDER BY
+                            CASE WHEN r.match_count <= :RATING_VERY_IMMATURE_COUNT THEN 1 ELSE 0 END ASC,
+                            ROUND(r.rating) DESC
+                    ) AS rank,
+                    CASE
+                        WHEN r.match_count > :RATING_VERY_IMMATURE_COUNT THEN
+                            CUME_DIST() OVER (
+                            PARTITION BY r.gender, r.age, r.belt, r.gi, r.weight
+                            ORDER BY ROUND(r.rating) DESC
+                            )
+                        ELSE 1
+                    END AS percentile
+                FROM athlete_ratings r
+                JOIN temp_touched_boards b ON {board_join}
+                """
+            ),
+            {"RATING_VERY_IMMATURE_COUNT": RATING_VERY_IMMATURE_COUNT},
+        )
+        session.execute(
+            text(
+                """
+                UPDATE athlete_ratings
+                SET rank = t.rank, percentile = t.percentile
+                FROM temp_touched_ranks t
+                WHERE t.id = athlete_ratings.id
+                """
+            )
+        )
+
+    session.execute(
+        text(
+            f"""
+            DELETE FROM athlete_rating_averages
+            WHERE EXISTS (
+                SELECT 1
+                FROM temp_touched_boards b
+                WHERE {_board_join("b", "athlete_rating_averages")}
+            )
+            """
+        )
+    )
+    session.execute(
+        text(
+            f"""
+        INSERT INTO athlete_rating_averages (id, gender, age, belt, gi, weight, avg_rating)
+        SELECT {id_generate}, r.gender, r.age, r.belt, r.gi, r.weight, AVG(r.rating)
+        FROM athlete_ratings r
+        JOIN temp_touched_boards b ON {board_join}
+        GROUP BY r.gender, r.age, r.belt, r.gi, r.weight
+            """
+        )
+    )
+
+    refresh_latest_ratings(
+        session, "athlete_ratings", gi_in, athletes="temp_touched_athletes"
+    )
+
+    board_keys = [
+        (gender, age, belt, bool(gi), weight)
+        for gender, age, belt, gi, weight in session.execute(
+            text("SELECT gender, age, belt, gi, weight FROM temp_touched_boards")
+        )
+    ]
+    drop_ratings_tables(session, "temp_touched_ratings")
+    for table in (
+        "temp_touched_ranks",
+        "temp_touched_previous",
+        "temp_touched_boards",
+        "temp_touched_athletes",
+    ):
+        session.execute(text(f"DROP TABLE {table}"))
+
+    log.info(
+        f"Regenerated {len(board_keys)} ranking boards for {touched} changed athletes"
+    )
+    return BoardRegeneration(
+        incremental=True,
+        athletes=touched,
+        boards=len(board_keys),
+        board_keys=board_keys,
+    )
+
+
+def clear_cached_boards() -> None:
+    # responses are keyed by generation_id, so the old entries would only miss
+    # from now on; dropping them leaves the cache room for the new board
+    get_response_cache().clear("top")
+    get_response_cache().clear("top-count")
+
+
+@dataclass
+class BoardRegeneration:
+    incremental: bool
+    # for an incremental regeneration, the athletes and boards rebuilt
+    athletes: int = 0
+    boards: int = 0
+    generation_id: Optional[uuid.UUID] = None
+    board_keys: Optional[List[tuple]] = None
+
+
 def generate_current_ratings(
-    db: SQLAlchemy, gi: bool, nogi: bool, rank_previous_date: Optional[datetime]
-) -> None:
+    db: SQLAlchemy,
+    gi: bool,
+    nogi: bool,
+    rank_previous_date: Optional[datetime],
+    incremental: bool = False,
+) -> BoardRegeneration:
+    """Regenerate the gi and/or no-gi ranking boards.
+
+    incremental only rebuilds the athletes whose matches changed since the
+    last generation, and falls back to a full regeneration when that would
+    not give the same boards. A full regeneration builds a shadow board and
+    swaps it in last, so the caller should commit right after.
+    """
+    gis = [value for value, wanted in ((True, gi), (False, nogi)) if wanted]
     if gi and nogi:
         gi_in = "true, false"
     elif gi:
@@ -683,31 +1128,22 @@ def generate_current_ratings(
     elif nogi:
         gi_in = "false"
 
-    activity_period = datetime.now() - relativedelta(years=1, months=1)
+    activity_period = datetime.now() - ACTIVITY_PERIOD
 
     if rank_previous_date is None:
         rank_previous_date = datetime.now()
 
+    # step back whole weeks to the last Tuesday boundary with matches after it
     previous_date = previous_tuesday(rank_previous_date)
-    while True:
-        count = db.session.execute(
-            text(
-                f"""
-                SELECT COUNT(*)
-                FROM matches m
-                JOIN divisions d ON m.division_id = d.id
-                WHERE m.happened_at >= :previous_date
-                AND d.age IN ({rated_ages_in})
-                AND d.gi IN ({gi_in})
-                """
-            ),
-            {"previous_date": previous_date},
-        ).scalar()
-
-        if count > 0:
-            break
-
-        previous_date = previous_tuesday(previous_date)
+    last_match_at = (
+        db.session.query(func.max(Match.happened_at))
+        .join(Division)
+        .filter(Division.age.in_(rated_ages), Division.gi.in_(gis))
+        .scalar()
+    )
+    if last_match_at is not None and last_match_at < previous_date:
+        weeks = -((last_match_at - previous_date) // timedelta(weeks=1))
+        previous_date -= timedelta(weeks=weeks)
 
     log.info(f"Will show rating / ranking changes since: {previous_date}")
 
@@ -717,22 +1153,6 @@ def generate_current_ratings(
         # 2 MB) and spill heavily to temporary storage.
         db.session.execute(text("SET LOCAL work_mem = '32MB'"))
 
-    db.session.execute(
-        text(
-            f"""
-            DELETE FROM athlete_ratings where gi in ({gi_in})
-            """
-        )
-    )
-
-    db.session.execute(
-        text(
-            f"""
-            DELETE FROM athlete_rating_averages where gi in ({gi_in})
-            """
-        )
-    )
-
     if os.getenv("DATABASE_URL"):
         id_generate = "gen_random_uuid()"
         id_generate_avg = "gen_random_uuid()"
@@ -747,30 +1167,77 @@ def generate_current_ratings(
     )
     banned_normalized = [normalize(b[0]) for b in banned]
 
-    create_ratings_tables(
-        db.session,
-        gi_in,
-        "true",
-        banned_normalized,
-        activity_period,
-        None,
-        "temp_current_ratings",
-    )
-    create_ratings_tables(
-        db.session,
-        gi_in,
-        "m.happened_at < :previous_date",
-        banned_normalized,
-        activity_period,
-        previous_date,
-        "temp_previous_ratings",
-        match_data_source="temp_current_ratings_match_data",
+    fingerprint = ranking_inputs_fingerprint(db.session, banned_normalized)
+    # before a generation clears the logged rating changes
+    invalidate_snapshots(db.session, gis)
+
+    if incremental:
+        regeneration = regenerate_touched_ratings(
+            db.session,
+            gis,
+            gi_in,
+            banned_normalized,
+            activity_period,
+            previous_date,
+            fingerprint,
+            id_generate,
+        )
+        if regeneration is not None:
+            regeneration.generation_id = save_generations(
+                db.session,
+                gis,
+                activity_period,
+                previous_date,
+                last_match_at,
+                fingerprint,
+            )
+            with timed("archive"):
+                archive_boards(
+                    db.session,
+                    AthleteRating.__table__,
+                    gis,
+                    regeneration.generation_id,
+                    regeneration.board_keys,
+                )
+            clear_cached_boards()
+            return regeneration
+
+    # readers keep the old board until the rebuilt one is swapped in
+    board = create_shadow_table(db.session, AthleteRating.__table__)
+    copy_rows(db.session, AthleteRating.__table__, board, f"gi NOT IN ({gi_in})")
+
+    db.session.execute(
+        text(
+            f"""
+            DELETE FROM athlete_rating_averages where gi in ({gi_in})
+            """
+        )
     )
 
+    with timed("current"):
+        create_ratings_tables(
+            db.session,
+            gi_in,
+            "true",
+            banned_normalized,
+            activity_period,
+            None,
+            "temp_current_ratings",
+        )
+    with timed("previous"):
+        create_previous_ratings_table(
+            db.session,
+            gis,
+            banned_normalized,
+            previous_date,
+            "temp_previous_ratings",
+            match_data_source="temp_current_ratings_match_data",
+        )
+
     db.session.execute(
         text(
             f"""
-        INSERT INTO athlete_ratings (id, athlete_id, gender, age, belt, gi, weight,
+        INSERT INTO {board.name} (id, athlete_id, gender, age, belt, gi, weight,
                                      rating, match_count, match_happened_at, rank, percentile, previous_rating, previous_rank, previous_match_count, previous_percentile)
         SELECT {id_generate}, c.*, p.end_rating, p.rank, p.end_match_count, p.percentile
         FROM temp_current_ratings c
@@ -781,16 +1248,28 @@ def generate_current_ratings(
     )
 
     drop_ratings_tables(db.session, "temp_current_ratings")
-    drop_ratings_tables(db.session, "temp_previous_ratings")
+    db.session.execute(text("DROP TABLE temp_previous_ratings"))
 
     db.session.execute(
         text(
             f"""
         INSERT INTO athlete_rating_averages (id, gender, age, belt, gi, weight, avg_rating)
         SELECT {id_generate_avg}, gender, age, belt, gi, weight, AVG(rating)
-        FROM athlete_ratings
+        FROM {board.name}
         WHERE gi IN ({gi_in})
         GROUP BY gender, age, belt, gi, weight
             """
         )
     )
+
+    refresh_latest_ratings(db.session, board.name, gi_in)
+
+    generation_id = save_generations(
+        db.session, gis, activity_period, previous_date, last_match_at, fingerprint
+    )
+    with timed("archive"):
+        archive_boards(db.session, board, gis, generation_id)
+    with timed("swap"):
+        swap_shadow_table(db.session, AthleteRating.__table__, board)
+    clear_cached_boards()
+    return BoardRegeneration(incremental=False, generation_id=generation_id)
@@ -1,9 +1,11 @@
 import logging
+from dataclasses import dataclass
 from typing import Tuple, Optional, Dict
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from flask_sqlalchemy import SQLAlchemy
 from models import Match, MatchParticipant, Division, Medal, Suspension
+from rating_profile import timed
 from constants import (
     BLACK,
     BROWN,
@@ -353,26 +355,24 @@ def weight_handicaps(
     return red_handicap, blue_handicap
 
 
+def is_open_class(division: Division) -> bool:
+    return division.weight in (OPEN_CLASS, OPEN_CLASS_LIGHT, OPEN_CLASS_HEAVY)
+
+
 def open_handicaps(
-    db: SQLAlchemy,
-    event_id: str,
-    happened_at: datetime,
     division: Division,
-    red_athlete_id: str,
-    blue_athlete_id: str,
-) -> Tuple[bool, int, int, Optional[str], Optional[str]]:
-    if division.weight not in (OPEN_CLASS, OPEN_CLASS_LIGHT, OPEN_CLASS_HEAVY):
+    red_weight: Optional[str],
+    blue_weight: Optional[str],
+) -> Tuple[bool, float, float]:
+    if not is_open_class(division):
         log.debug("Not an open class match")
-        return False, 0, 0, None, None
-
-    red_weight = get_weight(db, division, red_athlete_id, happened_at, event_id)
-    blue_weight = get_weight(db, division, blue_athlete_id, happened_at, event_id)
+        return False, 0, 0
 
     # if one of the athletes has no non-open class matches or default golds,
     # treat it as an equal match
     if red_weight is None or blue_weight is None:
         log.debug("No non-open class matches or default golds, treating as equal match")
-        return True, 0, 0, red_weight, blue_weight
+        return True, 0, 0
 
     log.debug(
         "Open class match, red weight: %s, blue weight: %s", red_weight, blue_weight
@@ -386,7 +386,7 @@ def open_handicaps(
 
     log.debug("Red handicap: %s, blue handicap: %s", red_handicap, blue_handicap)
 
-    return False, red_handicap, blue_handicap, red_weight, blue_weight
+    return False, red_handicap, blue_handicap
 
 
 def append_rating_note(note: Optional[str], add_note: str) -> str:
@@ -522,6 +522,47 @@ def get_match_count(db, period, division, athlete_id, happened_at, match_id):
     return match_count
 
 
+@dataclass
+class AthleteHistory:
+    """What the rating of one side of a match depends on from earlier matches."""
+
+    last_match: Optional[MatchParticipant] = None
+    has_same_or_higher_age_match: bool = False
+    match_count: int = 0
+    weight: Optional[str] = None
+
+
+def get_athlete_history(
+    db: SQLAlchemy,
+    event_id: str,
+    match_id: str,
+    division: Division,
+    happened_at: datetime,
+    athlete_id: str,
+) -> AthleteHistory:
+    history = AthleteHistory()
+
+    if is_open_class(division):
+        history.weight = get_weight(db, division, athlete_id, happened_at, event_id)
+
+    if division.age not in rated_ages:
+        return history
+
+    last_match, same_or_higher_age_match = get_last_matches(
+        db, division, athlete_id, happened_at, match_id
+    )
+    history.last_match = last_match
+    history.has_same_or_higher_age_match = same_or_higher_age_match is not None
+
+    # get the number of rated matches played by the athlete in the same division in the last 3 years
+    three_years_prior = happened_at - relativedelta(years=3)
+    history.match_count = get_match_count(
+        db, three_years_prior, division, athlete_id, happened_at, match_id
+    )
+
+    return history
+
+
 def compute_ratings(
     db: SQLAlchemy,
     event_id: str,
@@ -554,14 +595,60 @@ def compute_ratings(
         blue_note,
     )
 
+    with timed("history"):
+        red_history = get_athlete_history(
+            db, event_id, match_id, division, happened_at, red_athlete_id
+        )
+        blue_history = get_athlete_history(
+            db, event_id, match_id, division, happened_at, blue_athlete_id
+        )
+
+    with timed("elo"):
+        return rate_match(
+            division,
+            happened_at,
+            rate_winner_only,
+            red_athlete_id,
+            red_winner,
+            red_note,
+            red_team_id,
+            red_history,
+            blue_athlete_id,
+            blue_winner,
+            blue_note,
+            blue_team_id,
+            blue_history,
+            suspensions,
+            is_final,
+        )
+
+
+def rate_match(
+    division: Division,
+    happened_at: datetime,
+    rate_winner_only: bool,
+    red_athlete_id: str,
+    red_winner: bool,
+    red_note: str,
+    red_team_id: str,
+    red_history: AthleteHistory,
+    blue_athlete_id: str,
+    blue_winner: bool,
+    blue_note: str,
+    blue_team_id: str,
+    blue_history: AthleteHistory,
+    suspensions: Dict[str, Suspension],
+    is_final: bool,
+) -> Tuple[
+    bool, Optional[str], float, float, float, float, Optional[str], Optional[str]
+]:
+    # compute_ratings looks the history up with queries; the replay engine in
+    # replay.py builds the same AthleteHistory from memory
+    red_weight = red_history.weight
+    blue_weight = blue_history.weight
+
     if division.age not in rated_ages:
         log.debug("Division age %s is not rated, skipping", division.age)
-        red_weight, blue_weight = None, None
-        if division.weight in (OPEN_CLASS, OPEN_CLASS_LIGHT, OPEN_CLASS_HEAVY):
-            red_weight = get_weight(db, division, red_athlete_id, happened_at, event_id)
-            blue_weight = get_weight(
-                db, division, blue_athlete_id, happened_at, event_id
-            )
         return (
             False,
             0.0,
@@ -578,29 +665,18 @@ def compute_ratings(
             0,
         )
 
-    red_last_match, red_same_or_higher_age_match = get_last_matches(
-        db, division, red_athlete_id, happened_at, match_id
-    )
-    blue_last_match, blue_same_or_higher_age_match = get_last_matches(
-        db, division, blue_athlete_id, happened_at, match_id
-    )
-
-    # get the number of rated matches played by each athlete in the same division in the last 3 years
-    three_years_prior = happened_at - relativedelta(years=3)
-
-    red_match_count = get_match_count(
-        db, three_years_prior, division, red_athlete_id, happened_at, match_id
-    )
-    blue_match_count = get_match_count(
-        db, three_years_prior, division, blue_athlete_id, happened_at, match_id
-    )
+    red_last_match = red_history.last_match
+    blue_last_match = blue_history.last_match
+    red_match_count = red_history.match_count
+    blue_match_count = blue_history.match_count
 
-    if red_last_match is not None:
-        log.debug("Red last match: %s", red_last_match.to_json())
-    if blue_last_match is not None:
-        log.debug("Blue last match: %s", blue_last_match.to_json())
-    log.debug("Red match count: %s", red_match_count)
-    log.debug("Blue match count: %s", blue_match_count)
+    if log.isEnabledFor(logging.DEBUG):
+        if red_last_match is not None:
+            log.debug("Red last match: %s", red_last_match.to_json())
+        if blue_last_match is not None:
+            log.debug("Blue last match: %s", blue_last_match.to_json())
+        log.debug("Red match count: %s", red_match_count)
+        log.debug("Blue match count: %s", blue_match_count)
 
     red_end_match_count = red_match_count
     blue_end_match_count = blue_match_count
@@ -608,13 +684,13 @@ def compute_ratings(
     red_start_rating, red_rating_note = compute_start_rating(
         division,
         red_last_match,
-        red_same_or_higher_age_match is not None,
+        red_history.has_same_or_higher_age_match,
         red_match_count,
     )
     blue_start_rating, blue_rating_note = compute_start_rating(
         division,
         blue_last_match,
-        blue_same_or_higher_age_match is not None,
+        blue_history.has_same_or_higher_age_match,
         blue_match_count,
     )
 
@@ -624,8 +700,8 @@ def compute_ratings(
     red_end_rating: float
     blue_end_rating: float
 
-    unknown_open, red_handicap, blue_handicap, red_weight, blue_weight = open_handicaps(
-        db, event_id, happened_at, division, red_athlete_id, blue_athlete_id
+    unknown_open, red_handicap, blue_handicap = open_handicaps(
+        division, red_weight, blue_weight
     )
 
     red_suspension = suspensions.get(red_athlete_id)
@@ -1,4 +1,4 @@
-import { useState, useEffect, useMemo } from 'react'
+import { useState, useEffect, useMemo, useRef } from 'react'
 import axios, { AxiosResponse } from 'axios';
 import DBFilters, {
   ageToFilter,
@@ -21,6 +21,8 @@ function DBTable() {
   const [reloading, setReloading] = useState(false)
   const [data, setData] = useState<Row[]>([])
   const [totalPages, setTotalPages] = useState(1)
+  // next-page cursors from earlier responses, for the current gi and filters
+  const cursors = useRef<{ key: string, pages: Record<number, string> }>({ key: '', pages: {} })
 
   const {
     activeTab,
@@ -41,15 +43,23 @@ function DBTable() {
 
   useEffect(() => {
     setReloading(true)
+    const cursorKey = JSON.stringify([gi, filters])
+    if (cursors.current.key !== cursorKey) {
+      cursors.current = { key: cursorKey, pages: {} }
+    }
     axios.get<Results>('/api/matches', {
       params: {
         gi: gi ? 'true' : 'false',
         ...filters,
-        page: page
+        page: page,
+        cursor: cursors.current.pages[page]
       }
     }).then((response: AxiosResponse<Results>) => {
       setData(response.data.rows)
       setTotalPages(response.data.totalPages)
+      if (response.data.nextCursor && cursors.current.key === cursorKey) {
+        cursors.current.pages[page + 1] = response.data.nextCursor
+      }
       setLoading(false)
       setReloading(false)
 
@@ -100,6 +100,7 @@ export interface DBRow {
 export interface DBResults {
   rows: DBRow[]
   totalPages: number
+  nextCursor: string | null
 }
 
 export interface Registration {
@@ -0,0 +1,101 @@
+import functools
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from flask import current_app, request
+
+from extensions import db
+from models import RankingGeneration
+
+# API responses are marked no-store by default (app.add_cache_control_headers).
+# Endpoints whose data comes from the ranking boards instead get a strong ETag
+# from the board generation ids, which change with every regeneration, and a
+# short max-age. The match list is not one of them: matches are inserted and
+# edited between generations, and have no version column to add to the ETag. A request whose If-None-Match
+# still matches is answered 304 before the view runs any query.
+#
+# Some of their inputs are written outside a generation (registrations, admin
+# edits, signed photo URLs that expire after an hour), so the ETag also names
+# the policy's time window: a client revalidating in a later window gets a
+# fresh body, which bounds how stale a 304 can keep it.
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    max_age: int
+    stale_while_revalidate: int
+    # seconds; 304s are only given in the window the body was built in
+    window: int
+
+    def cache_control(self) -> str:
+        return (
+            f"public, max-age={self.max_age}, "
+            f"stale-while-revalidate={self.stale_while_revalidate}"
+        )
+
+
+# by blueprint; the app config's HTTP_CACHE_POLICIES overrides these
+DEFAULT_POLICIES = {
+    "top_route": CachePolicy(max_age=60, stale_while_revalidate=300, window=600),
+    "athletes_route": CachePolicy(max_age=60, stale_while_revalidate=300, window=600),
+}
+
+
+def _policy() -> Optional[CachePolicy]:
+    policies = current_app.config.get("HTTP_CACHE_POLICIES", {})
+    return policies.get(request.blueprint, DEFAULT_POLICIES.get(request.blueprint))
+
+
+def ranking_versions() -> Optional[List[str]]:
+    """The gi and no-gi board generation ids, None until both were generated."""
+    generation_ids = {
+        gi: generation_id
+        for gi, generation_id in db.session.query(
+            RankingGeneration.gi, RankingGeneration.generation_id
+        )
+    }
+    if generation_ids.get(True) is None or generation_ids.get(False) is None:
+        return None
+    return [str(generation_ids[True]), str(generation_ids[False])]
+
+
+def conditional_get(versions: Callable[[], Optional[List[str]]] = ranking_versions):
+    """Answer the view with an ETag from versions, or 304 when it still matches.
+
+    Without a policy for the blueprint or a version, the view runs as before.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            policy = _policy()
+            data_versions = versions() if policy is not None else None
+            if data_versions is None:
+                return view(*args, **kwargs)
+
+            etag = hashlib.sha1(
+                json.dumps(
+                    [
+                        request.full_path,
+                        data_versions,
+                        int(time.time() // policy.window),
+                    ]
+                ).encode()
+            ).hexdigest()
+            # weak comparison, as proxies weaken ETags of bodies they compress
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = policy.cache_control()
+            return response
+
+        return wrapper
+
+    return decorator
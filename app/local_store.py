@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple, Type, TypeVar
+
+from flask import current_app, has_app_context
+
+# State shared by every gunicorn worker on a host, like the response cache,
+# the rate limiter and the request metrics, is kept in a SQLite file on local
+# disk. Each worker thread has its own connection, reopened after a fork, in
+# WAL mode without fsyncs: the data is cheap to lose with the host. A store
+# that is locked by another worker for longer than LOCK_TIMEOUT_SECONDS
+# raises sqlite3.OperationalError, which callers log and treat as unavailable
+# rather than failing the request.
+
+# wait this long for another worker's write before giving up
+LOCK_TIMEOUT_SECONDS = 0.1
+
+_COUNTERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (namespace, name)
+);
+"""
+
+
+class LocalStore:
+    # the tables of the store, created on connect next to the counters
+    schema = ""
+    # None for autocommit, for stores that take their own locks
+    isolation_level: Optional[str] = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread, reopened in forked workers
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        connection = sqlite3.connect(
+            self.path,
+            timeout=LOCK_TIMEOUT_SECONDS,
+            isolation_level=self.isolation_level,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.executescript(_COUNTERS_SCHEMA + self.schema)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, connection, namespace: str, name: str, value: int = 1) -> None:
+        connection.execute(
+            """
+            INSERT INTO counters (namespace, name, value) VALUES (?, ?, ?)
+            ON CONFLICT (namespace, name) DO UPDATE SET value = value + excluded.value
+            """,
+            (namespace, name, value),
+        )
+
+    def _counters(self) -> Dict[str, Dict[str, int]]:
+        counters = {}
+        for namespace, name, value in self._connection().execute(
+            "SELECT namespace, name, value FROM counters"
+        ):
+            counters.setdefault(namespace, {})[name] = value
+        return counters
+
+
+Store = TypeVar("Store", bound=LocalStore)
+
+_stores: Dict[Tuple[type, str], LocalStore] = {}
+
+
+def get_local_store(
+    store_class: Type[Store], config_name: str, default_filename: str
+) -> Store:
+    """The store_class at the path in config_name, from the app config or
+    environment, by default default_filename in the temp directory."""
+    path = None
+    if has_app_context():
+        path = current_app.config.get(config_name)
+    path = (
+        path
+        or os.getenv(config_name)
+        or os.path.join(tempfile.gettempdir(), default_filename)
+    )
+    store = _stores.get((store_class, path))
+    if store is None:
+        store = _stores[(store_class, path)] = store_class(path)
+    return store
@@ -0,0 +1,56 @@
+"""add rating checkpoints
+
+Revision ID: 3c5e8a1f7b24
+Revises: 7a2e9c4b1d60
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "3c5e8a1f7b24"
+down_revision = "7a2e9c4b1d60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "rating_checkpoints",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("gi", sa.Boolean(), nullable=False),
+        sa.Column("gender", sa.String(), nullable=False),
+        sa.Column("checkpoint_at", sa.DateTime(), nullable=False),
+        sa.Column("athlete_id", sa.UUID(), nullable=False),
+        sa.Column("last_participant_id", sa.UUID(), nullable=True),
+        sa.Column("ages", sa.Text(), nullable=False),
+        sa.Column("counted", sa.Text(), nullable=False),
+        sa.Column("weight_participant_id", sa.UUID(), nullable=True),
+        sa.Column("default_gold_at", sa.DateTime(), nullable=True),
+        sa.Column("default_gold_event_id", sa.UUID(), nullable=True),
+        sa.Column("default_gold_weight", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["athlete_id"], ["athletes.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "gi",
+            "gender",
+            "athlete_id",
+            "checkpoint_at",
+            name="uq_rating_checkpoints_athlete_checkpoint_at",
+        ),
+    )
+    op.create_index(
+        "ix_rating_checkpoints_checkpoint_at",
+        "rating_checkpoints",
+        ["gi", "gender", "checkpoint_at"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_rating_checkpoints_checkpoint_at", table_name="rating_checkpoints"
+    )
+    op.drop_table("rating_checkpoints")
@@ -0,0 +1,50 @@
+"""add ranking generations
+
+Revision ID: 5d1f2b7c9e03
+Revises: 3c5e8a1f7b24
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "5d1f2b7c9e03"
+down_revision = "3c5e8a1f7b24"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ranking_generations",
+        sa.Column("gi", sa.Boolean(), nullable=False),
+        sa.Column("generated_at", sa.DateTime(), nullable=False),
+        sa.Column("activity_period", sa.DateTime(), nullable=False),
+        sa.Column("previous_date", sa.DateTime(), nullable=False),
+        sa.Column("last_match_at", sa.DateTime(), nullable=True),
+        sa.Column("fingerprint", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("gi"),
+    )
+    op.create_table(
+        "ranking_dirty_athletes",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("gi", sa.Boolean(), nullable=False),
+        sa.Column("athlete_id", sa.UUID(), nullable=False),
+        sa.Column("happened_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["athlete_id"], ["athletes.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_ranking_dirty_athletes_gi",
+        "ranking_dirty_athletes",
+        ["gi", "athlete_id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_ranking_dirty_athletes_gi", table_name="ranking_dirty_athletes")
+    op.drop_table("ranking_dirty_athletes")
+    op.drop_table("ranking_generations")
@@ -0,0 +1,26 @@
+"""add ranking generation id
+
+Revision ID: 8b3e6f0d2a41
+Revises: 5d1f2b7c9e03
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "8b3e6f0d2a41"
+down_revision = "5d1f2b7c9e03"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("ranking_generations", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("generation_id", sa.UUID(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("ranking_generations", schema=None) as batch_op:
+        batch_op.drop_column("generation_id")
@@ -0,0 +1,49 @@
+"""add ranking snapshots
+
+Revision ID: a7c4d9e2f318
+Revises: 8b3e6f0d2a41
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "a7c4d9e2f318"
+down_revision = "8b3e6f0d2a41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ranking_snapshots",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("gi", sa.Boolean(), nullable=False),
+        sa.Column("snapshot_date", sa.DateTime(), nullable=False),
+        sa.Column("fingerprint", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("gi", "snapshot_date", name="uq_ranking_snapshots_gi_date"),
+    )
+    op.create_table(
+        "ranking_snapshot_rows",
+        sa.Column("snapshot_id", sa.UUID(), nullable=False),
+        sa.Column("athlete_id", sa.UUID(), nullable=False),
+        sa.Column("gender", sa.String(), nullable=False),
+        sa.Column("age", sa.String(), nullable=False),
+        sa.Column("weight", sa.String(), nullable=False),
+        sa.Column("belt", sa.String(), nullable=False),
+        sa.Column("rating", sa.Float(), nullable=False),
+        sa.Column("rank", sa.Integer(), nullable=True),
+        sa.Column("match_count", sa.Integer(), nullable=False),
+        sa.Column("percentile", sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(["snapshot_id"], ["ranking_snapshots.id"]),
+        sa.PrimaryKeyConstraint("snapshot_id", "athlete_id", "gender", "age", "weight"),
+    )
+
+
+def downgrade():
+    op.drop_table("ranking_snapshot_rows")
+    op.drop_table("ranking_snapshots")
@@ -0,0 +1,30 @@
+"""add matches happened_at id index
+
+Revision ID: b8d3f6a2c914
+Revises: e4a9c7b3f150
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+
+
+revision = "b8d3f6a2c914"
+down_revision = "e4a9c7b3f150"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /api/matches pages by (happened_at, id) cursors
+    with op.batch_alter_table("matches", schema=None) as batch_op:
+        batch_op.drop_index("ix_matches_happened_at")
+        batch_op.create_index(
+            "ix_matches_happened_at_id", ["happened_at", "id"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("matches", schema=None) as batch_op:
+        batch_op.drop_index("ix_matches_happened_at_id")
+        batch_op.create_index("ix_matches_happened_at", ["happened_at"], unique=False)
@@ -0,0 +1,45 @@
+"""add ranking archives
+
+Revision ID: c2f8a5b1d6e7
+Revises: a7c4d9e2f318
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "c2f8a5b1d6e7"
+down_revision = "a7c4d9e2f318"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ranking_archives",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("gender", sa.String(), nullable=False),
+        sa.Column("age", sa.String(), nullable=False),
+        sa.Column("belt", sa.String(), nullable=False),
+        sa.Column("gi", sa.Boolean(), nullable=False),
+        sa.Column("weight", sa.String(), nullable=False),
+        sa.Column("generated_at", sa.DateTime(), nullable=False),
+        sa.Column("generation_id", sa.UUID(), nullable=True),
+        sa.Column("rows", sa.Integer(), nullable=False),
+        sa.Column("digest", sa.String(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_ranking_archives_board",
+        "ranking_archives",
+        ["gender", "age", "belt", "gi", "weight", "generated_at"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_ranking_archives_board", table_name="ranking_archives")
+    op.drop_table("ranking_archives")
@@ -0,0 +1,44 @@
+"""add slow queries table
+
+Revision ID: c5e1a9d7b362
+Revises: b8d3f6a2c914
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "c5e1a9d7b362"
+down_revision = "b8d3f6a2c914"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "slow_queries",
+        sa.Column("fingerprint", sa.String(length=40), nullable=False),
+        sa.Column("statement", sa.Text(), nullable=False),
+        sa.Column("example_statement", sa.Text(), nullable=False),
+        sa.Column("example_parameters", sa.Text(), nullable=True),
+        sa.Column("plan", sa.Text(), nullable=True),
+        sa.Column("calls", sa.Integer(), nullable=False),
+        sa.Column("total_seconds", sa.Float(), nullable=False),
+        sa.Column("max_seconds", sa.Float(), nullable=False),
+        sa.Column("first_seen_at", sa.DateTime(), nullable=False),
+        sa.Column("last_seen_at", sa.DateTime(), nullable=False),
+        sa.Column("explained_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("fingerprint"),
+    )
+    with op.batch_alter_table("slow_queries", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_slow_queries_total_seconds", ["total_seconds"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("slow_queries", schema=None) as batch_op:
+        batch_op.drop_index("ix_slow_queries_total_seconds")
+    op.drop_table("slow_queries")
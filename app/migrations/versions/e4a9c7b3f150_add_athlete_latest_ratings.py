@@ -0,0 +1,52 @@
+"""add athlete latest ratings
+
+Revision ID: e4a9c7b3f150
+Revises: c2f8a5b1d6e7
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "e4a9c7b3f150"
+down_revision = "c2f8a5b1d6e7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "athlete_latest_ratings",
+        sa.Column("athlete_id", sa.UUID(), nullable=False),
+        sa.Column("gi", sa.Boolean(), nullable=False),
+        sa.Column("rating", sa.Float(), nullable=False),
+        sa.Column("match_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["athlete_id"], ["athletes.id"]),
+        sa.PrimaryKeyConstraint("athlete_id", "gi"),
+    )
+
+    op.execute(
+        """
+        INSERT INTO athlete_latest_ratings (athlete_id, gi, rating, match_count)
+        SELECT athlete_id, gi, rating, match_count
+        FROM (
+            SELECT
+                athlete_id,
+                gi,
+                rating,
+                match_count,
+                ROW_NUMBER() OVER (
+                    PARTITION BY athlete_id, gi
+                    ORDER BY match_happened_at DESC, id DESC
+                ) AS row_num
+            FROM athlete_ratings
+        ) ratings
+        WHERE row_num = 1
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("athlete_latest_ratings")
@@ -15,6 +15,7 @@ from sqlalchemy import (
     UniqueConstraint,
     CheckConstraint,
     BigInteger,
+    LargeBinary,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID, TIMESTAMP, TSVECTOR
@@ -300,7 +301,7 @@ class Match(db.Model):
     __table_args__ = (
         Index("ix_matches_event_id", "event_id"),
         Index("ix_matches_division_id", "division_id"),
-        Index("ix_matches_happened_at", "happened_at"),
+        Index("ix_matches_happened_at_id", "happened_at", "id"),
         Index("ix_matches_division_id_covering", "division_id", "happened_at", "id"),
     )
 
@@ -429,6 +430,137 @@ class AthleteRating(db.Model):
     )
 
 
+class AthleteLatestRating(db.Model):
+    # one athlete_ratings row per athlete and gi, refreshed with the boards by
+    # generate_current_ratings, for lookups that want a single rating per
+    # athlete without windowing the whole board
+    __tablename__ = "athlete_latest_ratings"
+    athlete_id = Column(UUID(as_uuid=True), ForeignKey("athletes.id"), primary_key=True)
+    gi = Column(Boolean, primary_key=True)
+    rating = Column(Float, nullable=False)
+    match_count = Column(Integer, nullable=False)
+
+
+class RatingCheckpoint(db.Model):
+    # per-athlete replay state at a Tuesday boundary, covering matches before
+    # checkpoint_at; a row is written only when the state changed since the
+    # previous checkpoint, so the state at a date is the latest row per athlete
+    __tablename__ = "rating_checkpoints"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    gi = Column(Boolean, nullable=False)
+    gender = Column(String, nullable=False)
+    checkpoint_at = Column(DateTime, nullable=False)
+    athlete_id = Column(UUID(as_uuid=True), ForeignKey("athletes.id"), nullable=False)
+    last_participant_id = Column(UUID(as_uuid=True), nullable=True)
+    ages = Column(Text, nullable=False)
+    counted = Column(Text, nullable=False)
+    weight_participant_id = Column(UUID(as_uuid=True), nullable=True)
+    default_gold_at = Column(DateTime, nullable=True)
+    default_gold_event_id = Column(UUID(as_uuid=True), nullable=True)
+    default_gold_weight = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_rating_checkpoints_checkpoint_at", "gi", "gender", "checkpoint_at"),
+        UniqueConstraint(
+            "gi",
+            "gender",
+            "athlete_id",
+            "checkpoint_at",
+            name="uq_rating_checkpoints_athlete_checkpoint_at",
+        ),
+    )
+
+
+class RankingGeneration(db.Model):
+    # inputs of the last ranking board generation for gi or no-gi; an
+    # incremental regeneration is only valid while they still hold
+    __tablename__ = "ranking_generations"
+    gi = Column(Boolean, primary_key=True)
+    generated_at = Column(DateTime, nullable=False)
+    activity_period = Column(DateTime, nullable=False)
+    previous_date = Column(DateTime, nullable=False)
+    last_match_at = Column(DateTime, nullable=True)
+    fingerprint = Column(String, nullable=False)
+    # changes whenever the board rows do, for readers to key caches on
+    generation_id = Column(UUID(as_uuid=True), nullable=True)
+
+
+class RankingDirtyAthlete(db.Model):
+    # an athlete whose match ratings changed since the last gi or no-gi board
+    # generation, with the time of the earliest changed match
+    __tablename__ = "ranking_dirty_athletes"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    gi = Column(Boolean, nullable=False)
+    athlete_id = Column(UUID(as_uuid=True), ForeignKey("athletes.id"), nullable=False)
+    happened_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_ranking_dirty_athletes_gi", "gi", "athlete_id"),)
+
+
+class RankingSnapshot(db.Model):
+    # the gi or no-gi ranking boards as of a Tuesday boundary, built once and
+    # joined for the previous ranking columns of later generations; valid while
+    # no rating before snapshot_date changes and the fingerprint still matches
+    __tablename__ = "ranking_snapshots"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    gi = Column(Boolean, nullable=False)
+    snapshot_date = Column(DateTime, nullable=False)
+    fingerprint = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("gi", "snapshot_date", name="uq_ranking_snapshots_gi_date"),
+    )
+
+
+class RankingSnapshotRow(db.Model):
+    # one board row of a RankingSnapshot; only what the previous ranking
+    # columns need
+    __tablename__ = "ranking_snapshot_rows"
+    snapshot_id = Column(
+        UUID(as_uuid=True), ForeignKey("ranking_snapshots.id"), primary_key=True
+    )
+    athlete_id = Column(UUID(as_uuid=True), primary_key=True)
+    gender = Column(String, primary_key=True)
+    age = Column(String, primary_key=True)
+    weight = Column(String, primary_key=True)
+    belt = Column(String, nullable=False)
+    rating = Column(Float, nullable=False)
+    rank = Column(Integer, nullable=True)
+    match_count = Column(Integer, nullable=False)
+    percentile = Column(Float, nullable=True)
+
+
+class RankingArchive(db.Model):
+    # one ranking board as generated, stored only when it changed since its
+    # previous archive, so the board as of a date is its latest archive by
+    # then; data holds the rows encoded by ranking_archive.encode_board
+    __tablename__ = "ranking_archives"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    gender = Column(String, nullable=False)
+    age = Column(String, nullable=False)
+    belt = Column(String, nullable=False)
+    gi = Column(Boolean, nullable=False)
+    weight = Column(String, nullable=False)
+    generated_at = Column(DateTime, nullable=False)
+    generation_id = Column(UUID(as_uuid=True), nullable=True)
+    rows = Column(Integer, nullable=False)
+    digest = Column(String, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_ranking_archives_board",
+            "gender",
+            "age",
+            "belt",
+            "gi",
+            "weight",
+            "generated_at",
+        ),
+    )
+
+
 class BracketPage(db.Model):
     __tablename__ = "bracket_pages"
 
@@ -938,3 +1070,23 @@ class TeamNameMapping(db.Model):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name_match = Column(String, nullable=False)
     mapped_name = Column(String, nullable=False)
+
+
+class SlowQuery(db.Model):
+    __tablename__ = "slow_queries"
+
+    # sha1 of the statement with literals masked
+    fingerprint = Column(String(40), primary_key=True)
+    statement = Column(Text, nullable=False)
+    # the slowest execution
+    example_statement = Column(Text, nullable=False)
+    example_parameters = Column(Text, nullable=True)
+    plan = Column(Text, nullable=True)
+    calls = Column(Integer, nullable=False, default=0)
+    total_seconds = Column(Float, nullable=False, default=0.0)
+    max_seconds = Column(Float, nullable=False, default=0.0)
+    first_seen_at = Column(DateTime, nullable=False)
+    last_seen_at = Column(DateTime, nullable=False)
+    explained_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_slow_queries_total_seconds", "total_seconds"),)
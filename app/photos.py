@@ -1,22 +1,45 @@
 import json
 import os
-import boto3
-import requests
+import threading
+import time
 import re
 from uuid import UUID
-from bs4 import BeautifulSoup
 import logging
 import io
 from datetime import datetime, timezone
-from PIL import Image, ImageOps, UnidentifiedImageError
+from typing import Dict, Iterable
+from cachetools import TTLCache
 from models import Athlete
 from normalize import normalize
 
 log = logging.getLogger("ibjjf")
 
+# Profile photos are served through presigned S3 URLs, and ranking, matches,
+# profile and bracket responses carry one per athlete. Each worker reuses one
+# S3 client and keeps the URLs it signed in a bounded TTL cache, keyed by the
+# photo and the time it was saved, so a new upload gets a new URL. Entries are
+# dropped well before the URL expires: a URL handed out can still sit in the
+# response cache and HTTP caches (minutes) before a browser loads it.
+#
+# boto3, PIL, requests and BeautifulSoup are imported where they are used:
+# together they are a large part of the web app's import time, and most
+# workers only ever sign URLs.
+PHOTO_URL_EXPIRES_IN = 3600
+PHOTO_URL_CACHE_TTL = 2400
+PHOTO_URL_CACHE_SIZE = 50000
+
+photo_url_cache = TTLCache(
+    maxsize=PHOTO_URL_CACHE_SIZE, ttl=PHOTO_URL_CACHE_TTL, timer=time.monotonic
+)
+_photo_url_cache_lock = threading.Lock()
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
 
 def convert_image_to_jpeg(image_bytes: bytes, quality: int = 90) -> bytes:
     """Decode an uploaded image and return orientation-corrected RGB JPEG bytes."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
     try:
         with Image.open(io.BytesIO(image_bytes)) as source:
             source.load()
@@ -39,13 +62,23 @@ def convert_image_to_jpeg(image_bytes: bytes, quality: int = 90) -> bytes:
 
 
 def get_s3_client():
-    aws_creds = json.loads(os.getenv("AWS_CREDS"))
-    return boto3.client(
-        "s3",
-        aws_access_key_id=aws_creds["aws_access_key_id"],
-        aws_secret_access_key=aws_creds["aws_secret_access_key"],
-        region_name=aws_creds.get("region"),
-    )
+    """The worker's S3 client for the AWS_CREDS credentials."""
+    import boto3
+
+    aws_creds_json = os.getenv("AWS_CREDS")
+    # clients are thread safe but not fork safe, so they are kept per process
+    key = (os.getpid(), aws_creds_json)
+    with _s3_clients_lock:
+        client = _s3_clients.get(key)
+        if client is None:
+            aws_creds = json.loads(aws_creds_json)
+            session = boto3.session.Session(
+                aws_access_key_id=aws_creds["aws_access_key_id"],
+                aws_secret_access_key=aws_creds["aws_secret_access_key"],
+                region_name=aws_creds.get("region"),
+            )
+            client = _s3_clients[key] = session.client("s3")
+        return client
 
 
 bucket_name = os.getenv("S3_BUCKET")
@@ -55,6 +88,9 @@ if os.getenv("DATABASE_URL") is None:
 
 
 def get_instagram_profile_photo_url(instagram_username):
+    import requests
+    from bs4 import BeautifulSoup
+
     url = f"https://www.instagram.com/{instagram_username}/"
     headers = {"User-Agent": "Mozilla/5.0"}
     response = requests.get(url, headers=headers)
@@ -87,6 +123,8 @@ def get_instagram_profile_photo_url(instagram_username):
 def save_instagram_profile_photo_to_s3(
     s3_client, athlete: Athlete, save_photo: bool = True, save_name: bool = False
 ):
+    import requests
+
     photo_url, ig_name = get_instagram_profile_photo_url(athlete.instagram_profile)
 
     if save_photo:
@@ -165,7 +203,7 @@ def save_profile_photo_to_s3(
     athlete.profile_image_saved_at = datetime.now(timezone.utc)
 
 
-def get_public_photo_url(s3_client, athlete: Athlete):
+def _photo_url_key(athlete: Athlete):
     if not getattr(athlete, "profile_image_saved_at", None):
         raise Exception("Athlete does not have a profile image saved")
 
@@ -176,11 +214,49 @@ def get_public_photo_url(s3_client, athlete: Athlete):
     if isinstance(athlete_id, str):
         athlete_id = UUID(athlete_id)
 
-    photo_path = f"{photo_key}/{athlete_id}.jpg"
-    # sign URL with AWS credentials
-    url = s3_client.generate_presigned_url(
-        "get_object",
-        Params={"Bucket": bucket_name, "Key": photo_path},
-        ExpiresIn=3600,  # URL valid for 1 hour
-    )
-    return url
+    return athlete_id, str(athlete.profile_image_saved_at)
+
+
+def _sign_photo_urls(s3_client, keys) -> Dict:
+    with _photo_url_cache_lock:
+        urls = {key: photo_url_cache.get(key) for key in keys}
+    missing = [key for key, url in urls.items() if url is None]
+    if not missing:
+        return urls
+
+    for key in missing:
+        athlete_id, _ = key
+        # sign URL with AWS credentials
+        urls[key] = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket_name, "Key": f"{photo_key}/{athlete_id}.jpg"},
+            ExpiresIn=PHOTO_URL_EXPIRES_IN,
+        )
+    with _photo_url_cache_lock:
+        for key in missing:
+            photo_url_cache[key] = urls[key]
+    return urls
+
+
+def get_public_photo_url(s3_client, athlete: Athlete):
+    key = _photo_url_key(athlete)
+    return _sign_photo_urls(s3_client, [key])[key]
+
+
+def get_public_photo_urls(s3_client, athletes: Iterable[Athlete]) -> Dict[UUID, str]:
+    """Photo URLs by athlete id for a page of athletes, skipping those without one.
+
+    Takes anything with the id and profile_image_saved_at of an Athlete, like
+    query rows. Without an S3 client there are no URLs.
+    """
+    if s3_client is None:
+        return {}
+    keys = {
+        _photo_url_key(athlete)
+        for athlete in athletes
+        if getattr(athlete, "profile_image_saved_at", None)
+    }
+    return {
+        athlete_id: url
+        for (athlete_id, _), url in _sign_photo_urls(s3_client, keys).items()
+    }
@@ -5,9 +5,17 @@ log = logging.getLogger("ibjjf")
 
 # custom progress bar that can log to a file in non-tty environments
 
+# progress suffix for the rating recompute loops
+MATCH_RATE_SUFFIX = "%(index)d/%(max)d, %(rate)d matches/s"
+
 
 class Bar(ProgressBar):
 
+    @property
+    def rate(self):
+        # items per second over the moving average window
+        return 1 / self.avg if self.avg else 0
+
     def writeln(self, line):
         if not self.no_tty:
             super().writeln(line)
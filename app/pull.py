@@ -1,8 +1,5 @@
 import time
-import requests
-from requests.adapters import HTTPAdapter
 from datetime import datetime
-from bs4 import BeautifulSoup
 import re
 from elo import WINNER_NOT_RECORDED
 
@@ -16,6 +13,8 @@ class InternalServerError(Exception):
 
 
 def rate_limit_get(session, url, limit, retries):
+    import requests
+
     if limit:
         time.sleep(limit)
     if retries is None:
@@ -217,6 +216,10 @@ def pull_tournament(
     incomplete=False,
     slow_mode=False,
 ):
+    import requests
+    from bs4 import BeautifulSoup
+    from requests.adapters import HTTPAdapter
+
     total_matches = 0
     total_defaults = 0
     total_categories = 0
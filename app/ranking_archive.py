@@ -0,0 +1,310 @@
+import hashlib
+import logging
+import struct
+import uuid
+import zlib
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import groupby
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Table, and_, func, insert, select, tuple_
+
+from models import RankingArchive
+
+if TYPE_CHECKING:
+    import numpy as np
+
+log = logging.getLogger("ibjjf")
+
+# Every ranking generation is archived board by board, so past boards are read
+# back instead of rerunning generate_current_ratings for an old date. A board
+# is only stored when it differs from its previous archive, so a board's
+# archive dates are the dates it changed and the board as of a date is the
+# latest archive by then, found by bisecting the dates.
+#
+# Rows are stored in board order, column by column: athlete ids as raw bytes,
+# ranks and ratings in hundredths as deltas from the previous row, match counts
+# and percentiles in hundredths of a percent, the whole zlib-compressed. Ranks
+# and ratings move in small steps down a board, so their deltas compress to a
+# byte or two; the random athlete ids are most of the size. numpy is imported
+# by the functions that need it, so web workers that never read an archived
+# board do not load it.
+
+ENCODING_VERSION = 1
+_HEADER = struct.Struct("<BI")
+
+# (gender, age, belt, gi, weight)
+BoardKey = Tuple[str, str, str, bool, str]
+
+
+@dataclass
+class ArchivedBoard:
+    generated_at: datetime
+    generation_id: Optional[uuid.UUID]
+    # 16 bytes per row
+    athlete_ids: bytes
+    ranks: "np.ndarray"
+    ratings: "np.ndarray"
+    match_counts: "np.ndarray"
+    percentiles: "np.ndarray"
+
+    def __len__(self) -> int:
+        return len(self.ranks)
+
+    def athlete_id(self, index: int) -> uuid.UUID:
+        return uuid.UUID(bytes=self.athlete_ids[index * 16 : (index + 1) * 16])
+
+    def position(self, athlete_id: uuid.UUID) -> Optional[int]:
+        start = 0
+        while True:
+            index = self.athlete_ids.find(athlete_id.bytes, start)
+            if index < 0:
+                return None
+            if index % 16 == 0:
+                return index // 16
+            start = index + 1
+
+    def row(self, index: int) -> dict:
+        rank = int(self.ranks[index])
+        percentile = int(self.percentiles[index])
+        return {
+            "rank": rank or None,
+            "rating": round(float(self.ratings[index])),
+            "match_count": int(self.match_counts[index]),
+            "percentile": None if percentile < 0 else percentile / 10000,
+        }
+
+
+def encode_board(
+    athlete_ids: Sequence[uuid.UUID],
+    ranks: Sequence[Optional[int]],
+    ratings: Sequence[float],
+    match_counts: Sequence[int],
+    percentiles: Sequence[Optional[float]],
+) -> Tuple[bytes, str]:
+    """Encode board rows, in board order; returns the data and its digest."""
+    import numpy as np
+
+    rank_column = np.array([rank or 0 for rank in ranks], dtype="<i4")
+    rating_column = np.rint(np.array(ratings, dtype=np.float64) * 100).astype("<i4")
+    percentile_column = np.array(
+        [-1 if p is None else round(p * 10000) for p in percentiles], dtype="<i4"
+    )
+    payload = b"".join(
+        (
+            _HEADER.pack(ENCODING_VERSION, len(rank_column)),
+            b"".join(athlete_id.bytes for athlete_id in athlete_ids),
+            np.diff(rank_column, prepend=0).astype("<i4").tobytes(),
+            np.diff(rating_column, prepend=0).astype("<i4").tobytes(),
+            np.array(match_counts, dtype="<i4").tobytes(),
+            percentile_column.tobytes(),
+        )
+    )
+    return zlib.compress(payload, 9), hashlib.sha1(payload).hexdigest()
+
+
+def decode_board(
+    data: bytes,
+    generated_at: datetime,
+    generation_id: Optional[uuid.UUID] = None,
+) -> ArchivedBoard:
+    import numpy as np
+
+    payload = zlib.decompress(data)
+    version, n = _HEADER.unpack_from(payload)
+    if version != ENCODING_VERSION:
+        raise ValueError(f"Unknown ranking archive encoding {version}")
+    offset = _HEADER.size
+
+    def column(dtype: str, width: int) -> "np.ndarray":
+        nonlocal offset
+        values = np.frombuffer(payload, dtype=dtype, count=n, offset=offset)
+        offset += n * width
+        return values
+
+    athlete_ids = payload[offset : offset + n * 16]
+    offset += n * 16
+    ranks = np.cumsum(column("<i4", 4))
+    ratings = np.cumsum(column("<i4", 4)) / 100
+    match_counts = column("<i4", 4)
+    percentiles = column("<i4", 4)
+    return ArchivedBoard(
+        generated_at,
+        generation_id,
+        athlete_ids,
+        ranks,
+        ratings,
+        match_counts,
+        percentiles,
+    )
+
+
+def _board_columns():
+    return (
+        RankingArchive.gender,
+        RankingArchive.age,
+        RankingArchive.belt,
+        RankingArchive.gi,
+        RankingArchive.weight,
+    )
+
+
+def _board_filter(key: BoardKey):
+    return and_(*(column == value for column, value in zip(_board_columns(), key)))
+
+
+def _latest_digests(session, gis: Iterable[bool]) -> Dict[BoardKey, str]:
+    latest = (
+        select(*_board_columns(), func.max(RankingArchive.generated_at).label("at"))
+        .where(RankingArchive.gi.in_(list(gis)))
+        .group_by(*_board_columns())
+        .subquery()
+    )
+    rows = session.execute(
+        select(*_board_columns(), RankingArchive.digest).join(
+            latest,
+            and_(
+                *(column == latest.c[column.key] for column in _board_columns()),
+                RankingArchive.generated_at == latest.c.at,
+            ),
+        )
+    )
+    return {tuple(row[:5]): row.digest for row in rows}
+
+
+def archive_boards(
+    session,
+    table: Table,
+    gis: Iterable[bool],
+    generation_id: Optional[uuid.UUID],
+    board_keys: Optional[List[BoardKey]] = None,
+) -> int:
+    """Archive the boards in table that changed since their last archive.
+
+    table is athlete_ratings or its shadow. With board_keys, only those boards
+    are compared. Returns the number of boards archived.
+    """
+    gis = list(gis)
+    key_columns = [table.c[column.key] for column in _board_columns()]
+    query = (
+        select(
+            *key_columns,
+            table.c.athlete_id,
+            table.c.rank,
+            table.c.rating,
+            table.c.match_count,
+            table.c.percentile,
+        )
+        .where(table.c.gi.in_(gis))
+        .order_by(
+            *key_columns,
+            table.c.rank,
+            table.c.match_happened_at.desc(),
+            table.c.athlete_id,
+        )
+    )
+    if board_keys is not None:
+        if not board_keys:
+            return 0
+        query = query.where(tuple_(*key_columns).in_(board_keys))
+
+    latest = _latest_digests(session, gis)
+    if board_keys is not None:
+        latest = {key: latest[key] for key in board_keys if key in latest}
+
+    generated_at = datetime.now()
+    archives = []
+
+    def archive(key: BoardKey, rows: List) -> None:
+        data, digest = encode_board(
+            [row.athlete_id for row in rows],
+            [row.rank for row in rows],
+            [row.rating for row in rows],
+            [row.match_count for row in rows],
+            [row.percentile for row in rows],
+        )
+        if latest.pop(key, None) == digest:
+            return
+        archives.append(
+            {
+                "id": uuid.uuid4(),
+                "gender": key[0],
+                "age": key[1],
+                "belt": key[2],
+                "gi": key[3],
+                "weight": key[4],
+                "generated_at": generated_at,
+                "generation_id": generation_id,
+                "rows": len(rows),
+                "digest": digest,
+                "data": data,
+            }
+        )
+
+    for key, rows in groupby(session.execute(query), key=lambda row: tuple(row[:5])):
+        archive(key, list(rows))
+    # boards that emptied since their last archive
+    empty_digest = encode_board([], [], [], [], [])[1]
+    for key, digest in list(latest.items()):
+        if digest != empty_digest:
+            archive(key, [])
+
+    if archives:
+        session.execute(insert(RankingArchive.__table__), archives)
+    log.info(f"Archived {len(archives)} changed ranking boards")
+    return len(archives)
+
+
+def archive_dates(session, key: BoardKey) -> List[Tuple[datetime, uuid.UUID]]:
+    return [
+        (row.generated_at, row.id)
+        for row in session.execute(
+            select(RankingArchive.generated_at, RankingArchive.id)
+            .where(_board_filter(key))
+            .order_by(RankingArchive.generated_at)
+        )
+    ]
+
+
+def _load(session, archive_id: uuid.UUID) -> ArchivedBoard:
+    archive = session.execute(
+        select(
+            RankingArchive.data,
+            RankingArchive.generated_at,
+            RankingArchive.generation_id,
+        ).where(RankingArchive.id == archive_id)
+    ).one()
+    return decode_board(archive.data, archive.generated_at, archive.generation_id)
+
+
+def load_board_as_of(
+    session, key: BoardKey, as_of: datetime
+) -> Optional[ArchivedBoard]:
+    """The board as last generated before as_of, None before its first archive."""
+    dates = archive_dates(session, key)
+    index = bisect_left([generated_at for generated_at, _ in dates], as_of)
+    if index == 0:
+        return None
+    return _load(session, dates[index - 1][1])
+
+
+def athlete_rank_history(session, athlete_id: uuid.UUID, key: BoardKey) -> List[dict]:
+    """The athlete's rows on every archive of the board where they changed.
+
+    A row with a null rank marks the athlete leaving the board.
+    """
+    history = []
+    previous = None
+    for generated_at, archive_id in archive_dates(session, key):
+        board = _load(session, archive_id)
+        index = board.position(athlete_id)
+        if index is None:
+            row = None if previous is None else {"rank": None}
+        else:
+            row = board.row(index)
+        if row is not None and row != previous:
+            history.append({"date": generated_at.isoformat(), **row})
+        previous = row
+    return history
@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+
+from models import (
+    ManualPromotions,
+    RankingDirtyAthlete,
+    RankingGeneration,
+    RegistrationLinkCompetitor,
+)
+
+log = logging.getLogger("ibjjf")
+
+# Ranking boards are rebuilt from the whole match history. To let
+# current.generate_current_ratings rebuild only what changed, every
+# generation is recorded per gi, and rating writes log the athletes whose
+# matches they changed. An athlete's belt comes from both gi and no-gi
+# matches, so a change is logged for both boards. Each generation gets a new
+# generation_id that readers can use to tell board versions apart.
+
+# above this share of the athletes on the boards, a full rebuild is cheaper
+INCREMENTAL_MAX_TOUCHED_FRACTION = 0.25
+
+
+def digest_rows(digest, session, *columns) -> None:
+    """Add the rows of columns, ordered by the first, to digest.
+
+    Counts and maxima miss rows edited in place, or deleted and replaced, so
+    inputs rating writes do not log are fingerprinted by their contents.
+    """
+    for row in session.execute(select(*columns).order_by(columns[0])):
+        digest.update("\t".join(str(value) for value in row).encode() + b"\n")
+
+
+def digest_promotions(digest, session) -> None:
+    digest_rows(
+        digest,
+        session,
+        ManualPromotions.id,
+        ManualPromotions.athlete_id,
+        ManualPromotions.belt,
+        ManualPromotions.promoted_at,
+    )
+
+
+def ranking_inputs_fingerprint(session, banned: List[str]) -> str:
+    """Digest of the board inputs that rating writes do not log."""
+    digest = hashlib.sha1()
+    for value in sorted(banned):
+        digest.update(f"{value}\n".encode())
+    digest_promotions(digest, session)
+    digest_rows(
+        digest,
+        session,
+        RegistrationLinkCompetitor.id,
+        RegistrationLinkCompetitor.athlete_name,
+        RegistrationLinkCompetitor.division_id,
+    )
+    return digest.hexdigest()
+
+
+def load_generations(session, gis: Iterable[bool]) -> Dict[bool, RankingGeneration]:
+    return {
+        generation.gi: generation
+        for generation in session.execute(
+            select(RankingGeneration).where(RankingGeneration.gi.in_(list(gis)))
+        ).scalars()
+    }
+
+
+def save_generations(
+    session,
+    gis: Iterable[bool],
+    activity_period: datetime,
+    previous_date: datetime,
+    last_match_at: Optional[datetime],
+    fingerprint: str,
+) -> uuid.UUID:
+    gis = list(gis)
+    generation_id = uuid.uuid4()
+    session.execute(delete(RankingGeneration).where(RankingGeneration.gi.in_(gis)))
+    session.execute(
+        insert(RankingGeneration.__table__),
+        [
+            {
+                "gi": gi,
+                "generated_at": datetime.now(),
+                "activity_period": activity_period,
+                "previous_date": previous_date,
+                "last_match_at": last_match_at,
+                "fingerprint": fingerprint,
+                "generation_id": generation_id,
+            }
+            for gi in gis
+        ],
+    )
+    session.execute(delete(RankingDirtyAthlete).where(RankingDirtyAthlete.gi.in_(gis)))
+    return generation_id
+
+
+def ranking_generation_id(session, gi: bool) -> Optional[uuid.UUID]:
+    """Id of the current gi or no-gi boards, None before the first generation."""
+    return session.execute(
+        select(RankingGeneration.generation_id).where(RankingGeneration.gi == gi)
+    ).scalar()
+
+
+def earliest_dirty_at(session, gis: Iterable[bool]) -> Optional[datetime]:
+    return session.execute(
+        select(func.min(RankingDirtyAthlete.happened_at)).where(
+            RankingDirtyAthlete.gi.in_(list(gis))
+        )
+    ).scalar()
+
+
+def clear_ranking_generations(session, gis: Iterable[bool] = (True, False)) -> None:
+    """Forget the last generations, so the next regeneration is a full one."""
+    session.execute(
+        delete(RankingGeneration).where(RankingGeneration.gi.in_(list(gis)))
+    )
+
+
+def log_dirty_athletes(connection, touched: Dict[uuid.UUID, datetime]) -> None:
+    """Log athletes whose matches changed, with the earliest changed match."""
+    if not touched:
+        return
+    connection.execute(
+        insert(RankingDirtyAthlete.__table__),
+        [
+            {
+                "id": uuid.uuid4(),
+                "gi": gi,
+                "athlete_id": athlete_id,
+                "happened_at": happened_at,
+            }
+            for athlete_id, happened_at in touched.items()
+            for gi in (True, False)
+        ],
+    )
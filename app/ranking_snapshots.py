@@ -0,0 +1,73 @@
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, select
+
+from models import RankingDirtyAthlete, RankingSnapshot, RankingSnapshotRow
+from ranking_generations import digest_promotions
+
+log = logging.getLogger("ibjjf")
+
+# The previous ranking columns compare each board with the board as of a
+# Tuesday boundary. That board only depends on ratings before the boundary, so
+# it is built once into ranking_snapshots and reused by every later generation.
+# A rating change logged in ranking_dirty_athletes deletes the snapshots after
+# it; suspensions and manual promotions, which rating writes do not log, are
+# covered by the fingerprint. Registrations do not affect past boards.
+
+
+def snapshot_fingerprint(session, banned: List[str]) -> str:
+    """Digest of the snapshot inputs that rating writes do not log."""
+    digest = hashlib.sha1()
+    for value in sorted(banned):
+        digest.update(f"{value}\n".encode())
+    digest_promotions(digest, session)
+    return digest.hexdigest()
+
+
+def load_snapshots(
+    session, gis: Iterable[bool], snapshot_date: datetime
+) -> Dict[bool, RankingSnapshot]:
+    return {
+        snapshot.gi: snapshot
+        for snapshot in session.execute(
+            select(RankingSnapshot).where(
+                RankingSnapshot.gi.in_(list(gis)),
+                RankingSnapshot.snapshot_date == snapshot_date,
+            )
+        ).scalars()
+    }
+
+
+def delete_snapshots(session, snapshot_ids: List) -> None:
+    if not snapshot_ids:
+        return
+    session.execute(
+        delete(RankingSnapshotRow).where(
+            RankingSnapshotRow.snapshot_id.in_(snapshot_ids)
+        )
+    )
+    session.execute(delete(RankingSnapshot).where(RankingSnapshot.id.in_(snapshot_ids)))
+
+
+def clear_snapshots(session, gi: bool, after: Optional[datetime] = None) -> None:
+    """Delete snapshots that may no longer match the stored ratings."""
+    statement = select(RankingSnapshot.id).where(RankingSnapshot.gi == gi)
+    if after is not None:
+        statement = statement.where(RankingSnapshot.snapshot_date > after)
+    delete_snapshots(session, list(session.execute(statement).scalars()))
+
+
+def invalidate_snapshots(session, gis: Iterable[bool]) -> None:
+    """Delete snapshots after the earliest rating change logged since the last
+    generation, before the generation clears the log."""
+    for gi in gis:
+        earliest = session.execute(
+            select(func.min(RankingDirtyAthlete.happened_at)).where(
+                RankingDirtyAthlete.gi == gi
+            )
+        ).scalar()
+        if earliest is not None:
+            clear_snapshots(session, gi, earliest)
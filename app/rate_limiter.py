@@ -0,0 +1,191 @@
+import logging
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from local_store import LocalStore, get_local_store
+
+log = logging.getLogger("ibjjf")
+
+# Per-client request limits shared by every gunicorn worker on the host, kept
+# in a local store (local_store.py) like the response cache.
+#
+# Each client is one fixed-size row: a sliding-window counter approximates the
+# requests of the last window from the counts of the current and previous
+# fixed windows. A client over its limit is rejected, its limit is halved and
+# it is penalized for the penalty period; every rejection while penalized
+# halves the limit again and extends the penalty. Once the penalty is over,
+# the limit is back to the initial one. Rejected requests are not counted.
+#
+# Clients idle for two windows and without a running penalty are
+# evicted, and the table is bounded by evicting the least recently seen.
+# The limiter must never fail a request: a locked or broken store is logged
+# and the request is let through.
+
+DEFAULT_FILENAME = "ibjjf-rate-limits.sqlite3"
+DEFAULT_LIMIT = 15
+DEFAULT_WINDOW_SECONDS = 10
+DEFAULT_PENALTY_SECONDS = 60
+DEFAULT_MAX_CLIENTS = 100000
+# how often each worker evicts idle clients
+EVICT_INTERVAL_SECONDS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    namespace TEXT NOT NULL,
+    client TEXT NOT NULL,
+    window INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    previous_count INTEGER NOT NULL,
+    rate_limit INTEGER NOT NULL,
+    penalty_end REAL NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (namespace, client)
+);
+CREATE INDEX IF NOT EXISTS ix_clients_seen_at ON clients (seen_at);
+"""
+
+
+class RateLimiter(LocalStore):
+    schema = _SCHEMA
+    # transactions are taken with BEGIN IMMEDIATE
+    isolation_level = None
+
+    def __init__(
+        self,
+        path: str,
+        limit: int = DEFAULT_LIMIT,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        penalty_seconds: float = DEFAULT_PENALTY_SECONDS,
+        max_clients: int = DEFAULT_MAX_CLIENTS,
+    ):
+        super().__init__(path)
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.penalty_seconds = penalty_seconds
+        self.max_clients = max_clients
+        self._evicted_at = 0.0
+
+    def allow(self, namespace: str, client: str) -> bool:
+        """Count a request of client, False when it is over its limit."""
+        now = time.time()
+        window = int(now // self.window_seconds)
+        try:
+            connection = self._connection()
+            # taken before the read, so workers update a client one at a time
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                allowed = self._allow(connection, namespace, client, now, window)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            log.warning(f"Rate limiter unavailable: {e}")
+            return True
+        if now - self._evicted_at > EVICT_INTERVAL_SECONDS:
+            self._evicted_at = now
+            self.evict(now)
+        return allowed
+
+    def _allow(self, connection, namespace, client, now, window) -> bool:
+        row = connection.execute(
+            """
+            SELECT window, count, previous_count, rate_limit, penalty_end
+            FROM clients WHERE namespace = ? AND client = ?
+            """,
+            (namespace, client),
+        ).fetchone()
+        if row is None:
+            row = (window, 0, 0, self.limit, 0.0)
+        row_window, count, previous_count, rate_limit, penalty_end = row
+
+        if now > penalty_end:
+            rate_limit = self.limit
+            penalty_end = 0.0
+        if row_window != window:
+            previous_count = count if row_window == window - 1 else 0
+            count = 0
+
+        # the previous window's requests still inside the sliding window
+        overlap = 1 - (now - window * self.window_seconds) / self.window_seconds
+        allowed = previous_count * overlap + count < rate_limit
+        if allowed:
+            count += 1
+            self._count(connection, namespace, "allowed")
+        else:
+            rate_limit = max(1, rate_limit // 2)
+            if penalty_end == 0.0:
+                log.info(f"Rate limiting {client} on {namespace}")
+                self._count(connection, namespace, "penalized")
+            penalty_end = now + self.penalty_seconds
+            self._count(connection, namespace, "rejected")
+
+        connection.execute(
+            """
+            INSERT OR REPLACE INTO clients (
+                namespace, client, window, count, previous_count, rate_limit,
+                penalty_end, seen_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                namespace,
+                client,
+                window,
+                count,
+                previous_count,
+                rate_limit,
+                penalty_end,
+                now,
+            ),
+        )
+        return allowed
+
+    def evict(self, now: Optional[float] = None) -> None:
+        """Drop idle clients, then the least recently seen over max_clients."""
+        now = time.time() if now is None else now
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # a client idle for two windows counts nothing in the next one
+                connection.execute(
+                    "DELETE FROM clients WHERE seen_at < ? AND penalty_end < ?",
+                    (now - 2 * self.window_seconds, now),
+                )
+                connection.execute(
+                    """
+                    DELETE FROM clients WHERE rowid IN (
+                        SELECT rowid FROM clients ORDER BY seen_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_clients,),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            log.warning(f"Rate limiter eviction failed: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters by namespace, with the clients tracked and penalized now."""
+        stats = self._counters()
+        for namespace, clients, penalized in self._connection().execute(
+            """
+            SELECT namespace, COUNT(*), SUM(penalty_end > ?)
+            FROM clients GROUP BY namespace
+            """,
+            (time.time(),),
+        ):
+            stats.setdefault(namespace, {}).update(
+                clients=clients, penalized_clients=penalized
+            )
+        return stats
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The limiter at RATE_LIMIT_PATH, from the app config or environment."""
+    return get_local_store(RateLimiter, "RATE_LIMIT_PATH", DEFAULT_FILENAME)
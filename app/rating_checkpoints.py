@@ -0,0 +1,175 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+import uuid
+
+from sqlalchemy import delete, func, insert, select
+
+from models import RatingCheckpoint
+from rating_profile import timed
+
+log = logging.getLogger("ibjjf")
+
+# The replay saves each athlete's rating state at Tuesday ranking boundaries,
+# so a --start-date recompute can start from the nearest earlier checkpoint
+# instead of loading the whole partition history. Rows are deltas: an athlete
+# gets a row at a boundary only if their state changed since the previous
+# boundary that was written.
+
+DEFAULT_BATCH_SIZE = 10000
+
+CHECKPOINT_COLUMNS = (
+    "athlete_id",
+    "last_participant_id",
+    "ages",
+    "counted",
+    "weight_participant_id",
+    "default_gold_at",
+    "default_gold_event_id",
+    "default_gold_weight",
+)
+
+
+def checkpoint_boundary(dt: datetime) -> datetime:
+    # the Tuesday ranking boundary at or before dt
+    dt -= timedelta(days=(dt.weekday() - 1) % 7)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def encode_ages(ages) -> str:
+    return json.dumps(sorted(ages))
+
+
+def decode_ages(value: str) -> set:
+    return set(json.loads(value))
+
+
+def encode_times(times) -> str:
+    return json.dumps([t.isoformat() for t in times])
+
+
+def decode_times(value: str) -> List[datetime]:
+    return [datetime.fromisoformat(t) for t in json.loads(value)]
+
+
+def latest_checkpoint_at(
+    session, gi: bool, gender: str, start_date: datetime
+) -> Optional[datetime]:
+    return session.execute(
+        select(func.max(RatingCheckpoint.checkpoint_at)).where(
+            RatingCheckpoint.gi == gi,
+            RatingCheckpoint.gender == gender,
+            RatingCheckpoint.checkpoint_at <= start_date,
+        )
+    ).scalar()
+
+
+def checkpoint_states_query(gi: bool, gender: str, checkpoint_at: datetime):
+    # the latest row per athlete at or before checkpoint_at
+    latest = (
+        select(
+            RatingCheckpoint.athlete_id,
+            func.max(RatingCheckpoint.checkpoint_at).label("checkpoint_at"),
+        )
+        .where(
+            RatingCheckpoint.gi == gi,
+            RatingCheckpoint.gender == gender,
+            RatingCheckpoint.checkpoint_at <= checkpoint_at,
+        )
+        .group_by(RatingCheckpoint.athlete_id)
+        .subquery()
+    )
+    return (
+        select(*(RatingCheckpoint.__table__.c[column] for column in CHECKPOINT_COLUMNS))
+        .join(
+            latest,
+            (RatingCheckpoint.athlete_id == latest.c.athlete_id)
+            & (RatingCheckpoint.checkpoint_at == latest.c.checkpoint_at),
+        )
+        .where(RatingCheckpoint.gi == gi, RatingCheckpoint.gender == gender)
+    )
+
+
+def clear_checkpoints(
+    session,
+    gi: bool,
+    gender: Optional[str] = None,
+    after: Optional[datetime] = None,
+) -> None:
+    """Delete checkpoints that may no longer match the stored ratings."""
+    statement = delete(RatingCheckpoint).where(RatingCheckpoint.gi == gi)
+    if gender is not None:
+        statement = statement.where(RatingCheckpoint.gender == gender)
+    if after is not None:
+        statement = statement.where(RatingCheckpoint.checkpoint_at > after)
+    session.execute(statement)
+
+
+class RatingCheckpoints:
+    """Checkpoint rows produced by replaying one gi/gender partition."""
+
+    def __init__(self):
+        self.gi: Optional[bool] = None
+        self.gender: Optional[str] = None
+        self.resume_at: Optional[datetime] = None
+        self.clear_rows()
+
+    def clear_rows(self) -> None:
+        self.rows: List[Tuple[datetime, tuple]] = []
+
+    def start(self, gi: bool, gender: str, resume_at: Optional[datetime]) -> None:
+        self.gi = gi
+        self.gender = gender
+        self.resume_at = resume_at
+
+    def add(self, checkpoint_at: datetime, row: tuple) -> None:
+        self.rows.append((checkpoint_at, row))
+
+    def row_dicts(self) -> List[dict]:
+        return [
+            dict(
+                zip(CHECKPOINT_COLUMNS, row),
+                id=uuid.uuid4(),
+                gi=self.gi,
+                gender=self.gender,
+                checkpoint_at=checkpoint_at,
+            )
+            for checkpoint_at, row in self.rows
+        ]
+
+
+class CheckpointWriter(RatingCheckpoints):
+    def __init__(self, session, batch_size: int = DEFAULT_BATCH_SIZE):
+        super().__init__()
+        self.session = session
+        self.batch_size = batch_size
+        self.written = 0
+
+    def start(self, gi: bool, gender: str, resume_at: Optional[datetime]) -> None:
+        self.flush()
+        super().start(gi, gender, resume_at)
+        # everything after the resume point is replayed, and rewritten
+        clear_checkpoints(self.session, gi, gender, resume_at)
+
+    def add(self, checkpoint_at: datetime, row: tuple) -> None:
+        super().add(checkpoint_at, row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def add_all(self, checkpoints: RatingCheckpoints) -> None:
+        self.start(checkpoints.gi, checkpoints.gender, checkpoints.resume_at)
+        for checkpoint_at, row in checkpoints.rows:
+            self.add(checkpoint_at, row)
+        self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        with timed("checkpoints"):
+            self.session.connection().execute(
+                insert(RatingCheckpoint.__table__), self.row_dicts()
+            )
+        self.written += len(self.rows)
+        log.debug("Wrote %s rating checkpoints", len(self.rows))
+        self.clear_rows()
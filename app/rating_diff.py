@@ -0,0 +1,197 @@
+import csv
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, TextIO, Tuple
+import uuid
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select
+
+from models import Athlete, Division, Match, MatchParticipant
+from rating_writer import RatingChanges
+from replay import load_suspensions_by_id, partition_genders, replay_partition
+
+log = logging.getLogger("ibjjf")
+
+# A dry run replays into an in-memory RatingChanges buffer instead of a
+# RatingWriter, so nothing is written to the match tables. The new values are
+# then compared with the stored rows in chunks and streamed out as a CSV diff.
+
+DIFF_CHUNK_SIZE = 1000
+
+DIFF_COLUMNS = [
+    "participant_id",
+    "match_id",
+    "happened_at",
+    "athlete_id",
+    "athlete_name",
+    "gi",
+    "gender",
+    "age",
+    "belt",
+    "weight",
+    "old_start_rating",
+    "new_start_rating",
+    "old_end_rating",
+    "new_end_rating",
+    "end_rating_change",
+    "old_rating_note",
+    "new_rating_note",
+]
+
+
+@dataclass
+class RatingDiffSummary:
+    matches_replayed: int = 0
+    participants_changed: int = 0
+    rating_notes_changed: int = 0
+    rated_flags_changed: int = 0
+    end_rating_change_total: float = 0.0
+    end_rating_change_abs_total: float = 0.0
+    end_rating_change_max: float = 0.0
+
+    @property
+    def mean_end_rating_change(self) -> float:
+        if not self.participants_changed:
+            return 0.0
+        return self.end_rating_change_total / self.participants_changed
+
+    @property
+    def mean_abs_end_rating_change(self) -> float:
+        if not self.participants_changed:
+            return 0.0
+        return self.end_rating_change_abs_total / self.participants_changed
+
+    def to_dict(self) -> dict:
+        return {
+            "matches_replayed": self.matches_replayed,
+            "participants_changed": self.participants_changed,
+            "rating_notes_changed": self.rating_notes_changed,
+            "rated_flags_changed": self.rated_flags_changed,
+            "mean_end_rating_change": self.mean_end_rating_change,
+            "mean_abs_end_rating_change": self.mean_abs_end_rating_change,
+            "max_abs_end_rating_change": self.end_rating_change_max,
+        }
+
+
+def dry_run_ratings(
+    db: SQLAlchemy,
+    gis: List[bool],
+    gender: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    athlete_id: Optional[str] = None,
+    teens: bool = False,
+    use_checkpoints: bool = True,
+) -> Tuple[int, RatingChanges]:
+    """Replay like recompute_all_ratings without writing anything.
+
+    Returns the number of matches replayed and the RatingChanges buffer.
+    Checkpoints are read when resuming, but not rewritten.
+    """
+    scope_athlete_id = uuid.UUID(athlete_id) if athlete_id is not None else None
+    suspensions_by_id = load_suspensions_by_id(db.session)
+    changes = RatingChanges()
+    total = 0
+    for gi in gis:
+        for partition_gender in partition_genders(db.session, gi, gender):
+            total += replay_partition(
+                db.session,
+                gi,
+                partition_gender,
+                suspensions_by_id,
+                changes,
+                start_date=start_date,
+                athlete_id=scope_athlete_id,
+                teens=teens,
+                use_checkpoints=use_checkpoints,
+            )
+    return total, changes
+
+
+def write_rating_diff(
+    session, changes: RatingChanges, out: Optional[TextIO] = None
+) -> RatingDiffSummary:
+    """Compare buffered ratings with the stored rows.
+
+    Participants whose start rating, end rating or rating note would change
+    are written to out as CSV, if given.
+    """
+    summary = RatingDiffSummary(rated_flags_changed=len(changes.match_ids))
+    writer = None
+    if out is not None:
+        writer = csv.writer(out)
+        writer.writerow(DIFF_COLUMNS)
+
+    rows = changes.participants()
+    while True:
+        chunk = [row for _, row in zip(range(DIFF_CHUNK_SIZE), rows)]
+        if not chunk:
+            break
+        stored = {
+            row.id: row
+            for row in session.execute(
+                select(
+                    MatchParticipant.id,
+                    MatchParticipant.match_id,
+                    MatchParticipant.athlete_id,
+                    MatchParticipant.start_rating,
+                    MatchParticipant.end_rating,
+                    MatchParticipant.rating_note,
+                    Athlete.name,
+                    Match.happened_at,
+                    Division.gi,
+                    Division.gender,
+                    Division.age,
+                    Division.belt,
+                    Division.weight,
+                )
+                .join(Athlete, MatchParticipant.athlete_id == Athlete.id)
+                .join(Match, MatchParticipant.match_id == Match.id)
+                .join(Division, Match.division_id == Division.id)
+                .where(MatchParticipant.id.in_([row[0] for row in chunk]))
+            )
+        }
+        for participant_id, start_rating, end_rating, _, rating_note, _, _ in chunk:
+            old = stored[participant_id]
+            if (
+                old.start_rating == start_rating
+                and old.end_rating == end_rating
+                and old.rating_note == rating_note
+            ):
+                continue
+
+            change = end_rating - old.end_rating
+            summary.participants_changed += 1
+            summary.end_rating_change_total += change
+            summary.end_rating_change_abs_total += abs(change)
+            summary.end_rating_change_max = max(
+                summary.end_rating_change_max, abs(change)
+            )
+            if old.rating_note != rating_note:
+                summary.rating_notes_changed += 1
+
+            if writer is not None:
+                writer.writerow(
+                    [
+                        participant_id,
+                        old.match_id,
+                        old.happened_at.isoformat(),
+                        old.athlete_id,
+                        old.name,
+                        old.gi,
+                        old.gender,
+                        old.age,
+                        old.belt,
+                        old.weight,
+                        old.start_rating,
+                        start_rating,
+                        old.end_rating,
+                        end_rating,
+                        change,
+                        old.rating_note,
+                        rating_note,
+                    ]
+                )
+
+    return summary
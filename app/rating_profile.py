@@ -0,0 +1,217 @@
+import logging
+import re
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.engine import Engine
+
+from statement_timing import add_statement_observer, remove_statement_observer
+
+log = logging.getLogger("ibjjf")
+
+# Optional instrumentation for the rating pipeline. profile_pipeline() makes a
+# PipelineProfile active for the duration of a block; the timed() sections and
+# count() calls in ratings, elo, replay, rating_writer and current are no-ops
+# otherwise, so normal recomputes only pay a global lookup per call. While a
+# profile is active every SQL statement on the engine is timed and attributed
+# to the innermost timed section. Statements run by replay worker processes
+# are not seen.
+
+# histogram bucket upper bounds, in milliseconds
+HISTOGRAM_BOUNDS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# placeholder lists of expanded IN clauses and executemany VALUES differ in
+# length between calls of the same statement
+_PLACEHOLDER_LIST = re.compile(
+    r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))+\s*\)"
+)
+_WHITESPACE = re.compile(r"\s+")
+
+_active: Optional["PipelineProfile"] = None
+
+
+def normalize_statement(statement: str) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return _PLACEHOLDER_LIST.sub("(...)", statement)
+
+
+@dataclass(slots=True)
+class Histogram:
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    buckets: List[int] = field(
+        default_factory=lambda: [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    )
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        milliseconds = seconds * 1000
+        for index, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if milliseconds <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def to_dict(self) -> dict:
+        labels = [f"{bound}ms" for bound in HISTOGRAM_BOUNDS_MS] + ["inf"]
+        return {
+            "count": self.count,
+            "seconds": self.seconds,
+            "mean_seconds": self.seconds / self.count if self.count else None,
+            "max_seconds": self.max_seconds,
+            "histogram": dict(zip(labels, self.buckets)),
+        }
+
+
+@dataclass
+class PipelineProfile:
+    seconds: float = 0.0
+    counters: Dict[str, int] = field(default_factory=dict)
+    phases: Dict[str, Histogram] = field(default_factory=dict)
+    # (phase, normalized statement) -> timings
+    statements: Dict[Tuple[str, str], Histogram] = field(default_factory=dict)
+    stack: List[str] = field(default_factory=list)
+
+    @property
+    def current_phase(self) -> str:
+        return self.stack[-1] if self.stack else ""
+
+    @property
+    def queries(self) -> int:
+        return sum(timings.count for timings in self.statements.values())
+
+    @contextmanager
+    def phase(self, name: str):
+        # nested sections are reported by path, e.g. score/history
+        path = f"{self.stack[-1]}/{name}" if self.stack else name
+        self.stack.append(path)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stack.pop()
+            timings = self.phases.get(path)
+            if timings is None:
+                timings = self.phases[path] = Histogram()
+            timings.add(seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, conn, cursor, statement, parameters, executemany, seconds):
+        key = (self.current_phase, normalize_statement(statement))
+        timings = self.statements.get(key)
+        if timings is None:
+            timings = self.statements[key] = Histogram()
+        timings.add(seconds)
+
+    def to_dict(self) -> dict:
+        matches = self.counters.get("matches", 0)
+        queries = self.queries
+        phase_queries: Dict[str, int] = {}
+        for (phase, _), timings in self.statements.items():
+            phase_queries[phase] = phase_queries.get(phase, 0) + timings.count
+
+        phases = {}
+        for name, timings in sorted(self.phases.items()):
+            row = timings.to_dict()
+            row["queries"] = phase_queries.get(name, 0)
+            phases[name] = row
+
+        statements = []
+        for (phase, statement), timings in sorted(
+            self.statements.items(), key=lambda item: -item[1].seconds
+        ):
+            row = timings.to_dict()
+            row["phase"] = phase
+            row["statement"] = statement
+            statements.append(row)
+
+        return {
+            "seconds": self.seconds,
+            "matches": matches,
+            "matches_per_second": matches / self.seconds if self.seconds else None,
+            "queries": queries,
+            "queries_per_match": queries / matches if matches else None,
+            "counters": dict(self.counters),
+            "phases": phases,
+            "statements": statements,
+        }
+
+    def log_summary(self, statements: int = 5) -> None:
+        report = self.to_dict()
+        log.info(
+            f"Profiled {report['matches']} matches and {report['queries']} "
+            f"queries in {report['seconds']:.2f}s"
+        )
+        for name, row in report["phases"].items():
+            log.info(
+                f"  {name}: {row['seconds']:.2f}s over {row['count']} calls, "
+                f"{row['queries']} queries"
+            )
+        for row in report["statements"][:statements]:
+            log.info(
+                f"  {row['seconds']:.2f}s over {row['count']} executions in "
+                f"{row['phase'] or '-'}: {row['statement'][:120]}"
+            )
+
+
+@contextmanager
+def profile_pipeline(engine: Engine) -> Iterator[PipelineProfile]:
+    """Collect a PipelineProfile of everything run inside the block."""
+    global _active
+    previous = _active
+    profile = _active = PipelineProfile()
+
+    def observe(conn, cursor, statement, parameters, executemany, seconds):
+        if conn.engine is engine:
+            profile.observe(conn, cursor, statement, parameters, executemany, seconds)
+
+    add_statement_observer(observe)
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.seconds += time.perf_counter() - start
+        remove_statement_observer(observe)
+        _active = previous
+
+
+def timed(name: str):
+    """Time a section under the active profile, if there is one."""
+    profile = _active
+    if profile is None:
+        return nullcontext()
+    return profile.phase(name)
+
+
+def timed_iter(name: str, iterable: Iterable) -> Iterator:
+    """Yield from iterable, timing each step under the active profile.
+
+    Used for ORM result iteration, where loading happens lazily in next().
+    """
+    profile = _active
+    if profile is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with profile.phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def count(name: str, n: int = 1) -> None:
+    profile = _active
+    if profile is not None:
+        profile.count(name, n)
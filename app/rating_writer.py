@@ -0,0 +1,285 @@
+import logging
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import uuid
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    bindparam,
+    insert,
+    or_,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import UUID
+
+from models import Match, MatchParticipant
+from ranking_generations import log_dirty_athletes
+from rating_profile import timed
+
+log = logging.getLogger("ibjjf")
+
+# Recomputed ratings are collected here and written back in large batches,
+# instead of flushing every changed MatchParticipant through the ORM.
+# SQLite gets one executemany UPDATE per batch. Postgres stages each batch in
+# a temp table and applies it with a single UPDATE ... FROM.
+
+DEFAULT_BATCH_SIZE = 10000
+
+_staging = MetaData()
+
+participant_rating_updates = Table(
+    "temp_participant_rating_updates",
+    _staging,
+    Column("id", UUID(as_uuid=True), primary_key=True),
+    Column("start_rating", Float),
+    Column("end_rating", Float),
+    Column("weight_for_open", String),
+    Column("rating_note", Text),
+    Column("start_match_count", Integer),
+    Column("end_match_count", Integer),
+    prefixes=["TEMPORARY"],
+)
+
+match_rated_updates = Table(
+    "temp_match_rated_updates",
+    _staging,
+    Column("id", UUID(as_uuid=True), primary_key=True),
+    Column("rated", Boolean),
+    prefixes=["TEMPORARY"],
+)
+
+PARTICIPANT_RATING_COLUMNS = (
+    "start_rating",
+    "end_rating",
+    "weight_for_open",
+    "rating_note",
+    "start_match_count",
+    "end_match_count",
+)
+PARTICIPANT_BINDS = tuple(f"b_{column}" for column in PARTICIPANT_RATING_COLUMNS)
+
+
+def staged_update(staging: Table, table: Table, columns):
+    return (
+        update(table)
+        .where(
+            table.c.id == staging.c.id,
+            or_(
+                *(
+                    table.c[column].is_distinct_from(staging.c[column])
+                    for column in columns
+                )
+            ),
+        )
+        .values({column: staging.c[column] for column in columns})
+    )
+
+
+class RatingChanges:
+    """Compact buffers of changed participant ratings and match rated flags."""
+
+    def __init__(self):
+        self.clear_participants()
+        self.clear_matches()
+        self.clear_touched()
+
+    def clear_participants(self) -> None:
+        self.participant_ids: List[uuid.UUID] = []
+        self.ratings = array("d")  # start, end pairs
+        self.match_counts = array("q")  # start, end pairs
+        self.weights_for_open: List[Optional[str]] = []
+        self.rating_notes: List[Optional[str]] = []
+
+    def clear_matches(self) -> None:
+        self.match_ids: List[uuid.UUID] = []
+        self.rated = bytearray()
+
+    def clear_touched(self) -> None:
+        # athlete -> earliest changed match, for incremental board regeneration
+        self.touched: Dict[uuid.UUID, datetime] = {}
+
+    def participant(
+        self,
+        participant_id: uuid.UUID,
+        start_rating: float,
+        end_rating: float,
+        weight_for_open: Optional[str],
+        rating_note: Optional[str],
+        start_match_count: int,
+        end_match_count: int,
+    ) -> None:
+        self.participant_ids.append(participant_id)
+        self.ratings.append(start_rating)
+        self.ratings.append(end_rating)
+        self.weights_for_open.append(weight_for_open)
+        self.rating_notes.append(rating_note)
+        self.match_counts.append(start_match_count)
+        self.match_counts.append(end_match_count)
+
+    def match(self, match_id: uuid.UUID, rated: bool) -> None:
+        self.match_ids.append(match_id)
+        self.rated.append(rated)
+
+    def touch(self, athlete_id: uuid.UUID, happened_at: datetime) -> None:
+        earliest = self.touched.get(athlete_id)
+        if earliest is None or happened_at < earliest:
+            self.touched[athlete_id] = happened_at
+
+    def participants(self) -> Iterator[tuple]:
+        for i, participant_id in enumerate(self.participant_ids):
+            yield (
+                participant_id,
+                self.ratings[2 * i],
+                self.ratings[2 * i + 1],
+                self.weights_for_open[i],
+                self.rating_notes[i],
+                self.match_counts[2 * i],
+                self.match_counts[2 * i + 1],
+            )
+
+    def matches(self) -> Iterator[tuple]:
+        for i, match_id in enumerate(self.match_ids):
+            yield match_id, bool(self.rated[i])
+
+    def participant_rows(self) -> List[dict]:
+        return [
+            dict(zip(("b_id",) + PARTICIPANT_BINDS, row)) for row in self.participants()
+        ]
+
+    def match_rows(self) -> List[dict]:
+        return [
+            {"b_id": match_id, "b_rated": rated} for match_id, rated in self.matches()
+        ]
+
+
+class RatingWriter(RatingChanges):
+    def __init__(self, session, batch_size: int = DEFAULT_BATCH_SIZE):
+        super().__init__()
+        self.session = session
+        self.batch_size = batch_size
+        self.postgres = session.get_bind().dialect.name == "postgresql"
+        self.staged = False
+
+        self.participants_changed = 0
+        self.matches_changed = 0
+
+    def participant(self, *args) -> None:
+        super().participant(*args)
+        if len(self.participant_ids) >= self.batch_size:
+            self.flush_participants()
+
+    def match(self, match_id: uuid.UUID, rated: bool) -> None:
+        super().match(match_id, rated)
+        if len(self.match_ids) >= self.batch_size:
+            self.flush_matches()
+
+    def add(self, changes: RatingChanges) -> None:
+        for row in changes.participants():
+            self.participant(*row)
+        for row in changes.matches():
+            self.match(*row)
+        for athlete_id, happened_at in changes.touched.items():
+            self.touch(athlete_id, happened_at)
+
+    def flush(self) -> None:
+        self.flush_participants()
+        self.flush_matches()
+        self.flush_touched()
+
+    def flush_participants(self) -> None:
+        if not self.participant_ids:
+            return
+        rows = self.participant_rows()
+        with timed("write"):
+            if self.postgres:
+                changed = self.update_from_staging(
+                    participant_rating_updates,
+                    MatchParticipant.__table__,
+                    PARTICIPANT_RATING_COLUMNS,
+                    rows,
+                )
+            else:
+                changed = self.update_many(
+                    MatchParticipant.__table__, PARTICIPANT_RATING_COLUMNS, rows
+                )
+        self.participants_changed += changed
+        log.debug("Wrote %s participant ratings, %s changed", len(rows), changed)
+
+        self.clear_participants()
+
+    def flush_matches(self) -> None:
+        if not self.match_ids:
+            return
+        rows = self.match_rows()
+        with timed("write"):
+            if self.postgres:
+                changed = self.update_from_staging(
+                    match_rated_updates, Match.__table__, ("rated",), rows
+                )
+            else:
+                changed = self.update_many(Match.__table__, ("rated",), rows)
+        self.matches_changed += changed
+        log.debug("Wrote %s match rated flags, %s changed", len(rows), changed)
+
+        self.clear_matches()
+
+    def flush_touched(self) -> None:
+        if not self.touched:
+            return
+        log_dirty_athletes(self.session.connection(), self.touched)
+        self.clear_touched()
+
+    def update_many(self, table: Table, columns, rows: List[dict]) -> int:
+        # the IS NOT guard makes rowcount the number of rows that really changed
+        statement = (
+            update(table)
+            .where(
+                table.c.id == bindparam("b_id"),
+                or_(
+                    *(
+                        table.c[column].is_distinct_from(bindparam(f"b_{column}"))
+                        for column in columns
+                    )
+                ),
+            )
+            .values({column: bindparam(f"b_{column}") for column in columns})
+        )
+        result = self.session.connection().execute(statement, rows)
+        return result.rowcount
+
+    def update_from_staging(
+        self, staging: Table, table: Table, columns, rows: List[dict]
+    ) -> int:
+        connection = self.session.connection()
+        if not self.staged:
+            participant_rating_updates.create(connection, checkfirst=True)
+            match_rated_updates.create(connection, checkfirst=True)
+            self.staged = True
+
+        connection.execute(
+            insert(staging),
+            [
+                {column: row[f"b_{column}"] for column in ("id",) + tuple(columns)}
+                for row in rows
+            ],
+        )
+        result = connection.execute(staged_update(staging, table, columns))
+        connection.execute(text(f"TRUNCATE {staging.name}"))
+        return result.rowcount
+
+    def close(self) -> None:
+        self.flush()
+        if self.staged:
+            connection = self.session.connection()
+            match_rated_updates.drop(connection, checkfirst=True)
+            participant_rating_updates.drop(connection, checkfirst=True)
+            self.staged = False
@@ -1,14 +1,28 @@
 import logging
-from typing import Optional
+from typing import Iterable, List, Optional
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import uuid
+from sqlalchemy import func
 
-from progress_bar import Bar
-from models import Match, Division, Suspension, Athlete, MatchParticipant, Medal
+from progress_bar import MATCH_RATE_SUFFIX, Bar
+from models import Match, Division, MatchParticipant
 from elo import compute_ratings
+from replay import (
+    AffectedMatches,
+    is_final_match,
+    load_medal_places,
+    load_suspensions_by_id,
+    replay_affected,
+    replay_ratings,
+    replay_ratings_in_parallel,
+)
+from rating_checkpoints import CheckpointWriter, clear_checkpoints
+from ranking_generations import clear_ranking_generations
+from ranking_snapshots import clear_snapshots
+from rating_writer import RatingWriter
 from current import generate_current_ratings
-from normalize import normalize
+from rating_profile import count, timed, timed_iter
 from constants import TEEN_1, TEEN_2, TEEN_3
 
 log = logging.getLogger("ibjjf")
@@ -26,8 +40,28 @@ def recompute_all_ratings(
     rank_previous_date: Optional[datetime] = None,
     athlete_id: Optional[str] = None,
     teens: bool = False,
+    replay: bool = True,
+    use_checkpoints: bool = True,
+    incremental_rank: bool = False,
 ) -> None:
-    if score:
+    if score and replay:
+        replay_ratings(
+            db,
+            gi,
+            gender=gender,
+            start_date=start_date,
+            athlete_id=athlete_id,
+            teens=teens,
+            use_checkpoints=use_checkpoints,
+        )
+    elif score:
+        # this path does not maintain rating checkpoints or log changed
+        # athletes for the ranking boards, so drop what it is about to
+        # invalidate
+        clear_checkpoints(db.session, gi, gender, start_date)
+        clear_ranking_generations(db.session)
+        clear_snapshots(db.session, gi, start_date)
+
         query = db.session.query(Match).join(Division).filter(Division.gi == gi)
 
         if gender is not None:
@@ -48,25 +82,22 @@ def recompute_all_ratings(
 
         total = query.count()
 
-        suspensions = db.session.query(Suspension)
-        suspensions_by_id = {}
-        for suspension in suspensions:
-            athlete = (
-                db.session.query(Athlete)
-                .filter(Athlete.normalized_name == normalize(suspension.athlete_name))
-                .first()
-            )
-            if athlete is not None:
-                suspensions_by_id[athlete.id] = suspension
+        # resolved up front so the loop only does dictionary lookups
+        suspensions_by_id = load_suspensions_by_id(db.session)
+        medal_places = load_medal_places(db.session, gi, gender, start_date)
 
         with Bar(
             f'Recomputing athlete {"gi" if gi else "no-gi"} ratings',
             max=total,
+            suffix=MATCH_RATE_SUFFIX,
             check_tty=False,
             no_tty=True,
         ) as bar:
-            for match in query.order_by(Match.happened_at, Match.id).yield_per(100):
+            for match in timed_iter(
+                "load", query.order_by(Match.happened_at, Match.id).yield_per(100)
+            ):
                 bar.next()
+                count("matches")
 
                 if len(match.participants) != 2:
                     log.info(
@@ -76,35 +107,14 @@ def recompute_all_ratings(
 
                 red, blue = match.participants
 
-                red_medal = (
-                    db.session.query(Medal)
-                    .filter(
-                        Medal.athlete_id == red.athlete_id,
-                        Medal.event_id == match.event_id,
-                        Medal.division_id == match.division_id,
-                    )
-                    .first()
-                )
-
-                blue_medal = (
-                    db.session.query(Medal)
-                    .filter(
-                        Medal.athlete_id == blue.athlete_id,
-                        Medal.event_id == match.event_id,
-                        Medal.division_id == match.division_id,
-                    )
-                    .first()
+                is_final = is_final_match(
+                    medal_places,
+                    match.event_id,
+                    match.division_id,
+                    red.athlete_id,
+                    blue.athlete_id,
                 )
 
-                is_final = False
-                if red_medal is not None and blue_medal is not None:
-                    is_final = (
-                        red_medal.place == 1
-                        and blue_medal.place == 2
-                        or blue_medal.place == 1
-                        and red_medal.place == 2
-                    )
-
                 (
                     rated,
                     red_start_rating,
@@ -183,7 +193,8 @@ def recompute_all_ratings(
                     changed = True
 
                 if changed:
-                    db.session.flush()
+                    with timed("flush"):
+                        db.session.flush()
 
     if not teens and rerank and (rerankgi or reranknogi):
         if rerankgi and reranknogi:
@@ -193,4 +204,109 @@ def recompute_all_ratings(
         else:
             desc = "no-gi"
         log.info(f"Regenerating {desc} ranking board...")
-        generate_current_ratings(db, rerankgi, reranknogi, rank_previous_date)
+        with timed("rank"):
+            generate_current_ratings(
+                db,
+                rerankgi,
+                reranknogi,
+                rank_previous_date,
+                incremental=incremental_rank,
+            )
+
+
+def recompute_ratings_in_parallel(
+    db: SQLAlchemy,
+    gis: List[bool],
+    jobs: int,
+    gender: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    rerank: bool = True,
+    rank_previous_date: Optional[datetime] = None,
+    athlete_id: Optional[str] = None,
+    teens: bool = False,
+    use_checkpoints: bool = True,
+    incremental_rank: bool = False,
+) -> None:
+    replay_ratings_in_parallel(
+        db,
+        gis,
+        jobs,
+        gender=gender,
+        start_date=start_date,
+        athlete_id=athlete_id,
+        teens=teens,
+        use_checkpoints=use_checkpoints,
+    )
+
+    if not teens and rerank:
+        rerankgi = True in gis
+        reranknogi = False in gis
+        desc = "/".join(["gi"] * rerankgi + ["no-gi"] * reranknogi)
+        log.info(f"Regenerating {desc} ranking board...")
+        with timed("rank"):
+            generate_current_ratings(
+                db,
+                rerankgi,
+                reranknogi,
+                rank_previous_date,
+                incremental=incremental_rank,
+            )
+
+
+def rescore_after_match_change(
+    db: SQLAlchemy,
+    gi: bool,
+    gender: str,
+    happened_at: datetime,
+    event_id: uuid.UUID,
+    athlete_ids: Iterable[uuid.UUID],
+    use_checkpoints: bool = True,
+) -> AffectedMatches:
+    """Rescore what a created, edited or deleted match affects.
+
+    athlete_ids are the participants of the match. Ranking boards are not
+    regenerated.
+    """
+    # get_weight lets later matches at an event change earlier ones, so start
+    # from the first match of the event
+    event_start = (
+        db.session.query(func.min(Match.happened_at))
+        .join(Division)
+        .filter(
+            Division.gi == gi,
+            Division.gender == gender,
+            Match.event_id == event_id,
+        )
+        .scalar()
+    )
+    start_date = min(filter(None, (event_start, happened_at)))
+
+    athlete_ids = [uuid.UUID(str(athlete_id)) for athlete_id in athlete_ids]
+
+    writer = RatingWriter(db.session)
+    # the match's own athletes need their board rows regenerated even when
+    # none of their rescored rows change, as when their last match is deleted
+    for athlete_id in athlete_ids:
+        writer.touch(athlete_id, happened_at)
+    checkpoints = CheckpointWriter(db.session)
+    affected = replay_affected(
+        db.session,
+        gi,
+        gender,
+        load_suspensions_by_id(db.session),
+        writer,
+        checkpoints,
+        start_date,
+        athlete_ids,
+        use_checkpoints=use_checkpoints,
+    )
+    checkpoints.flush()
+    writer.close()
+
+    log.info(
+        f"Rescored {affected.matches} affected matches of "
+        f"{len(affected.athletes)} athletes, updated "
+        f"{writer.participants_changed} participants and "
+        f"{writer.matches_changed} matches"
+    )
+    return affected
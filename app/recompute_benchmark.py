@@ -0,0 +1,229 @@
+import logging
+import platform
+import sqlite3
+import subprocess
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy.engine import Engine
+
+from current import generate_current_ratings
+from models import Division, Match, MatchParticipant
+from rating_profile import profile_pipeline
+from ratings import recompute_all_ratings, rescore_after_match_change
+from replay import AffectedMatches, replay_ratings_in_parallel
+from synthetic import SyntheticConfig, generate_synthetic_history
+
+log = logging.getLogger("ibjjf")
+
+# Times the rating pipeline phase by phase on a synthetic history, so recompute
+# throughput can be compared across commits without production data. Every
+# phase commits before the clock stops, so write costs are included, and runs
+# under a rating_profile.PipelineProfile so the report also breaks each phase
+# down by section and SQL statement.
+
+REPORT_VERSION = 1
+
+
+@dataclass
+class BenchmarkPhase:
+    name: str
+    seconds: float
+    matches: Optional[int] = None
+    queries: int = 0
+    profile: Optional[dict] = None
+    # for rank_incremental, False when the boards had to be fully rebuilt
+    incremental: Optional[bool] = None
+
+    def to_dict(self) -> dict:
+        row = asdict(self)
+        if self.matches:
+            row["matches_per_second"] = self.matches / self.seconds
+            row["queries_per_match"] = self.queries / self.matches
+        return row
+
+
+@dataclass
+class BenchmarkTimer:
+    engine: Engine
+    phases: List[BenchmarkPhase] = field(default_factory=list)
+
+    @contextmanager
+    def phase(self, name: str, matches: Optional[int] = None):
+        with profile_pipeline(self.engine) as profile:
+            start = time.perf_counter()
+            yield
+            seconds = time.perf_counter() - start
+        phase = BenchmarkPhase(
+            name, seconds, matches, profile.queries, profile.to_dict()
+        )
+        self.phases.append(phase)
+        log.info(
+            f"Benchmark phase {name} took {phase.seconds:.2f}s, "
+            f"{phase.queries} queries"
+        )
+
+
+def count_matches(
+    session, gi: Optional[bool] = None, start_date: Optional[datetime] = None
+) -> int:
+    query = session.query(func.count(Match.id)).join(Division)
+    if gi is not None:
+        query = query.filter(Division.gi == gi)
+    if start_date is not None:
+        query = query.filter(Match.happened_at >= start_date)
+    return query.scalar()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flip_winner(session, happened_before: datetime) -> Optional[Match]:
+    """Swap the winner of the last decided gi match before happened_before."""
+    winner = (
+        session.query(MatchParticipant)
+        .join(Match)
+        .join(Division)
+        .filter(
+            Division.gi == True,
+            Match.happened_at < happened_before,
+            MatchParticipant.winner == True,
+        )
+        .order_by(Match.happened_at.desc(), Match.id.desc())
+        .first()
+    )
+    if winner is None:
+        return None
+    for participant in winner.match.participants:
+        participant.winner = participant.id != winner.id
+    session.flush()
+    return winner.match
+
+
+def rescore_flipped(db: SQLAlchemy, match: Match) -> AffectedMatches:
+    return rescore_after_match_change(
+        db,
+        match.division.gi,
+        match.division.gender,
+        match.happened_at,
+        match.event_id,
+        [participant.athlete_id for participant in match.participants],
+    )
+
+
+def run_recompute_benchmark(
+    db: SQLAlchemy,
+    config: Optional[SyntheticConfig] = None,
+    generate: bool = True,
+    jobs: int = 1,
+    per_match: bool = False,
+) -> dict:
+    """Generate a synthetic history and time each rating phase on it.
+
+    With generate=False the history already in the database is used.
+    per_match also times the per-match query path, which is slow at scale.
+    """
+    config = config or SyntheticConfig()
+    timer = BenchmarkTimer(db.engine)
+    dataset = None
+
+    if generate:
+        with timer.phase("generate", config.matches):
+            dataset = generate_synthetic_history(db.session, config).to_dict()
+            db.session.commit()
+
+    counts = {gi: count_matches(db.session, gi) for gi in (True, False)}
+    for gi in (True, False):
+        with timer.phase(f"score_{'gi' if gi else 'nogi'}", counts[gi]):
+            recompute_all_ratings(db, gi, rerank=False)
+            db.session.commit()
+
+    with timer.phase("rank"):
+        recompute_all_ratings(db, True, score=False)
+        db.session.commit()
+
+    # the same regeneration, with the previous-ranking snapshot now stored
+    with timer.phase("rerank"):
+        recompute_all_ratings(db, True, score=False)
+        db.session.commit()
+
+    last_match_at = (
+        db.session.query(func.max(Match.happened_at))
+        .join(Division)
+        .filter(Division.gi == True)
+        .scalar()
+    )
+    if last_match_at is not None:
+        # the usual operator recompute: the last year, resumed from a checkpoint
+        start_date = last_match_at - timedelta(days=365)
+        with timer.phase(
+            "score_gi_last_year", count_matches(db.session, True, start_date)
+        ):
+            recompute_all_ratings(db, True, start_date=start_date, rerank=False)
+            db.session.commit()
+
+        # a result correction at the latest event, then the ranking boards.
+        # The rescore above may have logged changes a year back, so start
+        # from a current generation, leaving only the correction to rebuild.
+        generate_current_ratings(db, True, True, None)
+        db.session.commit()
+        match = flip_winner(db.session, last_match_at + timedelta(seconds=1))
+        if match is not None:
+            rescore_flipped(db, match)
+            db.session.commit()
+            with timer.phase("rank_incremental"):
+                regeneration = generate_current_ratings(
+                    db, True, True, None, incremental=True
+                )
+                db.session.commit()
+            timer.phases[-1].incremental = regeneration.incremental
+            if not regeneration.incremental:
+                log.warning("Benchmark phase rank_incremental fell back to full")
+
+        match = flip_winner(db.session, start_date)
+        if match is not None:
+            with timer.phase("rescore_match"):
+                affected = rescore_flipped(db, match)
+                db.session.commit()
+            timer.phases[-1].matches = affected.matches
+
+    if jobs > 1:
+        with timer.phase("score_parallel", sum(counts.values())):
+            replay_ratings_in_parallel(db, [True, False], jobs)
+            db.session.commit()
+
+    if per_match:
+        with timer.phase("score_gi_per_match", counts[True]):
+            recompute_all_ratings(db, True, rerank=False, replay=False)
+            db.session.commit()
+
+    return {
+        "version": REPORT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "database": db.session.get_bind().dialect.name,
+        "config": {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in asdict(config).items()
+        },
+        "dataset": dataset,
+        "matches": sum(counts.values()),
+        "jobs": jobs,
+        "phases": [phase.to_dict() for phase in timer.phases],
+    }
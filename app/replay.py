@@ -0,0 +1,1042 @@
+import json
+import logging
+import multiprocessing
+import uuid
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+from dateutil.relativedelta import relativedelta
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, or_, select
+from sqlalchemy.orm import Session
+
+from progress_bar import MATCH_RATE_SUFFIX, Bar
+from models import (
+    Athlete,
+    Division,
+    JSONEncoder,
+    Match,
+    MatchParticipant,
+    Medal,
+    Suspension,
+)
+from elo import AthleteHistory, is_open_class, rate_match
+from rating_profile import count, timed
+from rating_writer import RatingChanges, RatingWriter
+from rating_checkpoints import (
+    CheckpointWriter,
+    RatingCheckpoints,
+    checkpoint_boundary,
+    checkpoint_states_query,
+    decode_ages,
+    decode_times,
+    encode_ages,
+    encode_times,
+    latest_checkpoint_at,
+)
+from normalize import normalize
+from constants import (
+    OPEN_CLASS,
+    TEEN_1,
+    TEEN_2,
+    TEEN_3,
+    rated_ages,
+    same_or_higher_progression_ages,
+)
+
+log = logging.getLogger("ibjjf")
+
+# Replaying the match history in memory gives the same numbers as calling
+# elo.compute_ratings for every match, without the per-match history queries.
+# Every gi/gender partition is loaded once in (happened_at, id) order and the
+# rows are mirrored in memory exactly as the per-match path would see them in
+# the session: earlier matches carry their recomputed values, later matches
+# still carry the stored ones.
+
+TEEN_AGES = (TEEN_1, TEEN_2, TEEN_3)
+
+# (event_id, division_id) -> {athlete_id: place}
+MedalPlaces = Dict[Tuple[uuid.UUID, uuid.UUID], Dict[uuid.UUID, int]]
+
+
+@dataclass(slots=True)
+class ReplayDivision:
+    id: uuid.UUID
+    gi: bool
+    gender: str
+    age: str
+    belt: str
+    weight: str
+
+
+@dataclass(slots=True)
+class ReplayMatch:
+    id: uuid.UUID
+    happened_at: datetime
+    event_id: uuid.UUID
+    division: ReplayDivision
+    rated: bool
+    rated_winner_only: Optional[bool]
+    participants: List["ReplayParticipant"] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ReplayParticipant:
+    id: uuid.UUID
+    match: ReplayMatch
+    athlete_id: uuid.UUID
+    team_id: uuid.UUID
+    winner: bool
+    note: Optional[str]
+    rating_note: Optional[str]
+    start_rating: float
+    end_rating: float
+    weight_for_open: Optional[str]
+    start_match_count: int
+    end_match_count: int
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "id": self.id,
+                "match_id": self.match.id,
+                "athlete_id": self.athlete_id,
+                "team_id": self.team_id,
+                "winner": self.winner,
+                "note": self.note,
+                "start_rating": self.start_rating,
+                "end_rating": self.end_rating,
+                "weight_for_open": self.weight_for_open,
+            },
+            cls=JSONEncoder,
+        )
+
+
+@dataclass(slots=True)
+class DefaultGold:
+    happened_at: datetime
+    event_id: uuid.UUID
+    weight: str
+
+
+@dataclass(slots=True)
+class AthleteState:
+    # most recent participation of any kind, as get_last_matches sees it
+    last: Optional[ReplayParticipant] = None
+    # every age division the athlete has competed in so far
+    ages: set = field(default_factory=set)
+    # happened_at of every participation get_match_count would count
+    counted: Deque[datetime] = field(default_factory=deque)
+    # all non-open participations in the partition, in replay order, for get_weight
+    non_open: List[ReplayParticipant] = field(default_factory=list)
+    non_open_times: List[datetime] = field(default_factory=list)
+    non_open_by_event: Dict[uuid.UUID, List[ReplayParticipant]] = field(
+        default_factory=dict
+    )
+    default_golds: List[DefaultGold] = field(default_factory=list)
+
+
+def _qualifies_for_weight(participant: ReplayParticipant) -> bool:
+    return participant.match.rated or participant.winner
+
+
+def _counts_toward_match_count(participant: ReplayParticipant) -> bool:
+    match = participant.match
+    # mirrors "rated_winner_only == False OR winner" in SQL, where NULL is false
+    return match.rated and (
+        (match.rated_winner_only is not None and not match.rated_winner_only)
+        or participant.winner
+    )
+
+
+class RatingReplay:
+    def __init__(
+        self,
+        session: Session,
+        gi: bool,
+        gender: str,
+        suspensions_by_id: Dict[uuid.UUID, Suspension],
+        writer: RatingChanges,
+        resume_at: Optional[datetime] = None,
+    ):
+        self.session = session
+        self.gi = gi
+        self.gender = gender
+        self.suspensions_by_id = suspensions_by_id
+        self.matches: List[ReplayMatch] = []
+        self.athletes: Dict[uuid.UUID, AthleteState] = {}
+        self.medal_places: MedalPlaces = {}
+        self.higher_ages = {
+            age: frozenset(same_or_higher_progression_ages(age)) for age in rated_ages
+        }
+        self.writer = writer
+        # matches before resume_at come from the checkpoint, not from the tables
+        self.resume_at = resume_at
+        self.checkpointed_at = resume_at
+        self.dirty: set = set()
+        self.new_golds: Deque[Tuple[datetime, uuid.UUID]] = deque()
+
+    def athlete(self, athlete_id: uuid.UUID) -> AthleteState:
+        state = self.athletes.get(athlete_id)
+        if state is None:
+            state = self.athletes[athlete_id] = AthleteState()
+        return state
+
+    def load(self) -> None:
+        session = self.session
+        partition = (Division.gi == self.gi, Division.gender == self.gender)
+
+        divisions = {
+            row.id: ReplayDivision(
+                row.id, row.gi, row.gender, row.age, row.belt, row.weight
+            )
+            for row in session.execute(
+                select(
+                    Division.id,
+                    Division.gi,
+                    Division.gender,
+                    Division.age,
+                    Division.belt,
+                    Division.weight,
+                ).where(*partition)
+            )
+        }
+
+        if self.resume_at is not None and not self.load_checkpoint(divisions):
+            log.warning(
+                f"Rating checkpoint at {self.resume_at} refers to missing matches, "
+                "replaying the full history"
+            )
+            self.athletes.clear()
+            self.resume_at = self.checkpointed_at = None
+
+        if self.resume_at is None:
+            self.matches = self.load_matches(divisions)
+            medal_criteria = ()
+        else:
+            later_events = (
+                select(Match.event_id)
+                .join(Division)
+                .where(*partition, Match.happened_at >= self.resume_at)
+            )
+            # get_weight also looks at the whole event, so earlier matches of
+            # events that continue after the checkpoint are still needed
+            for match in self.load_matches(
+                divisions,
+                Match.happened_at < self.resume_at,
+                Match.event_id.in_(later_events),
+            ):
+                if match.division.weight.startswith(OPEN_CLASS):
+                    continue
+                for participant in match.participants:
+                    self.athlete(participant.athlete_id).non_open_by_event.setdefault(
+                        match.event_id, []
+                    ).append(participant)
+            self.matches = self.load_matches(
+                divisions, Match.happened_at >= self.resume_at
+            )
+            medal_criteria = (
+                or_(
+                    Medal.happened_at >= self.resume_at,
+                    Medal.event_id.in_(later_events),
+                ),
+            )
+
+        for match in self.matches:
+            if match.division.weight.startswith(OPEN_CLASS):
+                continue
+            for participant in match.participants:
+                state = self.athlete(participant.athlete_id)
+                state.non_open.append(participant)
+                state.non_open_times.append(match.happened_at)
+                state.non_open_by_event.setdefault(match.event_id, []).append(
+                    participant
+                )
+
+        for row in session.execute(
+            select(
+                Medal.event_id,
+                Medal.division_id,
+                Medal.athlete_id,
+                Medal.place,
+                Medal.default_gold,
+                Medal.happened_at,
+            )
+            .join(Division)
+            .where(*partition, *medal_criteria)
+            .order_by(Medal.happened_at)
+        ):
+            self.medal_places.setdefault((row.event_id, row.division_id), {})[
+                row.athlete_id
+            ] = row.place
+            weight = divisions[row.division_id].weight
+            if row.default_gold and not weight.startswith(OPEN_CLASS):
+                self.athlete(row.athlete_id).default_golds.append(
+                    DefaultGold(row.happened_at, row.event_id, weight)
+                )
+                if self.resume_at is None or row.happened_at >= self.resume_at:
+                    self.new_golds.append((row.happened_at, row.athlete_id))
+
+    def load_matches(
+        self, divisions: Dict[uuid.UUID, ReplayDivision], *criteria
+    ) -> List[ReplayMatch]:
+        session = self.session
+        partition = (Division.gi == self.gi, Division.gender == self.gender)
+
+        matches = []
+        matches_by_id = {}
+        for row in session.execute(
+            select(
+                Match.id,
+                Match.happened_at,
+                Match.event_id,
+                Match.division_id,
+                Match.rated,
+                Match.rated_winner_only,
+            )
+            .join(Division)
+            .where(*partition, *criteria)
+            .order_by(Match.happened_at, Match.id)
+        ):
+            match = ReplayMatch(
+                row.id,
+                row.happened_at,
+                row.event_id,
+                divisions[row.division_id],
+                row.rated,
+                row.rated_winner_only,
+            )
+            matches.append(match)
+            matches_by_id[match.id] = match
+
+        for row in session.execute(
+            select(
+                MatchParticipant.id,
+                MatchParticipant.match_id,
+                MatchParticipant.athlete_id,
+                MatchParticipant.team_id,
+                MatchParticipant.winner,
+                MatchParticipant.note,
+                MatchParticipant.rating_note,
+                MatchParticipant.start_rating,
+                MatchParticipant.end_rating,
+                MatchParticipant.weight_for_open,
+                MatchParticipant.start_match_count,
+                MatchParticipant.end_match_count,
+            )
+            .join(Match)
+            .join(Division)
+            .where(*partition, *criteria)
+            .order_by(MatchParticipant.match_id, MatchParticipant.red.desc())
+        ):
+            match = matches_by_id[row.match_id]
+            match.participants.append(
+                ReplayParticipant(
+                    row.id,
+                    match,
+                    row.athlete_id,
+                    row.team_id,
+                    row.winner,
+                    row.note,
+                    row.rating_note,
+                    row.start_rating,
+                    row.end_rating,
+                    row.weight_for_open,
+                    row.start_match_count,
+                    row.end_match_count,
+                )
+            )
+
+        return matches
+
+    def load_checkpoint(self, divisions: Dict[uuid.UUID, ReplayDivision]) -> bool:
+        states = checkpoint_states_query(
+            self.gi, self.gender, self.resume_at
+        ).subquery()
+        referenced = select(MatchParticipant.match_id).where(
+            or_(
+                MatchParticipant.id.in_(select(states.c.last_participant_id)),
+                MatchParticipant.id.in_(select(states.c.weight_participant_id)),
+            )
+        )
+        participants = {
+            participant.id: participant
+            for match in self.load_matches(divisions, Match.id.in_(referenced))
+            for participant in match.participants
+        }
+
+        for row in self.session.execute(select(states)):
+            state = self.athlete(row.athlete_id)
+            for participant_id in (row.last_participant_id, row.weight_participant_id):
+                if participant_id is not None and participant_id not in participants:
+                    return False
+            if row.last_participant_id is not None:
+                state.last = participants[row.last_participant_id]
+            state.ages = decode_ages(row.ages)
+            state.counted.extend(decode_times(row.counted))
+            if row.weight_participant_id is not None:
+                participant = participants[row.weight_participant_id]
+                state.non_open.append(participant)
+                state.non_open_times.append(participant.match.happened_at)
+            if row.default_gold_at is not None:
+                state.default_golds.append(
+                    DefaultGold(
+                        row.default_gold_at,
+                        row.default_gold_event_id,
+                        row.default_gold_weight,
+                    )
+                )
+        return True
+
+    def last_non_open(
+        self, state: AthleteState, happened_at: datetime
+    ) -> Optional[ReplayParticipant]:
+        for index in range(bisect_left(state.non_open_times, happened_at) - 1, -1, -1):
+            if _qualifies_for_weight(state.non_open[index]):
+                return state.non_open[index]
+        return None
+
+    def last_default_gold(
+        self,
+        state: AthleteState,
+        happened_at: datetime,
+        event_id: Optional[uuid.UUID] = None,
+    ) -> Optional[DefaultGold]:
+        last_default_gold = None
+        for gold in state.default_golds:
+            if gold.happened_at < happened_at or gold.event_id == event_id:
+                if (
+                    last_default_gold is None
+                    or gold.happened_at >= last_default_gold.happened_at
+                ):
+                    last_default_gold = gold
+        return last_default_gold
+
+    def last_weight(
+        self, state: AthleteState, happened_at: datetime, event_id: uuid.UUID
+    ) -> Optional[str]:
+        # same rules as elo.get_weight: the latest qualifying non-open match that
+        # happened earlier or at the same event, or a later default gold
+        last_match = self.last_non_open(state, happened_at)
+        for participant in reversed(state.non_open_by_event.get(event_id, ())):
+            if _qualifies_for_weight(participant):
+                if last_match is None or (
+                    participant.match.happened_at,
+                    participant.match.id,
+                ) > (last_match.match.happened_at, last_match.match.id):
+                    last_match = participant
+                break
+
+        last_default_gold = self.last_default_gold(state, happened_at, event_id)
+
+        if last_default_gold is not None and (
+            last_match is None
+            or last_default_gold.happened_at > last_match.match.happened_at
+        ):
+            return last_default_gold.weight
+        if last_match is not None:
+            return last_match.match.division.weight
+        return None
+
+    def history(
+        self, match: ReplayMatch, participant: ReplayParticipant
+    ) -> AthleteHistory:
+        state = self.athlete(participant.athlete_id)
+        division = match.division
+        history = AthleteHistory()
+
+        if is_open_class(division):
+            history.weight = self.last_weight(state, match.happened_at, match.event_id)
+
+        if division.age not in rated_ages:
+            return history
+
+        history.last_match = state.last
+        if state.last is not None:
+            history.has_same_or_higher_age_match = (
+                state.last.match.division.age == division.age
+                or not self.higher_ages[division.age].isdisjoint(state.ages)
+            )
+
+        three_years_prior = match.happened_at - relativedelta(years=3)
+        counted = state.counted
+        while counted and counted[0] <= three_years_prior:
+            counted.popleft()
+        history.match_count = len(counted)
+
+        return history
+
+    def record(self, match: ReplayMatch) -> None:
+        for participant in match.participants:
+            self.dirty.add(participant.athlete_id)
+            state = self.athlete(participant.athlete_id)
+            state.last = participant
+            state.ages.add(match.division.age)
+            if _counts_toward_match_count(participant):
+                state.counted.append(match.happened_at)
+
+    def checkpoint(self, boundary: datetime, checkpoints: RatingCheckpoints) -> None:
+        # called before the first match at or after boundary
+        golds = self.new_golds
+        while golds and golds[0][0] < boundary:
+            self.dirty.add(golds.popleft()[1])
+
+        three_years_prior = boundary - relativedelta(years=3)
+        for athlete_id in self.dirty:
+            state = self.athletes[athlete_id]
+            counted = state.counted
+            while counted and counted[0] <= three_years_prior:
+                counted.popleft()
+            weight_participant = self.last_non_open(state, boundary)
+            gold = self.last_default_gold(state, boundary)
+            checkpoints.add(
+                boundary,
+                (
+                    athlete_id,
+                    state.last.id if state.last is not None else None,
+                    encode_ages(state.ages),
+                    encode_times(counted),
+                    weight_participant.id if weight_participant is not None else None,
+                    gold.happened_at if gold is not None else None,
+                    gold.event_id if gold is not None else None,
+                    gold.weight if gold is not None else None,
+                ),
+            )
+        self.dirty.clear()
+        self.checkpointed_at = boundary
+
+    def is_final(
+        self, match: ReplayMatch, red: ReplayParticipant, blue: ReplayParticipant
+    ) -> bool:
+        return is_final_match(
+            self.medal_places,
+            match.event_id,
+            match.division.id,
+            red.athlete_id,
+            blue.athlete_id,
+        )
+
+    def rescore(
+        self, match: ReplayMatch, athlete_id: Optional[uuid.UUID] = None
+    ) -> List[ReplayParticipant]:
+        """Rescore a two-participant match, returning the participants that changed."""
+        red, blue = match.participants
+
+        (
+            rated,
+            red_start_rating,
+            red_end_rating,
+            blue_start_rating,
+            blue_end_rating,
+            red_weight_for_open,
+            blue_weight_for_open,
+            red_rating_note,
+            blue_rating_note,
+            red_start_match_count,
+            red_end_match_count,
+            blue_start_match_count,
+            blue_end_match_count,
+        ) = rate_match(
+            match.division,
+            match.happened_at,
+            match.rated_winner_only,
+            red.athlete_id,
+            red.winner,
+            red.note,
+            red.team_id,
+            self.history(match, red),
+            blue.athlete_id,
+            blue.winner,
+            blue.note,
+            blue.team_id,
+            self.history(match, blue),
+            self.suspensions_by_id,
+            self.is_final(match, red, blue),
+        )
+
+        changed = []
+        if athlete_id is None or athlete_id == red.athlete_id:
+            if self.update_participant(
+                red,
+                red_start_rating,
+                red_end_rating,
+                red_weight_for_open,
+                red_rating_note,
+                red_start_match_count,
+                red_end_match_count,
+            ):
+                changed.append(red)
+        if athlete_id is None or athlete_id == blue.athlete_id:
+            if self.update_participant(
+                blue,
+                blue_start_rating,
+                blue_end_rating,
+                blue_weight_for_open,
+                blue_rating_note,
+                blue_start_match_count,
+                blue_end_match_count,
+            ):
+                changed.append(blue)
+        rated_changed = match.rated != rated
+        if rated_changed:
+            match.rated = rated
+            self.writer.match(match.id, rated)
+
+        # their ranking board rows need regenerating
+        for participant in match.participants if rated_changed else changed:
+            self.writer.touch(participant.athlete_id, match.happened_at)
+
+        return changed
+
+    def update_participant(
+        self,
+        participant: ReplayParticipant,
+        start_rating: float,
+        end_rating: float,
+        weight_for_open: Optional[str],
+        rating_note: Optional[str],
+        start_match_count: int,
+        end_match_count: int,
+    ) -> bool:
+        if (
+            participant.start_rating == start_rating
+            and participant.end_rating == end_rating
+            and participant.weight_for_open == weight_for_open
+            and participant.rating_note == rating_note
+            and participant.start_match_count == start_match_count
+            and participant.end_match_count == end_match_count
+        ):
+            return False
+
+        participant.start_rating = start_rating
+        participant.end_rating = end_rating
+        participant.weight_for_open = weight_for_open
+        participant.rating_note = rating_note
+        participant.start_match_count = start_match_count
+        participant.end_match_count = end_match_count
+        self.writer.participant(
+            participant.id,
+            start_rating,
+            end_rating,
+            weight_for_open,
+            rating_note,
+            start_match_count,
+            end_match_count,
+        )
+        return True
+
+
+def is_final_match(
+    medal_places: MedalPlaces,
+    event_id: uuid.UUID,
+    division_id: uuid.UUID,
+    red_athlete_id: uuid.UUID,
+    blue_athlete_id: uuid.UUID,
+) -> bool:
+    places = medal_places.get((event_id, division_id))
+    if not places:
+        return False
+    red_place = places.get(red_athlete_id)
+    blue_place = places.get(blue_athlete_id)
+    if red_place is None or blue_place is None:
+        return False
+    return (red_place, blue_place) in ((1, 2), (2, 1))
+
+
+def load_medal_places(
+    session: Session,
+    gi: bool,
+    gender: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+) -> MedalPlaces:
+    criteria = [Division.gi == gi]
+    if gender is not None:
+        criteria.append(Division.gender == gender)
+    if start_date is not None:
+        criteria.append(
+            Medal.event_id.in_(
+                select(Match.event_id)
+                .join(Division)
+                .where(*criteria, Match.happened_at >= start_date)
+            )
+        )
+
+    medal_places = {}
+    for row in session.execute(
+        select(Medal.event_id, Medal.division_id, Medal.athlete_id, Medal.place)
+        .join(Division)
+        .where(*criteria)
+    ):
+        medal_places.setdefault((row.event_id, row.division_id), {})[
+            row.athlete_id
+        ] = row.place
+    return medal_places
+
+
+def load_suspensions_by_id(session: Session) -> Dict[uuid.UUID, Suspension]:
+    suspensions = session.query(Suspension).all()
+    names = {normalize(suspension.athlete_name) for suspension in suspensions}
+    athlete_ids = {}
+    if names:
+        for athlete_id, normalized_name in (
+            session.query(Athlete.id, Athlete.normalized_name)
+            .filter(Athlete.normalized_name.in_(names))
+            .order_by(Athlete.normalized_name)
+        ):
+            athlete_ids.setdefault(normalized_name, athlete_id)
+
+    suspensions_by_id = {}
+    for suspension in suspensions:
+        athlete_id = athlete_ids.get(normalize(suspension.athlete_name))
+        if athlete_id is not None:
+            suspensions_by_id[athlete_id] = suspension
+    return suspensions_by_id
+
+
+def in_scope(
+    match: ReplayMatch,
+    start_date: Optional[datetime],
+    athlete_id: Optional[uuid.UUID],
+    teens: bool,
+) -> bool:
+    if start_date is not None and match.happened_at < start_date:
+        return False
+    if teens and match.division.age not in TEEN_AGES:
+        return False
+    if athlete_id is not None and not any(
+        participant.athlete_id == athlete_id for participant in match.participants
+    ):
+        return False
+    return True
+
+
+def partition_genders(session: Session, gi: bool, gender: Optional[str]) -> List[str]:
+    if gender is not None:
+        return [gender]
+    return sorted(
+        g
+        for (g,) in session.query(Division.gender).filter(Division.gi == gi).distinct()
+    )
+
+
+def start_replay(
+    session: Session,
+    gi: bool,
+    gender: str,
+    suspensions_by_id: Dict[uuid.UUID, Suspension],
+    changes: RatingChanges,
+    checkpoints: Optional[RatingCheckpoints],
+    start_date: Optional[datetime],
+    use_checkpoints: bool,
+) -> RatingReplay:
+    resume_at = None
+    if use_checkpoints and start_date is not None:
+        resume_at = latest_checkpoint_at(session, gi, gender, start_date)
+
+    replay = RatingReplay(session, gi, gender, suspensions_by_id, changes, resume_at)
+    with timed("load"):
+        replay.load()
+    if replay.resume_at is not None:
+        log.info(
+            f"Resuming {'gi' if gi else 'no-gi'} {gender} replay from the "
+            f"{replay.resume_at:%Y-%m-%d} checkpoint"
+        )
+    if checkpoints is not None:
+        checkpoints.start(gi, gender, replay.resume_at)
+    return replay
+
+
+def checkpoint_before(
+    replay: RatingReplay,
+    match: ReplayMatch,
+    checkpoints: Optional[RatingCheckpoints],
+) -> None:
+    if checkpoints is None:
+        return
+    boundary = checkpoint_boundary(match.happened_at)
+    if replay.checkpointed_at is None or boundary > replay.checkpointed_at:
+        replay.checkpoint(boundary, checkpoints)
+
+
+def replay_partition(
+    session: Session,
+    gi: bool,
+    gender: str,
+    suspensions_by_id: Dict[uuid.UUID, Suspension],
+    changes: RatingChanges,
+    checkpoints: Optional[RatingCheckpoints] = None,
+    start_date: Optional[datetime] = None,
+    athlete_id: Optional[uuid.UUID] = None,
+    teens: bool = False,
+    use_checkpoints: bool = True,
+    bar: Optional[Bar] = None,
+) -> int:
+    replay = start_replay(
+        session,
+        gi,
+        gender,
+        suspensions_by_id,
+        changes,
+        checkpoints,
+        start_date,
+        use_checkpoints,
+    )
+
+    total = 0
+    with timed("replay"):
+        for match in replay.matches:
+            checkpoint_before(replay, match, checkpoints)
+            if in_scope(match, start_date, athlete_id, teens):
+                total += 1
+                if bar is not None:
+                    bar.next()
+                if len(match.participants) != 2:
+                    log.info(
+                        f"Match {match.id} has {len(match.participants)} participants, skipping"
+                    )
+                else:
+                    replay.rescore(match, athlete_id)
+            replay.record(match)
+    count("matches", total)
+
+    return total
+
+
+@dataclass(slots=True)
+class AffectedMatches:
+    # matches rescored, and the athletes that had at least one of them
+    matches: int = 0
+    athletes: set = field(default_factory=set)
+
+
+def replay_affected(
+    session: Session,
+    gi: bool,
+    gender: str,
+    suspensions_by_id: Dict[uuid.UUID, Suspension],
+    changes: RatingChanges,
+    checkpoints: Optional[RatingCheckpoints],
+    start_date: datetime,
+    athlete_ids,
+    use_checkpoints: bool = True,
+) -> AffectedMatches:
+    """Rescore only the matches an edit at start_date can change.
+
+    Assumes the stored ratings were consistent before the edit. The edited
+    athletes' history changed, so all their later matches are rescored. Any
+    other athlete is followed only while their rescored rows keep changing;
+    once a row comes out the same, the rest of their history is unchanged too.
+    """
+    replay = start_replay(
+        session,
+        gi,
+        gender,
+        suspensions_by_id,
+        changes,
+        checkpoints,
+        start_date,
+        use_checkpoints,
+    )
+
+    # athletes whose history changed, e.g. a winner or rated flag, and athletes
+    # whose last rescored row changed
+    changed_history = set(athlete_ids)
+    changed_ratings = set()
+    affected = AffectedMatches()
+    with timed("replay"):
+        for match in replay.matches:
+            checkpoint_before(replay, match, checkpoints)
+            if (
+                match.happened_at >= start_date
+                and len(match.participants) == 2
+                and any(
+                    participant.athlete_id in changed_history
+                    or participant.athlete_id in changed_ratings
+                    for participant in match.participants
+                )
+            ):
+                affected.matches += 1
+                rated = match.rated
+                changed = {participant.id for participant in replay.rescore(match)}
+                for participant in match.participants:
+                    affected.athletes.add(participant.athlete_id)
+                    if match.rated != rated:
+                        changed_history.add(participant.athlete_id)
+                    elif participant.id in changed:
+                        changed_ratings.add(participant.athlete_id)
+                    else:
+                        changed_ratings.discard(participant.athlete_id)
+            replay.record(match)
+    count("matches", affected.matches)
+
+    return affected
+
+
+def replay_ratings(
+    db: SQLAlchemy,
+    gi: bool,
+    gender: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    athlete_id: Optional[str] = None,
+    teens: bool = False,
+    use_checkpoints: bool = True,
+) -> int:
+    """Rescore matches like recompute_all_ratings.
+
+    Returns the number of match participant rows whose stored values changed.
+    """
+    scope_athlete_id = uuid.UUID(athlete_id) if athlete_id is not None else None
+    suspensions_by_id = load_suspensions_by_id(db.session)
+
+    query = db.session.query(Match).join(Division).filter(Division.gi == gi)
+    if gender is not None:
+        query = query.filter(Division.gender == gender)
+    if start_date is not None:
+        query = query.filter(Match.happened_at >= start_date)
+    if teens:
+        query = query.filter(Division.age.in_(TEEN_AGES))
+    if scope_athlete_id is not None:
+        subquery = (
+            db.session.query(Match.id)
+            .join(MatchParticipant)
+            .filter(MatchParticipant.athlete_id == scope_athlete_id)
+            .subquery()
+        )
+        query = query.filter(Match.id.in_(subquery.select()))
+    total = query.count()
+
+    writer = RatingWriter(db.session)
+    checkpoints = CheckpointWriter(db.session)
+    with Bar(
+        f'Recomputing athlete {"gi" if gi else "no-gi"} ratings',
+        max=total,
+        suffix=MATCH_RATE_SUFFIX,
+        check_tty=False,
+        no_tty=True,
+    ) as bar:
+        for partition_gender in partition_genders(db.session, gi, gender):
+            replay_partition(
+                db.session,
+                gi,
+                partition_gender,
+                suspensions_by_id,
+                writer,
+                checkpoints,
+                start_date=start_date,
+                athlete_id=scope_athlete_id,
+                teens=teens,
+                use_checkpoints=use_checkpoints,
+                bar=bar,
+            )
+            writer.flush()
+            checkpoints.flush()
+    writer.close()
+
+    log.info(
+        f"Replayed {total} matches, updated {writer.participants_changed} "
+        f"participants and {writer.matches_changed} matches"
+    )
+
+    return writer.participants_changed
+
+
+def _replay_partition_worker(
+    database_url: str,
+    gi: bool,
+    gender: str,
+    start_date: Optional[datetime],
+    athlete_id: Optional[uuid.UUID],
+    teens: bool,
+    use_checkpoints: bool,
+) -> Tuple[int, RatingChanges, RatingCheckpoints]:
+    # runs in a pool process, so it opens its own connection and only reads;
+    # the parent writes the returned changes in its own transaction
+    engine = create_engine(database_url)
+    try:
+        with Session(engine) as session:
+            changes = RatingChanges()
+            checkpoints = RatingCheckpoints()
+            total = replay_partition(
+                session,
+                gi,
+                gender,
+                load_suspensions_by_id(session),
+                changes,
+                checkpoints,
+                start_date=start_date,
+                athlete_id=athlete_id,
+                teens=teens,
+                use_checkpoints=use_checkpoints,
+            )
+    finally:
+        engine.dispose()
+    return total, changes, checkpoints
+
+
+def replay_ratings_in_parallel(
+    db: SQLAlchemy,
+    gis: List[bool],
+    jobs: int,
+    gender: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    athlete_id: Optional[str] = None,
+    teens: bool = False,
+    use_checkpoints: bool = True,
+) -> int:
+    """Replay every gi/gender partition in its own process.
+
+    Workers read committed data through their own connections, so anything
+    pending in the caller's session is not seen. Returns the number of match
+    participant rows whose stored values changed.
+    """
+    scope_athlete_id = uuid.UUID(athlete_id) if athlete_id is not None else None
+    partitions = [
+        (gi, partition_gender)
+        for gi in gis
+        for partition_gender in partition_genders(db.session, gi, gender)
+    ]
+    database_url = db.engine.url.render_as_string(hide_password=False)
+
+    writer = RatingWriter(db.session)
+    checkpoint_writer = CheckpointWriter(db.session)
+    total = 0
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(jobs, len(partitions))),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        futures = {
+            pool.submit(
+                _replay_partition_worker,
+                database_url,
+                gi,
+                partition_gender,
+                start_date,
+                scope_athlete_id,
+                teens,
+                use_checkpoints,
+            ): (gi, partition_gender)
+            for gi, partition_gender in partitions
+        }
+        for future in as_completed(futures):
+            gi, partition_gender = futures[future]
+            partition_total, changes, checkpoints = future.result()
+            total += partition_total
+            writer.add(changes)
+            writer.flush()
+            checkpoint_writer.add_all(checkpoints)
+            log.info(
+                f"Replayed {partition_total} {'gi' if gi else 'no-gi'} "
+                f"{partition_gender} matches"
+            )
+    writer.close()
+
+    log.info(
+        f"Replayed {total} matches in {len(partitions)} partitions, updated "
+        f"{writer.participants_changed} participants and "
+        f"{writer.matches_changed} matches"
+    )
+
+    return writer.participants_changed
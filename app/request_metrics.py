@@ -0,0 +1,293 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, current_app, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+from local_store import LocalStore, get_local_store
+from rate_limiter import get_rate_limiter
+from rating_profile import normalize_statement
+from response_cache import get_response_cache
+from statement_timing import add_statement_observer
+
+log = logging.getLogger("ibjjf")
+
+# Per-request instrumentation of the web app. A statement observer
+# (statement_timing.py) counts the SQL statements each request runs, their
+# time and the rows they return, and the JSON provider times serialization.
+# Every response gets a Server-Timing header with the request's numbers, and a
+# request running more statements than REQUEST_STATEMENT_LOG_THRESHOLD logs
+# its most repeated statements, which is how N+1 patterns show up.
+#
+# Totals by endpoint are kept in a local store (local_store.py) like the
+# response cache, so /metrics reports every gunicorn worker on the host.
+# Workers buffer them in memory and write at most every
+# FLUSH_INTERVAL_SECONDS. Rows are the count the driver reports for statements
+# returning rows: psycopg2 reports it, SQLite does not.
+
+DEFAULT_FILENAME = "ibjjf-request-metrics.sqlite3"
+DEFAULT_STATEMENT_LOG_THRESHOLD = 50
+FLUSH_INTERVAL_SECONDS = 1
+# request duration histogram bucket upper bounds, in seconds
+DURATION_BOUNDS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# logged statements for a request over the threshold
+LOGGED_STATEMENTS = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS endpoint_totals (
+    endpoint TEXT NOT NULL,
+    method TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (endpoint, method, name)
+);
+"""
+
+# (endpoint, method, name) -> value
+Totals = Dict[Tuple[str, str, str], float]
+
+
+@dataclass(slots=True)
+class RequestTimings:
+    started: float
+    statements: int = 0
+    db_seconds: float = 0.0
+    rows: int = 0
+    serialization_seconds: float = 0.0
+    # kept for the statement log
+    statement_texts: List[str] = field(default_factory=list)
+
+
+def _current_timings() -> Optional[RequestTimings]:
+    if not has_request_context():
+        return None
+    return g.get("request_timings")
+
+
+def _observe_statement(conn, cursor, statement, parameters, executemany, seconds):
+    timings = _current_timings()
+    if timings is None:
+        return
+    timings.db_seconds += seconds
+    timings.statements += 1
+    timings.statement_texts.append(statement)
+    if cursor.description is not None and cursor.rowcount > 0:
+        timings.rows += cursor.rowcount
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            timings = _current_timings()
+            if timings is not None:
+                timings.serialization_seconds += time.perf_counter() - start
+
+
+class MetricsStore(LocalStore):
+    schema = _SCHEMA
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._lock = threading.Lock()
+        self._pending: Totals = {}
+        self._flushed_at = 0.0
+
+    def record(self, endpoint: str, method: str, seconds: float, timings) -> None:
+        values = {
+            "requests": 1,
+            "seconds": seconds,
+            "statements": timings.statements,
+            "db_seconds": timings.db_seconds,
+            "rows": timings.rows,
+            "serialization_seconds": timings.serialization_seconds,
+        }
+        bucket = next(
+            (str(bound) for bound in DURATION_BOUNDS_SECONDS if seconds <= bound),
+            "+Inf",
+        )
+        values[f"bucket_{bucket}"] = 1
+        with self._lock:
+            for name, value in values.items():
+                key = (endpoint, method, name)
+                self._pending[key] = self._pending.get(key, 0) + value
+            due = time.monotonic() - self._flushed_at >= FLUSH_INTERVAL_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            connection = self._connection()
+            with connection:
+                connection.executemany(
+                    """
+                    INSERT INTO endpoint_totals (endpoint, method, name, value)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (endpoint, method, name)
+                    DO UPDATE SET value = value + excluded.value
+                    """,
+                    [(*key, value) for key, value in pending.items()],
+                )
+        except sqlite3.Error as e:
+            log.warning(f"Request metrics write failed: {e}")
+
+    def totals(self) -> Totals:
+        self.flush()
+        return {
+            (endpoint, method, name): value
+            for endpoint, method, name, value in self._connection().execute(
+                "SELECT endpoint, method, name, value FROM endpoint_totals"
+            )
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending = {}
+        with self._connection() as connection:
+            connection.execute("DELETE FROM endpoint_totals")
+
+
+def get_metrics_store() -> MetricsStore:
+    """The store at METRICS_PATH, from the app config or environment."""
+    return get_local_store(MetricsStore, "METRICS_PATH", DEFAULT_FILENAME)
+
+
+def _statement_log_threshold() -> int:
+    threshold = current_app.config.get("REQUEST_STATEMENT_LOG_THRESHOLD")
+    if threshold is None:
+        threshold = os.getenv(
+            "REQUEST_STATEMENT_LOG_THRESHOLD", DEFAULT_STATEMENT_LOG_THRESHOLD
+        )
+    return int(threshold)
+
+
+def _start_request() -> None:
+    g.request_timings = RequestTimings(started=time.perf_counter())
+
+
+def _finish_request(response):
+    timings = g.pop("request_timings", None)
+    if timings is None:
+        return response
+    seconds = time.perf_counter() - timings.started
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+
+    response.headers.add(
+        "Server-Timing",
+        f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.statements} '
+        f'statements, {timings.rows} rows"',
+    )
+    response.headers.add(
+        "Server-Timing", f"serialize;dur={timings.serialization_seconds * 1000:.1f}"
+    )
+    response.headers.add("Server-Timing", f"total;dur={seconds * 1000:.1f}")
+
+    if timings.statements > _statement_log_threshold():
+        repeated = Counter(
+            normalize_statement(statement) for statement in timings.statement_texts
+        )
+        log.warning(
+            f"{request.method} {request.full_path}: {timings.statements} SQL "
+            f"statements in {seconds * 1000:.0f}ms"
+        )
+        for statement, count in repeated.most_common(LOGGED_STATEMENTS):
+            log.warning(f"  {count}x {statement[:200]}")
+
+    get_metrics_store().record(endpoint, request.method, seconds, timings)
+    return response
+
+
+def init_request_metrics(app: Flask) -> None:
+    app.json = TimedJSONProvider(app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    add_statement_observer(_observe_statement)
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    pairs = (f'{name}="{_label_value(value)}"' for name, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+# name in the store -> (metric, help)
+_ENDPOINT_COUNTERS = {
+    "statements": ("ibjjf_db_statements_total", "SQL statements run."),
+    "db_seconds": ("ibjjf_db_seconds_total", "Time spent in SQL statements."),
+    "rows": ("ibjjf_db_rows_total", "Rows returned by SQL statements."),
+    "serialization_seconds": (
+        "ibjjf_serialization_seconds_total",
+        "Time spent serializing JSON responses.",
+    ),
+}
+
+
+def render_metrics() -> str:
+    """Totals in the Prometheus text format, with cache and rate limit counters."""
+    totals = get_metrics_store().totals()
+    endpoints = sorted({(endpoint, method) for endpoint, method, _ in totals})
+    lines = [
+        "# HELP ibjjf_http_request_duration_seconds Request latency by endpoint.",
+        "# TYPE ibjjf_http_request_duration_seconds histogram",
+    ]
+    for endpoint, method in endpoints:
+        cumulative = 0
+        for bound in [*map(str, DURATION_BOUNDS_SECONDS), "+Inf"]:
+            cumulative += totals.get((endpoint, method, f"bucket_{bound}"), 0)
+            labels = _labels(endpoint=endpoint, method=method, le=bound)
+            lines.append(
+                f"ibjjf_http_request_duration_seconds_bucket{labels} {cumulative:g}"
+            )
+        labels = _labels(endpoint=endpoint, method=method)
+        lines.append(
+            f"ibjjf_http_request_duration_seconds_sum{labels} "
+            f"{totals.get((endpoint, method, 'seconds'), 0):g}"
+        )
+        lines.append(
+            f"ibjjf_http_request_duration_seconds_count{labels} "
+            f"{totals.get((endpoint, method, 'requests'), 0):g}"
+        )
+
+    for name, (metric, description) in _ENDPOINT_COUNTERS.items():
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+        for endpoint, method in endpoints:
+            labels = _labels(endpoint=endpoint, method=method)
+            lines.append(
+                f"{metric}{labels} {totals.get((endpoint, method, name), 0):g}"
+            )
+
+    lines += [
+        "# HELP ibjjf_response_cache_total Response cache lookups and evictions.",
+        "# TYPE ibjjf_response_cache_total counter",
+    ]
+    for namespace, counters in sorted(get_response_cache().stats().items()):
+        for name in ("hits", "misses", "evictions"):
+            labels = _labels(namespace=namespace, event=name)
+            lines.append(f"ibjjf_response_cache_total{labels} {counters.get(name, 0)}")
+
+    lines += [
+        "# HELP ibjjf_rate_limit_total Rate limited requests and penalties.",
+        "# TYPE ibjjf_rate_limit_total counter",
+    ]
+    for namespace, counters in sorted(get_rate_limiter().stats().items()):
+        for name in ("allowed", "rejected", "penalized"):
+            labels = _labels(namespace=namespace, outcome=name)
+            lines.append(f"ibjjf_rate_limit_total{labels} {counters.get(name, 0)}")
+
+    return "\n".join(lines) + "\n"
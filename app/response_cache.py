@@ -0,0 +1,155 @@
+import logging
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from local_store import LocalStore, get_local_store
+
+log = logging.getLogger("ibjjf")
+
+# Responses that only change with the stored ranking boards, like /api/top
+# pages, are cached in a local store (local_store.py), so every gunicorn
+# worker on the host shares one cache. Callers key entries by the board
+# generation_id and their normalized parameters, so a new generation simply
+# misses. Writers of inputs outside the generation, like registration imports,
+# clear the namespace; entries also expire after a TTL, which bounds
+# time-dependent content (registration windows, one-hour signed photo URLs).
+# The store is bounded by entry count and bytes and evicts the least recently
+# used entries.
+#
+# The cache must never fail a request: a locked or unreadable store is logged
+# and treated as a miss.
+
+DEFAULT_FILENAME = "ibjjf-response-cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 300
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS ix_entries_used_at ON entries (used_at);
+"""
+
+
+class ResponseCache(LocalStore):
+    schema = _SCHEMA
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        now = time.time()
+        try:
+            connection = self._connection()
+            with connection:
+                row = connection.execute(
+                    "SELECT body, created_at FROM entries WHERE namespace = ? AND key = ?",
+                    (namespace, key),
+                ).fetchone()
+                if row is not None and row[1] < now - self.ttl_seconds:
+                    connection.execute(
+                        "DELETE FROM entries WHERE namespace = ? AND key = ?",
+                        (namespace, key),
+                    )
+                    row = None
+                if row is None:
+                    self._count(connection, namespace, "misses")
+                    return None
+                connection.execute(
+                    "UPDATE entries SET used_at = ? WHERE namespace = ? AND key = ?",
+                    (now, namespace, key),
+                )
+                self._count(connection, namespace, "hits")
+                return row[0]
+        except sqlite3.Error as e:
+            log.warning(f"Response cache read failed: {e}")
+            return None
+
+    def put(self, namespace: str, key: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    """
+                    INSERT OR REPLACE INTO entries
+                        (namespace, key, body, size, created_at, used_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (namespace, key, body, len(body), now, now),
+                )
+                self._evict(connection, namespace)
+        except sqlite3.Error as e:
+            log.warning(f"Response cache write failed: {e}")
+
+    def _evict(self, connection, namespace: str) -> None:
+        entries, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+        evicted = 0
+        for (entry_size,) in connection.execute(
+            "SELECT size FROM entries ORDER BY used_at"
+        ).fetchall():
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            entries -= 1
+            size -= entry_size
+            evicted += 1
+        connection.execute(
+            """
+            DELETE FROM entries WHERE rowid IN (
+                SELECT rowid FROM entries ORDER BY used_at LIMIT ?
+            )
+            """,
+            (evicted,),
+        )
+        # counted against the namespace whose write made room
+        self._count(connection, namespace, "evictions", evicted)
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        try:
+            connection = self._connection()
+            with connection:
+                if namespace is None:
+                    connection.execute("DELETE FROM entries")
+                else:
+                    connection.execute(
+                        "DELETE FROM entries WHERE namespace = ?", (namespace,)
+                    )
+        except sqlite3.Error as e:
+            log.warning(f"Response cache clear failed: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters by namespace, with the entries and bytes stored."""
+        stats = self._counters()
+        for namespace, entries, size in self._connection().execute(
+            "SELECT namespace, COUNT(*), SUM(size) FROM entries GROUP BY namespace"
+        ):
+            stats.setdefault(namespace, {}).update(entries=entries, bytes=size)
+        return stats
+
+
+def get_response_cache() -> ResponseCache:
+    """The cache at RESPONSE_CACHE_PATH, from the app config or environment."""
+    return get_local_store(ResponseCache, "RESPONSE_CACHE_PATH", DEFAULT_FILENAME)
@@ -14,6 +14,7 @@ from models import (
     RegistrationLink,
     Team,
     AthleteRating,
+    AthleteLatestRating,
     AthleteRatingAverage,
     ManualPromotions,
     RegistrationLinkCompetitor,
@@ -53,7 +54,9 @@ from constants import (
     WHITE,
     BLUE,
 )
+from http_caching import conditional_get
 from photos import get_s3_client, get_public_photo_url
+from ranking_archive import athlete_rank_history
 
 athletes_route = Blueprint("athletes_route", __name__)
 
@@ -636,6 +639,7 @@ def get_athlete_data(
 
 
 @athletes_route.route("/api/athlete/<id>")
+@conditional_get()
 def get_athlete(id):
     all_medals = (request.args.get("all_medals") or "").lower() == "true"
     athlete_data = get_athlete_data(id, request.args.get("gi"), all_medals=all_medals)
@@ -645,6 +649,54 @@ def get_athlete(id):
     return jsonify(athlete_data), 200
 
 
+@athletes_route.route("/api/athlete/<id>/rank-history")
+@conditional_get()
+def get_athlete_rank_history(id):
+    athlete, athlete_id = _resolve_athlete(id)
+    if athlete is None:
+        return jsonify({"error": "Athlete not found"}), 404
+    gi = _parse_gi_flag(request.args.get("gi"))
+    board = [request.args.get(key) for key in ("gender", "age", "belt", "weight")]
+
+    if any(board):
+        if not all(board[:3]):
+            return jsonify({"error": "Missing mandatory query parameters"}), 400
+        gender, age, belt, weight = board
+        board_keys = [(gender, age, belt, gi, weight or "")]
+    else:
+        # the boards the athlete is on now
+        board_keys = [
+            (row.gender, row.age, row.belt, gi, row.weight)
+            for row in db.session.query(
+                AthleteRating.gender,
+                AthleteRating.age,
+                AthleteRating.belt,
+                AthleteRating.weight,
+            )
+            .filter(AthleteRating.athlete_id == athlete_id, AthleteRating.gi == gi)
+            .order_by(AthleteRating.age, AthleteRating.belt, AthleteRating.weight)
+        ]
+
+    return (
+        jsonify(
+            [
+                {
+                    "gender": gender,
+                    "age": age,
+                    "belt": belt,
+                    "gi": gi,
+                    "weight": weight,
+                    "history": athlete_rank_history(
+                        db.session, athlete_id, (gender, age, belt, gi, weight)
+                    ),
+                }
+                for gender, age, belt, gi, weight in board_keys
+            ]
+        ),
+        200,
+    )
+
+
 @athletes_route.route("/api/athletes/predict")
 def predict():
     rating1 = request.args.get("rating1")
@@ -904,57 +956,52 @@ def athletes_batch():
     athletes = Athlete.query.filter(Athlete.ibjjf_id.in_(requested_ibjjf_ids)).all()
     athletes_by_ibjjf_id = {athlete.ibjjf_id: athlete for athlete in athletes}
 
-    def _latest_ratings_by_ibjjf_id(gi_value):
-        latest_ratings_subquery = (
-            db.session.query(
-                AthleteRating.athlete_id.label("athlete_id"),
-                AthleteRating.rating.label("rating"),
-                AthleteRating.match_count.label("match_count"),
-                func.row_number()
-                .over(
-                    partition_by=AthleteRating.athlete_id,
-                    order_by=(AthleteRating.id.desc(),),
-                )
-                .label("row_num"),
-            )
-            .filter(AthleteRating.gi == gi_value)
-            .subquery()
-        )
-
+    def _latest_ratings_by_ibjjf_id(gi_values):
+        # one primary key lookup per athlete in the board's latest ratings
+        ibjjf_ids_by_athlete_id = {
+            athlete.id: athlete.ibjjf_id for athlete in athletes_by_ibjjf_id.values()
+        }
+        ratings_by_gi = {gi_value: {} for gi_value in gi_values}
+        if not ibjjf_ids_by_athlete_id:
+            return ratings_by_gi
         rows = (
             db.session.query(
-                Athlete.ibjjf_id,
-                latest_ratings_subquery.c.rating.label("current_rating"),
-                latest_ratings_subquery.c.match_count.label("match_count"),
-            )
-            .join(
-                latest_ratings_subquery,
-                Athlete.id == latest_ratings_subquery.c.athlete_id,
+                AthleteLatestRating.athlete_id,
+                AthleteLatestRating.gi,
+                AthleteLatestRating.rating,
+                AthleteLatestRating.match_count,
             )
             .filter(
-                Athlete.ibjjf_id.in_(requested_ibjjf_ids),
-                latest_ratings_subquery.c.row_num == 1,
+                AthleteLatestRating.athlete_id.in_(list(ibjjf_ids_by_athlete_id)),
+                AthleteLatestRating.gi.in_(gi_values),
             )
             .all()
         )
-        return {
-            ibjjf_id: (current_rating, match_count)
-            for ibjjf_id, current_rating, match_count in rows
-        }
-
-    def _fallback_latest_match_ratings_by_ibjjf_id(missing_ibjjf_ids, gi_value):
-        if not missing_ibjjf_ids:
-            return {}
-
-        missing_athletes = [
-            athletes_by_ibjjf_id[ibjjf_id]
-            for ibjjf_id in missing_ibjjf_ids
-            if ibjjf_id in athletes_by_ibjjf_id
+        for athlete_id, gi_value, current_rating, match_count in rows:
+            ratings_by_gi[gi_value][ibjjf_ids_by_athlete_id[athlete_id]] = (
+                current_rating,
+                match_count,
+            )
+        return ratings_by_gi
+
+    def _fallback_latest_match_ratings_by_ibjjf_id(missing_ibjjf_ids_by_gi):
+        # the same few queries for every gi flag and bracket size
+        fallback_ratings_by_gi = {gi_value: {} for gi_value in missing_ibjjf_ids_by_gi}
+        missing_gi_values = [
+            gi_value
+            for gi_value, missing_ibjjf_ids in missing_ibjjf_ids_by_gi.items()
+            if missing_ibjjf_ids
         ]
-        if not missing_athletes:
-            return {}
+        athlete_ids = list(
+            {
+                athletes_by_ibjjf_id[ibjjf_id].id
+                for gi_value in missing_gi_values
+                for ibjjf_id in missing_ibjjf_ids_by_gi[gi_value]
+            }
+        )
+        if not athlete_ids:
+            return fallback_ratings_by_gi
 
-        athlete_ids = [athlete.id for athlete in missing_athletes]
         now = datetime.now()
 
         registration_rows = (
@@ -1006,9 +1053,10 @@ def athletes_batch():
                 MatchParticipant.end_match_count.label("end_match_count"),
                 Division.belt.label("last_match_belt"),
                 Division.age.label("last_match_age"),
+                Division.gi.label("gi"),
                 func.row_number()
                 .over(
-                    partition_by=MatchParticipant.athlete_id,
+                    partition_by=(MatchParticipant.athlete_id, Division.gi),
                     order_by=(Match.happened_at.desc(), MatchParticipant.id.desc()),
                 )
                 .label("row_num"),
@@ -1019,7 +1067,7 @@ def athletes_batch():
             .join(Athlete, Athlete.id == MatchParticipant.athlete_id)
             .filter(
                 MatchParticipant.athlete_id.in_(athlete_ids),
-                Division.gi == gi_value,
+                Division.gi.in_(missing_gi_values),
                 Division.age != TEEN_1,
                 Division.age != TEEN_2,
                 Division.age != TEEN_3,
@@ -1035,13 +1083,15 @@ def athletes_batch():
                 latest_matches_subquery.c.end_match_count,
                 latest_matches_subquery.c.last_match_belt,
                 latest_matches_subquery.c.last_match_age,
+                latest_matches_subquery.c.gi,
             )
             .filter(latest_matches_subquery.c.row_num == 1)
             .all()
         )
 
-        fallback_ratings_by_ibjjf_id = {}
         for row in rows:
+            if row.ibjjf_id not in missing_ibjjf_ids_by_gi[row.gi]:
+                continue
             registration_belts = registration_belts_by_athlete_id.get(
                 row.athlete_id, []
             )
@@ -1057,50 +1107,37 @@ def athletes_batch():
                 highest_belt,
                 row.last_match_age,
             )
-            fallback_ratings_by_ibjjf_id[row.ibjjf_id] = (
+            fallback_ratings_by_gi[row.gi][row.ibjjf_id] = (
                 bumped_rating,
                 row.end_match_count,
             )
 
-        return fallback_ratings_by_ibjjf_id
+        return fallback_ratings_by_gi
+
+    gi_values = [True, False] if event_is_gi is None else [event_is_gi]
+    ratings_by_gi = _latest_ratings_by_ibjjf_id(gi_values)
+    fallback_ratings_by_gi = _fallback_latest_match_ratings_by_ibjjf_id(
+        {
+            gi_value: {
+                ibjjf_id
+                for ibjjf_id in requested_ibjjf_ids
+                if ibjjf_id in athletes_by_ibjjf_id
+                and ibjjf_id not in ratings_by_gi[gi_value]
+            }
+            for gi_value in gi_values
+        }
+    )
+    for gi_value in gi_values:
+        ratings_by_gi[gi_value].update(fallback_ratings_by_gi[gi_value])
 
     selected_ratings_by_ibjjf_id = {}
     gi_ratings_by_ibjjf_id = {}
     nogi_ratings_by_ibjjf_id = {}
     if event_is_gi is None:
-        gi_ratings_by_ibjjf_id = _latest_ratings_by_ibjjf_id(True)
-        nogi_ratings_by_ibjjf_id = _latest_ratings_by_ibjjf_id(False)
-        missing_gi_ids = [
-            ibjjf_id
-            for ibjjf_id in requested_ibjjf_ids
-            if ibjjf_id in athletes_by_ibjjf_id
-            and ibjjf_id not in gi_ratings_by_ibjjf_id
-        ]
-        missing_nogi_ids = [
-            ibjjf_id
-            for ibjjf_id in requested_ibjjf_ids
-            if ibjjf_id in athletes_by_ibjjf_id
-            and ibjjf_id not in nogi_ratings_by_ibjjf_id
-        ]
-        gi_ratings_by_ibjjf_id.update(
-            _fallback_latest_match_ratings_by_ibjjf_id(missing_gi_ids, True)
-        )
-        nogi_ratings_by_ibjjf_id.update(
-            _fallback_latest_match_ratings_by_ibjjf_id(missing_nogi_ids, False)
-        )
+        gi_ratings_by_ibjjf_id = ratings_by_gi[True]
+        nogi_ratings_by_ibjjf_id = ratings_by_gi[False]
     else:
-        selected_ratings_by_ibjjf_id = _latest_ratings_by_ibjjf_id(event_is_gi)
-        missing_selected_ids = [
-            ibjjf_id
-            for ibjjf_id in requested_ibjjf_ids
-            if ibjjf_id in athletes_by_ibjjf_id
-            and ibjjf_id not in selected_ratings_by_ibjjf_id
-        ]
-        selected_ratings_by_ibjjf_id.update(
-            _fallback_latest_match_ratings_by_ibjjf_id(
-                missing_selected_ids, event_is_gi
-            )
-        )
+        selected_ratings_by_ibjjf_id = ratings_by_gi[event_is_gi]
 
     response = []
     for ibjjf_id in requested_ibjjf_ids:
@@ -1,10 +1,8 @@
 from flask import Blueprint, jsonify, request
-import requests
 import threading
 import os
 import uuid
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
 from pull import (
     parse_categories,
     parse_match_when,
@@ -74,7 +72,8 @@ from elo import (
     compute_k_factor,
     CLOSEOUT_NOTE,
 )
-from photos import get_s3_client, get_public_photo_url
+from photos import get_s3_client, get_public_photo_url, get_public_photo_urls
+from response_cache import get_response_cache
 from seeding import (
     _bracket_slots,
     add_estimated_seeds,
@@ -174,6 +173,8 @@ def parse_division(name):
 
 
 def get_bracket_page(link, newer_than):
+    import requests
+
     q = db.session.query(BracketPage).filter(BracketPage.link == link)
 
     if newer_than is not None:
@@ -268,6 +269,7 @@ def get_ratings(
         athletes_by_name.setdefault(athlete.normalized_name, []).append(athlete)
 
     athlete_ids = [athlete.id for athlete in athlete_results]
+    photo_urls = get_public_photo_urls(s3_client, athlete_results)
     highest_belt_index_by_athlete_id = {}
     athlete_has_adult_or_master_history = {}
 
@@ -345,11 +347,7 @@ def get_ratings(
             result["slug"] = athlete.slug
             result["instagram_profile"] = athlete.instagram_profile
             result["personal_name"] = athlete.personal_name
-            result["profile_image_url"] = (
-                get_public_photo_url(s3_client, athlete)
-                if s3_client and athlete.profile_image_saved_at
-                else None
-            )
+            result["profile_image_url"] = photo_urls.get(athlete.id)
             result["country"] = athlete.country
             result["country_note"] = athlete.country_note
             result["country_note_pt"] = athlete.country_note_pt
@@ -370,11 +368,7 @@ def get_ratings(
                 result["slug"] = matched_athlete.slug
                 result["instagram_profile"] = matched_athlete.instagram_profile
                 result["personal_name"] = matched_athlete.personal_name
-                result["profile_image_url"] = (
-                    get_public_photo_url(s3_client, matched_athlete)
-                    if s3_client and matched_athlete.profile_image_saved_at
-                    else None
-                )
+                result["profile_image_url"] = photo_urls.get(matched_athlete.id)
                 result["country"] = matched_athlete.country
                 result["country_note"] = matched_athlete.country_note
                 result["country_note_pt"] = matched_athlete.country_note_pt
@@ -1072,6 +1066,10 @@ def save_competitors(link_id, json_data, division_set):
                 added_row = True
     if added_row:
         db.session.commit()
+        # ranking pages list upcoming registrations and count them for the
+        # upcoming filter
+        get_response_cache().clear("top")
+        get_response_cache().clear("top-count")
 
 
 def normalize_registration_link(link):
@@ -1084,6 +1082,8 @@ def normalize_registration_link(link):
 
 
 def import_registration_link(link, background):
+    from bs4 import BeautifulSoup
+
     url = normalize_registration_link(link)
 
     link = (
@@ -1413,6 +1413,8 @@ def _registration_competitor_row(name, team, divdata, gi):
 
 
 def _registration_rows_for_division(link, division, gi):
+    from bs4 import BeautifulSoup
+
     if link.startswith("internal:"):
         divdata = parse_division(division)
         return internal_registration_competitors(link, divdata, gi), divdata
@@ -1746,6 +1748,8 @@ def registration_competitor_medal_breakdown():
 
 @brackets_route.route("/api/brackets/registrations/elites")
 def registration_elites():
+    from bs4 import BeautifulSoup
+
     link = request.args.get("link")
 
     # validate params
@@ -2584,6 +2588,8 @@ def attach_live_match_scores(event_ibjjf_id, division, parsed_matches):
 
 @brackets_route.route("/api/brackets/competitors")
 def competitors():
+    from bs4 import BeautifulSoup
+
     link = request.args.get("link")
     age = request.args.get("age")
     gender = request.args.get("gender")
@@ -2889,6 +2895,8 @@ def competitors():
 
 @brackets_route.route("/api/brackets/categories/<tournament_id>")
 def categories(tournament_id):
+    from bs4 import BeautifulSoup
+
     results = []
 
     for url, gender in [
@@ -2938,6 +2946,8 @@ def categories(tournament_id):
 
 @brackets_route.route("/api/brackets/events")
 def events():
+    from bs4 import BeautifulSoup
+
     try:
         soup = BeautifulSoup(
             get_bracket_page(
@@ -3112,7 +3122,14 @@ def archive_competitors():
 
     use_seeds = "idade 04 a 15 anos" in event_name or "(" not in event_name
 
-    s3_client = get_s3_client()
+    photo_urls = get_public_photo_urls(
+        get_s3_client(),
+        [
+            participant.athlete
+            for match in matches
+            for participant in match.participants
+        ],
+    )
 
     competitors = []
     parsed_matches = []
@@ -3191,11 +3208,7 @@ def archive_competitors():
                 "red_slug": red.athlete.slug,
                 "red_instagram_profile": red.athlete.instagram_profile,
                 "red_personal_name": red.athlete.personal_name,
-                "red_profile_image_url": (
-                    get_public_photo_url(s3_client, red.athlete)
-                    if red.athlete.profile_image_saved_at
-                    else None
-                ),
+                "red_profile_image_url": photo_urls.get(red.athlete.id),
                 "red_country": red.athlete.country,
                 "red_country_note": red.athlete.country_note,
                 "red_country_note_pt": red.athlete.country_note_pt,
@@ -3221,11 +3234,7 @@ def archive_competitors():
                 "blue_slug": blue.athlete.slug,
                 "blue_instagram_profile": blue.athlete.instagram_profile,
                 "blue_personal_name": blue.athlete.personal_name,
-                "blue_profile_image_url": (
-                    get_public_photo_url(s3_client, blue.athlete)
-                    if blue.athlete.profile_image_saved_at
-                    else None
-                ),
+                "blue_profile_image_url": photo_urls.get(blue.athlete.id),
                 "blue_country": blue.athlete.country,
                 "blue_country_note": blue.athlete.country_note,
                 "blue_country_note_pt": blue.athlete.country_note_pt,
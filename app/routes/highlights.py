@@ -5,7 +5,6 @@ from datetime import datetime, timezone
 from uuid import UUID
 
 from flask import Blueprint, jsonify, make_response, request
-from PIL import Image, UnidentifiedImageError
 from sqlalchemy import func, or_
 from sqlalchemy.orm import joinedload, selectinload
 
@@ -701,6 +700,8 @@ def event_detail(event_id):
 
 @highlights_route.route("/api/highlights/v1/assets/<asset_ref>")
 def asset(asset_ref):
+    from PIL import Image, UnidentifiedImageError
+
     invalid = _reject_unknown_args(set())
     if invalid:
         return invalid
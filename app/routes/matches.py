@@ -1,10 +1,13 @@
+import base64
+import json
 import os
 import re
 import uuid
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from collections import defaultdict
-from time import time
+from sqlalchemy import DateTime, bindparam
+from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import text
 from extensions import db
 from constants import (
@@ -59,7 +62,8 @@ from models import (
     LivestreamFrameTextEvent,
 )
 from elo import RATING_VERY_IMMATURE_COUNT
-from photos import get_public_photo_url, get_s3_client
+from rate_limiter import get_rate_limiter
+from photos import get_public_photo_urls, get_s3_client
 from normalize import normalize
 from livestreams import (
     get_livestream_link,
@@ -72,9 +76,6 @@ matches_route = Blueprint("matches_route", __name__)
 MATCH_PAGE_SIZE = 12
 ATHLETES_MATCH_PAGE_SIZE = 100
 
-INITIAL_RATE_LIMIT = 15
-RATE_LIMIT_WINDOW = 10
-PENALTY_PERIOD = 60
 REVIEW_RETRACTION_SECONDS = 30
 MATCH_DETAIL_RESET_TIMER_SECONDS = 4 * 60
 MATCH_DETAIL_EVENT_COMBINE_SECONDS = 6
@@ -88,8 +89,6 @@ DQ_TYPE_NOTES: dict[str, tuple[str, ...]] = {
         "Disqualified by desc disciplinar",
     ),
 }
-client_requests = defaultdict(list)
-client_penalties = {}
 
 
 def _clean_display_name(name):
@@ -800,28 +799,9 @@ def rate_limit():
         if not client_ip:
             return
 
-    current_time = time()
-    request_times = client_requests[client_ip]
-    penalty_info = client_penalties.get(
-        client_ip, {"rate_limit": INITIAL_RATE_LIMIT, "penalty_end": 0}
-    )
-
-    if current_time > penalty_info["penalty_end"]:
-        penalty_info["rate_limit"] = INITIAL_RATE_LIMIT
-        penalty_info["penalty_end"] = 0
-        client_penalties[client_ip] = penalty_info
-
-    while request_times and request_times[0] < current_time - RATE_LIMIT_WINDOW:
-        request_times.pop(0)
-
-    if len(request_times) >= penalty_info["rate_limit"]:
-        penalty_info["rate_limit"] = max(1, penalty_info["rate_limit"] // 2)
-        penalty_info["penalty_end"] = current_time + PENALTY_PERIOD
-        client_penalties[client_ip] = penalty_info
+    if not get_rate_limiter().allow(request.blueprint, client_ip):
         return jsonify({"error": "Too many requests"}), 429
 
-    request_times.append(current_time)
-
 
 matches_route.before_request(rate_limit)
 
@@ -846,6 +826,25 @@ def match_detail_events(match_id):
     return jsonify(build_match_detail_payload(match, raw_events))
 
 
+# /api/matches pages with LIMIT/OFFSET for the page numbers the Database view
+# shows, but each response also carries an opaque cursor naming its last match.
+# Given back, the next page starts right after that (happened_at, id) in the
+# index, so deep pages cost the same as the first one.
+def encode_match_cursor(happened_at, match_id):
+    payload = json.dumps([happened_at.isoformat(), str(uuid.UUID(str(match_id)))])
+    return base64.urlsafe_b64encode(payload.encode()).rstrip(b"=").decode()
+
+
+def decode_match_cursor(cursor):
+    """The (happened_at, id) of a cursor, ValueError when it is not one."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        happened_at, match_id = json.loads(payload)
+        return datetime.fromisoformat(happened_at), uuid.UUID(match_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
 @matches_route.route("/api/matches")
 def matches():
     gi = request.args.get("gi")
@@ -903,6 +902,7 @@ def matches():
     rating_end = request.args.get("rating_end")
     elite_only = request.args.get("elite_only")
     page = request.args.get("page") or 1
+    cursor = request.args.get("cursor")
 
     if gi is None:
         return jsonify({"error": "Missing mandatory query parameter"}), 400
@@ -914,6 +914,12 @@ def matches():
     except ValueError:
         return jsonify({"error": "Invalid page number"}), 400
 
+    if cursor:
+        try:
+            cursor_happened_at, cursor_id = decode_match_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
     def parse_nonnegative_int(value):
         if value is None:
             return None
@@ -1407,6 +1413,11 @@ def matches():
         """
         params["rating_end"] = rating_end_int
 
+    if cursor:
+        filters += "AND (m.happened_at, m.id) < (:cursor_happened_at, :cursor_id)\n"
+        params["cursor_happened_at"] = cursor_happened_at
+        params["cursor_id"] = cursor_id
+
     sql = f"""
         SELECT m.id, m.happened_at, d.gi, d.gender, d.age, d.belt, d.weight, e.name as event_name, e.ibjjf_id,
             mp.id as participant_id, mp.winner, mp.start_rating, mp.end_rating,
@@ -1432,18 +1443,22 @@ def matches():
 
     # get one extra match to determine if there are more pages
     params["limit"] = (page_size + 1) * 2
-    params["offset"] = (page - 1) * page_size * 2
+    params["offset"] = 0 if cursor else (page - 1) * page_size * 2
 
-    results = db.session.execute(
-        text(
-            f"""
+    statement = text(
+        f"""
         {sql}
         ORDER BY m.happened_at DESC, m.id DESC
         LIMIT :limit OFFSET :offset
         """
-        ),
-        params,
     )
+    if cursor:
+        # typed, so they compare like the stored columns on every backend
+        statement = statement.bindparams(
+            bindparam("cursor_happened_at", type_=DateTime()),
+            bindparam("cursor_id", type_=UUID(as_uuid=True)),
+        )
+    results = db.session.execute(statement, params)
 
     s3_client = get_s3_client()
 
@@ -1552,11 +1567,7 @@ def matches():
                     "winnerCountryNotePt": winner.athlete.country_note_pt,
                     "winnerInstagramProfile": winner.athlete.instagram_profile,
                     "winnerPersonalName": winner.athlete.personal_name,
-                    "winnerProfileImageUrl": (
-                        get_public_photo_url(s3_client, winner.athlete)
-                        if winner.athlete.profile_image_saved_at
-                        else None
-                    ),
+                    "winnerProfileImageUrl": None,
                     "loser": (
                         loser.athlete.name
                         if not loser.athlete.hide_full_name
@@ -1574,11 +1585,7 @@ def matches():
                     "loserCountryNotePt": loser.athlete.country_note_pt,
                     "loserInstagramProfile": loser.athlete.instagram_profile,
                     "loserPersonalName": loser.athlete.personal_name,
-                    "loserProfileImageUrl": (
-                        get_public_photo_url(s3_client, loser.athlete)
-                        if loser.athlete.profile_image_saved_at
-                        else None
-                    ),
+                    "loserProfileImageUrl": None,
                     "event": current_match.event.name,
                     "age": current_match.division.age,
                     "gender": current_match.division.gender,
@@ -1610,6 +1617,8 @@ def matches():
                     "video_start_offset_seconds": (
                         current_match.video_start_offset_seconds
                     ),
+                    "winner_athlete": winner.athlete,
+                    "loser_athlete": loser.athlete,
                 }
             )
 
@@ -1617,8 +1626,12 @@ def matches():
     if len(response) <= page_size:
         totalPages -= 1
 
+    next_cursor = None
     if len(response) > page_size:
         response = response[:page_size]
+        next_cursor = encode_match_cursor(
+            response[-1]["date_happened_at"], response[-1]["id"]
+        )
 
     # Fill query results with livestream links
     livestream_data = {}
@@ -1630,6 +1643,16 @@ def matches():
         db.session, (match["id"] for match in response)
     )
 
+    # signed for the page only, not the extra match
+    photo_urls = get_public_photo_urls(
+        s3_client,
+        [
+            athlete
+            for match in response
+            for athlete in (match["winner_athlete"], match["loser_athlete"])
+        ],
+    )
+
     for match in response:
         resolved_link = get_livestream_link(
             livestream_data,
@@ -1654,11 +1677,19 @@ def matches():
                 uuid.UUID(str(match["id"])), resolved_link
             )
         match["videoLink"] = resolved_link
+        match["winnerProfileImageUrl"] = photo_urls.get(
+            uuid.UUID(str(match["winnerId"]))
+        )
+        match["loserProfileImageUrl"] = photo_urls.get(uuid.UUID(str(match["loserId"])))
 
+        del match["winner_athlete"]
+        del match["loser_athlete"]
         del match["event_ibjjf_id"]
         del match["date_happened_at"]
         del match["match_number"]
         del match["division_size"]
         del match["video_start_offset_seconds"]
 
-    return jsonify({"rows": response, "totalPages": totalPages})
+    return jsonify(
+        {"rows": response, "totalPages": totalPages, "nextCursor": next_cursor}
+    )
@@ -2,7 +2,6 @@ from flask import Blueprint, jsonify, request
 from datetime import date
 from extensions import db
 from sqlalchemy import text
-import requests
 
 WP_API = (
     "https://public-api.wordpress.com/rest/v1.1/sites/ibjjfrankings.wordpress.com/posts"
@@ -13,6 +12,8 @@ news_route = Blueprint("news_route", __name__)
 
 @news_route.route("/api/news")
 def get_news():
+    import requests
+
     page = request.args.get("page", default=1, type=int)
     if page < 1:
         page = 1
@@ -30,6 +31,8 @@ def get_news():
 
 @news_route.route("/api/news/<id>")
 def get_news_by_id(id):
+    import requests
+
     resp = requests.get(f"{WP_API}/{id}")
     if resp.status_code != 200:
         return jsonify({"error": resp.text})
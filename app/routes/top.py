@@ -1,7 +1,8 @@
+import json
 import os
 import math
-from flask import Blueprint, request, jsonify
-from datetime import datetime
+from flask import Blueprint, Response, request, jsonify
+from datetime import datetime, timedelta
 from extensions import db
 from sqlalchemy import and_, func, or_
 from models import (
@@ -12,7 +13,11 @@ from models import (
     Division,
 )
 from site_statistics import get_covered_match_count
-from photos import get_public_photo_url, get_s3_client
+from http_caching import conditional_get
+from ranking_archive import load_board_as_of
+from ranking_generations import ranking_generation_id
+from response_cache import get_response_cache
+from photos import get_public_photo_urls, get_s3_client
 from normalize import normalize
 from constants import (
     ADULT,
@@ -28,6 +33,20 @@ from constants import (
 top_route = Blueprint("top_route", __name__)
 
 RATINGS_PAGE_SIZE = 30
+# the parameters that change a /api/top response, normalized into its cache key
+TOP_CACHE_PARAMS = (
+    "gender",
+    "age",
+    "belt",
+    "gi",
+    "weight",
+    "country",
+    "name",
+    "changed",
+    "upcoming",
+    "page",
+    "as_of",
+)
 YOUTH_AGE_DIVISIONS = {
     TEEN_1,
     TEEN_2,
@@ -42,13 +61,192 @@ def _is_adult_or_master_age(age):
     return age == ADULT or age.startswith(MASTER_PREFIX)
 
 
+def _filter_by_name(query, name):
+    exact = name.strip().startswith('"') and name.strip().endswith('"')
+    if exact:
+        name = name.strip()[1:-1]
+        normalized_name = normalize(name)
+        query = query.filter(
+            or_(
+                and_(
+                    Athlete.hide_full_name.is_(True),
+                    Athlete.normalized_personal_name == normalized_name,
+                ),
+                and_(
+                    Athlete.hide_full_name.isnot(True),
+                    Athlete.normalized_name == normalized_name,
+                ),
+            )
+        )
+    else:
+        if os.getenv("DATABASE_URL"):
+            # Use full-text search
+            search_terms = [term + ":*" for term in normalize(name).split()]
+            ts_query = func.to_tsquery("simple", " & ".join(search_terms))
+            query = query.filter(
+                or_(
+                    and_(
+                        Athlete.hide_full_name.is_(True),
+                        Athlete.normalized_personal_name_tsvector.op("@@")(ts_query),
+                    ),
+                    and_(
+                        Athlete.hide_full_name.isnot(True),
+                        or_(
+                            Athlete.normalized_name_tsvector.op("@@")(ts_query),
+                            Athlete.normalized_personal_name_tsvector.op("@@")(
+                                ts_query
+                            ),
+                        ),
+                    ),
+                )
+            )
+        else:
+            # Fallback to LIKE search
+            for name_part in normalize(name).split():
+                query = query.filter(
+                    or_(
+                        and_(
+                            Athlete.hide_full_name.is_(True),
+                            Athlete.normalized_personal_name.like(f"%{name_part}%"),
+                        ),
+                        and_(
+                            Athlete.hide_full_name.isnot(True),
+                            or_(
+                                Athlete.normalized_name.like(f"%{name_part}%"),
+                                Athlete.normalized_personal_name.like(f"%{name_part}%"),
+                            ),
+                        ),
+                    )
+                )
+    return query
+
+
+def _archived_top(board_key, as_of, country, name, page, s3_client):
+    # the board as it stood at the end of the as_of day
+    board = load_board_as_of(db.session, board_key, as_of + timedelta(days=1))
+    if board is None:
+        return jsonify({"error": "No archived ranking for that date"}), 404
+
+    indexes = list(range(len(board)))
+    if country or name:
+        positions = {board.athlete_id(index): index for index in indexes}
+        query = db.session.query(Athlete.id).filter(Athlete.id.in_(list(positions)))
+        if country:
+            query = query.filter(func.lower(Athlete.country) == country.lower())
+        if name:
+            query = _filter_by_name(query, name)
+        indexes = sorted(positions[row.id] for row in query)
+
+    offset = (page - 1) * RATINGS_PAGE_SIZE
+    page_indexes = indexes[offset : offset + RATINGS_PAGE_SIZE]
+    athletes = {
+        athlete.id: athlete
+        for athlete in Athlete.query.filter(
+            Athlete.id.in_([board.athlete_id(index) for index in page_indexes])
+        )
+    }
+
+    photo_urls = get_public_photo_urls(s3_client, athletes.values())
+
+    response = []
+    for index in page_indexes:
+        athlete = athletes.get(board.athlete_id(index))
+        if athlete is None:
+            continue
+        row = board.row(index)
+        response.append(
+            {
+                "rank": row["rank"],
+                "athlete_id": athlete.id,
+                "name": athlete.name,
+                "slug": athlete.slug,
+                "instagram_profile": athlete.instagram_profile,
+                "personal_name": athlete.personal_name,
+                "profile_image_url": photo_urls.get(athlete.id),
+                "country": athlete.country,
+                "country_note": athlete.country_note,
+                "country_note_pt": athlete.country_note_pt,
+                "rating": row["rating"],
+                "match_count": row["match_count"],
+                "previous_rating": None,
+                "previous_rank": None,
+                "previous_match_count": None,
+                "registrations": [],
+            }
+        )
+
+    return jsonify(
+        {
+            "rows": response,
+            "totalPages": math.ceil(len(indexes) / RATINGS_PAGE_SIZE),
+            "generation": str(board.generation_id) if board.generation_id else None,
+            "as_of": board.generated_at.isoformat(),
+        }
+    )
+
+
 @top_route.route("/api/site-statistics")
 def site_statistics():
     return jsonify({"coveredMatchCount": get_covered_match_count(db.session)})
 
 
+def _top_cache_key(generation_id, include_photo_urls):
+    values = {name: (request.args.get(name) or "").strip() for name in TOP_CACHE_PARAMS}
+    for name in ("gi", "country", "changed", "upcoming"):
+        values[name] = values[name].lower()
+    values["page"] = values["page"] or "1"
+    return json.dumps([str(generation_id), include_photo_urls, values], sort_keys=True)
+
+
+def _top_count(query, generation_id, filters):
+    """The query's row count, cached per generation and filter values.
+
+    filters are the values the query was built from, exactly as it compares
+    them, so requests only share a count when they filter on the same rows.
+    """
+    if generation_id is None:
+        return query.count()
+
+    key = json.dumps([str(generation_id), filters])
+    cache = get_response_cache()
+    body = cache.get("top-count", key)
+    if body is not None:
+        return int(body)
+    count = query.count()
+    cache.put("top-count", key, str(count).encode())
+    return count
+
+
 @top_route.route("/api/top")
+@conditional_get()
+def top_api():
+    return top()
+
+
 def top(*, include_photo_urls=True):
+    gi = (request.args.get("gi") or "").lower() == "true"
+    generation_id = ranking_generation_id(db.session, gi)
+    if generation_id is None:
+        # boards not written by a generation have no id to key the cache on
+        return _top(generation_id, include_photo_urls)
+
+    cache = get_response_cache()
+    key = _top_cache_key(generation_id, include_photo_urls)
+    body = cache.get("top", key)
+    if body is not None:
+        response = Response(body, mimetype="application/json")
+        response.headers["X-Cache"] = "HIT"
+        return response
+
+    response = _top(generation_id, include_photo_urls)
+    if isinstance(response, tuple):
+        return response
+    cache.put("top", key, response.get_data())
+    response.headers["X-Cache"] = "MISS"
+    return response
+
+
+def _top(generation_id, include_photo_urls):
     gender = request.args.get("gender")
     age = request.args.get("age")
     belt = request.args.get("belt")
@@ -59,6 +257,7 @@ def top(*, include_photo_urls=True):
     changed = request.args.get("changed")
     upcoming = request.args.get("upcoming")
     page = request.args.get("page") or 1
+    as_of = request.args.get("as_of")
 
     if not all([gender, age, belt, gi]):
         return jsonify({"error": "Missing mandatory query parameters"}), 400
@@ -77,6 +276,25 @@ def top(*, include_photo_urls=True):
 
     s3_client = get_s3_client() if include_photo_urls else None
 
+    if as_of:
+        if changed or upcoming:
+            return (
+                jsonify({"error": "as_of cannot be combined with changed or upcoming"}),
+                400,
+            )
+        try:
+            as_of = datetime.strptime(as_of, "%Y-%m-%d")
+        except ValueError:
+            return jsonify({"error": "Invalid as_of date"}), 400
+        return _archived_top(
+            (gender, age, belt, gi, weight),
+            as_of,
+            country,
+            name,
+            page,
+            s3_client,
+        )
+
     query = (
         db.session.query(
             Athlete.id,
@@ -110,66 +328,7 @@ def top(*, include_photo_urls=True):
         query = query.filter(func.lower(Athlete.country) == country.lower())
 
     if name:
-        exact = name.strip().startswith('"') and name.strip().endswith('"')
-        if exact:
-            name = name.strip()[1:-1]
-            normalized_name = normalize(name)
-            query = query.filter(
-                or_(
-                    and_(
-                        Athlete.hide_full_name.is_(True),
-                        Athlete.normalized_personal_name == normalized_name,
-                    ),
-                    and_(
-                        Athlete.hide_full_name.isnot(True),
-                        Athlete.normalized_name == normalized_name,
-                    ),
-                )
-            )
-        else:
-            if os.getenv("DATABASE_URL"):
-                # Use full-text search
-                search_terms = [term + ":*" for term in normalize(name).split()]
-                ts_query = func.to_tsquery("simple", " & ".join(search_terms))
-                query = query.filter(
-                    or_(
-                        and_(
-                            Athlete.hide_full_name.is_(True),
-                            Athlete.normalized_personal_name_tsvector.op("@@")(
-                                ts_query
-                            ),
-                        ),
-                        and_(
-                            Athlete.hide_full_name.isnot(True),
-                            or_(
-                                Athlete.normalized_name_tsvector.op("@@")(ts_query),
-                                Athlete.normalized_personal_name_tsvector.op("@@")(
-                                    ts_query
-                                ),
-                            ),
-                        ),
-                    )
-                )
-            else:
-                # Fallback to LIKE search
-                for name_part in normalize(name).split():
-                    query = query.filter(
-                        or_(
-                            and_(
-                                Athlete.hide_full_name.is_(True),
-                                Athlete.normalized_personal_name.like(f"%{name_part}%"),
-                            ),
-                            and_(
-                                Athlete.hide_full_name.isnot(True),
-                                or_(
-                                    Athlete.normalized_name.like(f"%{name_part}%"),
-                                    Athlete.normalized_personal_name.like(
-                                        f"%{name_part}%"
-                                    ),
-                                ),
-                            ),
-                        )
-                    )
+        query = _filter_by_name(query, name)
 
     if changed:
         query = query.filter(
@@ -198,15 +357,49 @@ def top(*, include_photo_urls=True):
             subquery = subquery.filter(~Division.age.in_(YOUTH_AGE_DIVISIONS))
         query = query.filter(Athlete.id.in_(subquery))
 
-    totalCount = query.count()
+    if name:
+        # counting free-text matches costs as much as the page itself, so fetch
+        # one extra row and only tell whether there is a next page
+        limit = RATINGS_PAGE_SIZE + 1
+    else:
+        # free-text names are never counted, so they are not among the filters
+        filters = [
+            gender,
+            age,
+            belt,
+            gi,
+            weight,
+            country.lower(),
+            bool(changed),
+            bool(upcoming),
+        ]
+        totalPages = math.ceil(
+            _top_count(query, generation_id, filters) / RATINGS_PAGE_SIZE
+        )
+        limit = RATINGS_PAGE_SIZE
 
     query = (
         query.order_by(AthleteRating.rank, AthleteRating.match_happened_at.desc())
-        .limit(RATINGS_PAGE_SIZE)
+        .limit(limit)
         .offset((page - 1) * RATINGS_PAGE_SIZE)
     )
     results = query.all()
 
+    if name:
+        has_more = len(results) > RATINGS_PAGE_SIZE
+        results = results[:RATINGS_PAGE_SIZE]
+        if has_more:
+            totalPages = page + 1
+        elif results:
+            totalPages = page
+        else:
+            # past the last page; points the client back at pages that exist
+            totalPages = page - 1
+    else:
+        has_more = page < totalPages
+
+    photo_urls = get_public_photo_urls(s3_client, results)
+
     athlete_names = [result.name for result in results]
     reg_link_rows = (
         db.session.query(
@@ -260,11 +453,7 @@ def top(*, include_photo_urls=True):
             "slug": result.slug,
             "instagram_profile": result.instagram_profile,
             "personal_name": result.personal_name,
-            "profile_image_url": (
-                get_public_photo_url(s3_client, result)
-                if include_photo_urls and result.profile_image_saved_at
-                else None
-            ),
+            "profile_image_url": photo_urls.get(result.id),
             "country": result.country,
             "country_note": result.country_note,
             "country_note_pt": result.country_note_pt,
@@ -283,5 +472,11 @@ def top(*, include_photo_urls=True):
     ]
 
     return jsonify(
-        {"rows": response, "totalPages": math.ceil(totalCount / RATINGS_PAGE_SIZE)}
+        {
+            "rows": response,
+            "totalPages": totalPages,
+            "hasMore": has_more,
+            # lets clients tell whether pages come from the same board build
+            "generation": str(generation_id) if generation_id else None,
+        }
     )
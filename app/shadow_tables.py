@@ -0,0 +1,105 @@
+import logging
+from typing import Optional
+
+from sqlalchemy import (
+    ForeignKeyConstraint,
+    MetaData,
+    PrimaryKeyConstraint,
+    Table,
+    text,
+)
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+log = logging.getLogger("ibjjf")
+
+# Tables that requests read while a batch job rebuilds them, like the ranking
+# boards, are built into a shadow copy and swapped in by a rename at the end of
+# the job. Readers keep seeing the old rows until the job commits, the live
+# table is never half-built, and it takes no row locks or dead rows from a
+# mass DELETE. The rename needs an exclusive lock until the commit, so the swap
+# must be the last statement before it.
+#
+# Index and constraint names share a namespace with the live table's on
+# Postgres, so there the shadow carries them with a suffix, is indexed and
+# analyzed before the swap, and the names are renamed back after it. SQLite
+# cannot rename indexes, so there they are created after the rename, still in
+# the writer's transaction.
+
+SHADOW_SUFFIX = "_shadow"
+
+
+def _postgresql_name(table: Table, item) -> str:
+    # Postgres' names for the unnamed constraints of the migrations
+    if item.name:
+        return item.name
+    if isinstance(item, PrimaryKeyConstraint):
+        return f"{table.name}_pkey"
+    if isinstance(item, ForeignKeyConstraint):
+        return f"{table.name}_{'_'.join(item.column_keys)}_fkey"
+    raise ValueError(f"Unnamed constraint {item!r} on {table.name}")
+
+
+def _is_postgresql(session) -> bool:
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def create_shadow_table(session, table: Table) -> Table:
+    """Create an empty copy of table to build into, for swap_shadow_table."""
+    metadata = MetaData()
+    # referenced tables must be in the copy's metadata to render foreign keys
+    for foreign_key in table.foreign_keys:
+        if foreign_key.column.table.name not in metadata.tables:
+            foreign_key.column.table.to_metadata(metadata)
+    shadow = table.to_metadata(metadata, name=f"{table.name}{SHADOW_SUFFIX}")
+    if _is_postgresql(session):
+        for item in (*shadow.constraints, *shadow.indexes):
+            item.name = f"{_postgresql_name(table, item)}{SHADOW_SUFFIX}"
+
+    session.execute(text(f"DROP TABLE IF EXISTS {shadow.name}"))
+    session.execute(CreateTable(shadow))
+    return shadow
+
+
+def copy_rows(session, table: Table, shadow: Table, where: Optional[str] = None):
+    """Copy the rows of table the rebuild keeps into the shadow."""
+    columns = ", ".join(column.name for column in table.columns)
+    session.execute(
+        text(
+            f"INSERT INTO {shadow.name} ({columns}) "
+            f"SELECT {columns} FROM {table.name}" + (f" WHERE {where}" if where else "")
+        )
+    )
+
+
+def swap_shadow_table(session, table: Table, shadow: Table) -> None:
+    """Replace table with its built shadow, keeping its index names."""
+    postgresql = _is_postgresql(session)
+    if postgresql:
+        for index in shadow.indexes:
+            session.execute(CreateIndex(index))
+        session.execute(text(f"ANALYZE {shadow.name}"))
+
+    session.execute(text(f"DROP TABLE {table.name}"))
+    session.execute(text(f"ALTER TABLE {shadow.name} RENAME TO {table.name}"))
+
+    if postgresql:
+        for index in shadow.indexes:
+            session.execute(
+                text(
+                    f"ALTER INDEX {index.name} RENAME TO "
+                    f"{index.name.removesuffix(SHADOW_SUFFIX)}"
+                )
+            )
+        for constraint in shadow.constraints:
+            session.execute(
+                text(
+                    f"ALTER TABLE {table.name} RENAME CONSTRAINT {constraint.name} "
+                    f"TO {constraint.name.removesuffix(SHADOW_SUFFIX)}"
+                )
+            )
+    else:
+        for index in table.indexes:
+            session.execute(CreateIndex(index))
+        session.execute(text(f"ANALYZE {table.name}"))
+
+    log.info(f"Swapped in the rebuilt {table.name}")
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from flask import Flask, has_request_context
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.engine import Engine
+
+from rating_profile import normalize_statement
+from statement_timing import add_statement_observer
+
+log = logging.getLogger("ibjjf")
+
+# Slow statement capture for web requests. init_slow_queries() registers a
+# statement observer (statement_timing.py), and a request's statement slower
+# than SLOW_QUERY_THRESHOLD_SECONDS is queued with its parameters; a daemon
+# thread per worker explains it (EXPLAIN ANALYZE on Postgres, EXPLAIN QUERY
+# PLAN on SQLite) and adds it to the slow_queries table, one row per statement
+# fingerprint with its call count, total and max time, and the slowest
+# execution's statement, parameters and plan. The admin app ranks them by
+# total time.
+#
+# Statements outside a request, like the batch scripts that import the app,
+# are not recorded: re-running their long replay and board queries under
+# EXPLAIN ANALYZE would double their cost, and their temp tables do not exist
+# on the recorder's connection.
+#
+# The dynamic SQL of /api/matches and /api/awards differs by filter
+# combination, so each combination is its own fingerprint. EXPLAIN ANALYZE
+# runs the statement again, so it is only used for SELECTs, inside a rolled
+# back transaction with a statement timeout, and a fingerprint is explained at
+# most every EXPLAIN_INTERVAL. Statements the recorder runs are
+# not recorded, and a full queue drops statements instead of blocking.
+
+DEFAULT_THRESHOLD_SECONDS = 0.5
+EXPLAIN_INTERVAL = timedelta(hours=1)
+EXPLAIN_TIMEOUT_MS = 30000
+QUEUE_SIZE = 1000
+# kept of each example statement and its parameters
+MAX_TEXT_LENGTH = 20000
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_EXPLAINABLE = re.compile(r"^\s*(?:SELECT|WITH)\b", re.IGNORECASE)
+
+
+def fingerprint_statement(statement: str) -> str:
+    """Statement text with literals and placeholder lists masked."""
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    return normalize_statement(statement)
+
+
+def _threshold_from_env() -> float:
+    try:
+        return float(
+            os.getenv("SLOW_QUERY_THRESHOLD_SECONDS", DEFAULT_THRESHOLD_SECONDS)
+        )
+    except ValueError:
+        return DEFAULT_THRESHOLD_SECONDS
+
+
+@dataclass(slots=True)
+class SlowStatement:
+    engine: Engine
+    statement: str
+    # rendered by the driver when it can, with the parameters inlined
+    rendered: Optional[str]
+    # the first parameter set of an executemany
+    parameters: Any
+    executemany: bool
+    seconds: float
+    seen_at: datetime
+
+
+def _format_sqlite_plan(rows) -> str:
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[node_id] + detail)
+    return "\n".join(lines)
+
+
+def _json_parameters(parameters) -> str:
+    return json.dumps(parameters, default=str)[:MAX_TEXT_LENGTH]
+
+
+class SlowQueryRecorder:
+    def __init__(self, threshold_seconds: float, background: bool = True):
+        # 0 turns recording off
+        self.threshold_seconds = threshold_seconds
+        # tests process the queue with drain() instead
+        self.background = background
+        self.dropped = 0
+        self._queue: "queue.Queue[SlowStatement]" = queue.Queue(QUEUE_SIZE)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def recording(self) -> bool:
+        return getattr(self._local, "recording", False)
+
+    def observe(
+        self, conn, cursor, statement, parameters, executemany, seconds
+    ) -> None:
+        if self.threshold_seconds <= 0 or seconds < self.threshold_seconds:
+            return
+        rendered = None
+        mogrify = getattr(cursor, "mogrify", None)
+        if mogrify is not None and not executemany:
+            try:
+                rendered = mogrify(statement, parameters).decode()
+            except Exception:
+                pass
+        if executemany:
+            # the first parameter set is enough of an example
+            parameters = parameters[0] if parameters else None
+        slow = SlowStatement(
+            engine=conn.engine,
+            statement=statement,
+            rendered=rendered,
+            parameters=parameters,
+            executemany=executemany,
+            seconds=seconds,
+            seen_at=datetime.utcnow(),
+        )
+        try:
+            self._queue.put_nowait(slow)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.background:
+            self._ensure_thread()
+
+    def _ensure_thread(self) -> None:
+        # threads do not survive the fork into gunicorn workers
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="slow-queries", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._record(self._queue.get())
+
+    def drain(self) -> None:
+        """Record the queued statements in this thread."""
+        while True:
+            try:
+                slow = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._record(slow)
+
+    def _record(self, slow: SlowStatement) -> None:
+        self._local.recording = True
+        try:
+            with slow.engine.connect() as connection:
+                self._store(connection, slow)
+        except Exception as e:
+            log.warning(f"Slow query recording failed: {e}")
+        finally:
+            self._local.recording = False
+
+    def _explain(self, connection, slow: SlowStatement) -> Optional[str]:
+        if slow.executemany:
+            return None
+        parameters = slow.parameters or None
+        try:
+            with connection.begin() as transaction:
+                if connection.dialect.name == "postgresql":
+                    if _EXPLAINABLE.match(slow.statement):
+                        connection.exec_driver_sql(
+                            f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}"
+                        )
+                        prefix = "EXPLAIN (ANALYZE, BUFFERS) "
+                    else:
+                        prefix = "EXPLAIN "
+                    rows = connection.exec_driver_sql(
+                        prefix + slow.statement, parameters
+                    ).fetchall()
+                    plan = "\n".join(row[0] for row in rows)
+                else:
+                    rows = connection.exec_driver_sql(
+                        "EXPLAIN QUERY PLAN " + slow.statement, parameters
+                    ).fetchall()
+                    plan = _format_sqlite_plan(rows)
+                transaction.rollback()
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
+        return plan
+
+    def _store(self, connection, slow: SlowStatement) -> None:
+        fingerprint_text = fingerprint_statement(slow.statement)
+        fingerprint = hashlib.sha1(fingerprint_text.encode()).hexdigest()
+
+        explained_at = connection.execute(
+            text(
+                "SELECT explained_at FROM slow_queries WHERE fingerprint = :fingerprint"
+            ).columns(explained_at=DateTime()),
+            {"fingerprint": fingerprint},
+        ).scalar()
+        connection.rollback()
+        plan = None
+        if explained_at is None or slow.seen_at - explained_at >= EXPLAIN_INTERVAL:
+            plan = self._explain(connection, slow)
+
+        with connection.begin():
+            connection.execute(
+                text(
+                    """
+                    INSERT INTO slow_queries (
+                        fingerprint, statement, example_statement,
+                        example_parameters, plan, calls, total_seconds,
+                        max_seconds, first_seen_at, last_seen_at, explained_at
+                    )
+                    VALUES (
+                        :fingerprint, :statement, :example_statement,
+                        :example_parameters, :plan, 1, :seconds,
+                        :seconds, :seen_at, :seen_at, :explained_at
+                    )
+                    ON CONFLICT (fingerprint) DO UPDATE SET
+                        calls = slow_queries.calls + 1,
+                        total_seconds = slow_queries.total_seconds
+                            + excluded.total_seconds,
+                        max_seconds = CASE
+                            WHEN excluded.max_seconds > slow_queries.max_seconds
+                            THEN excluded.max_seconds
+                            ELSE slow_queries.max_seconds
+                        END,
+                        example_statement = CASE
+                            WHEN excluded.max_seconds > slow_queries.max_seconds
+                            THEN excluded.example_statement
+                            ELSE slow_queries.example_statement
+                        END,
+                        example_parameters = CASE
+                            WHEN excluded.max_seconds > slow_queries.max_seconds
+                            THEN excluded.example_parameters
+                            ELSE slow_queries.example_parameters
+                        END,
+                        plan = COALESCE(excluded.plan, slow_queries.plan),
+                        explained_at = COALESCE(
+                            excluded.explained_at, slow_queries.explained_at
+                        ),
+                        last_seen_at = excluded.last_seen_at
+                    """
+                ).bindparams(
+                    bindparam("seen_at", type_=DateTime()),
+                    bindparam("explained_at", type_=DateTime()),
+                ),
+                {
+                    "fingerprint": fingerprint,
+                    "statement": fingerprint_text,
+                    "example_statement": (slow.rendered or slow.statement)[
+                        :MAX_TEXT_LENGTH
+                    ],
+                    "example_parameters": _json_parameters(slow.parameters),
+                    "plan": plan,
+                    "seconds": slow.seconds,
+                    "seen_at": slow.seen_at,
+                    "explained_at": slow.seen_at if plan is not None else None,
+                },
+            )
+
+
+recorder = SlowQueryRecorder(_threshold_from_env())
+
+
+def _observe_statement(conn, cursor, statement, parameters, executemany, seconds):
+    if has_request_context() and not recorder.recording:
+        recorder.observe(conn, cursor, statement, parameters, executemany, seconds)
+
+
+def init_slow_queries(app: Flask) -> None:
+    # only web requests are recorded; batch scripts import the app too
+    add_statement_observer(_observe_statement)
@@ -0,0 +1,56 @@
+import time
+from typing import Callable, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# One pair of engine events times every SQL statement for all the
+# instrumentation that needs statement times: the rating pipeline profile,
+# the per-request metrics and the slow statement recorder. Each registers an
+# observer, called after every statement with
+# (conn, cursor, statement, parameters, executemany, seconds).
+#
+# Start times are kept in conn.info, so they follow the connection. A
+# statement that fails has no after_cursor_execute, so handle_error pops its
+# start; otherwise a pooled connection would pair every later statement with
+# a stale start.
+
+StatementObserver = Callable[..., None]
+
+_STARTS = "statement_timing_starts"
+
+_observers: List[StatementObserver] = []
+
+
+def add_statement_observer(observer: StatementObserver) -> None:
+    """Call observer after every statement, once however often it is added."""
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+def remove_statement_observer(observer: StatementObserver) -> None:
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _observers:
+        conn.info.setdefault(_STARTS, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_STARTS)
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    for observer in list(_observers):
+        observer(conn, cursor, statement, parameters, executemany, seconds)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get(_STARTS):
+        conn.info[_STARTS].pop()
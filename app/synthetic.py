@@ -0,0 +1,547 @@
+import logging
+import math
+import random
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from constants import (
+    ADULT,
+    BLACK,
+    BLUE,
+    BROWN,
+    FEMALE,
+    GREEN,
+    GREY,
+    JUVENILE,
+    MALE,
+    MASTER_1,
+    MASTER_2,
+    MASTER_3,
+    MASTER_4,
+    MASTER_5,
+    MASTER_6,
+    MASTER_7,
+    OPEN_CLASS,
+    ORANGE,
+    PURPLE,
+    TEEN_1,
+    TEEN_2,
+    TEEN_3,
+    WHITE,
+    YELLOW,
+    weight_class_order,
+)
+from elo import WINNER_NOT_RECORDED
+from models import (
+    Athlete,
+    Division,
+    Event,
+    Match,
+    MatchParticipant,
+    Medal,
+    Suspension,
+    Team,
+)
+
+log = logging.getLogger("ibjjf")
+
+# Generates a tournament history shaped like the real one, for benchmarks and
+# tests that must not depend on production data. Athletes age through the age
+# divisions and get promoted, every event runs single elimination brackets per
+# division plus open classes, single entrants get default golds, and a few
+# athletes are suspended. The same config and seed give the same rows,
+# including ids.
+
+ADULT_BELTS = [WHITE, BLUE, PURPLE, BROWN, BLACK]
+ADULT_BELT_WEIGHTS = [40, 30, 15, 8, 7]
+TEEN_BELTS = [GREY, YELLOW, ORANGE, GREEN]
+TEEN_AGES = {13: TEEN_1, 14: TEEN_2, 15: TEEN_3}
+# the youngest age of each master division
+MASTER_AGES = [
+    (61, MASTER_7),
+    (56, MASTER_6),
+    (51, MASTER_5),
+    (46, MASTER_4),
+    (41, MASTER_3),
+    (36, MASTER_2),
+    (30, MASTER_1),
+]
+
+NO_SHOW_NOTE = "Disqualified by no show"
+# rows per INSERT batch
+BATCH_SIZE = 10000
+
+
+@dataclass
+class SyntheticConfig:
+    matches: int = 10000
+    seed: int = 1
+    # the history spans the years up to end, today by default, so the newest
+    # events fall inside the ranking activity period
+    end: Optional[datetime] = None
+    years: float = 10
+    registrations_per_event: int = 800
+    gi_rate: float = 0.7
+    female_rate: float = 0.25
+    teen_rate: float = 0.05
+    # masters that register in the adult division instead of their own
+    master_in_adult_rate: float = 0.25
+    promotion_rate: float = 0.04
+    open_class_rate: float = 0.25
+    medals_only_rate: float = 0.05
+    no_show_rate: float = 0.02
+    tie_rate: float = 0.005
+    winner_not_recorded_rate: float = 0.002
+    suspension_rate: float = 0.002
+
+    def start(self) -> datetime:
+        end = self.end or datetime.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        return end - timedelta(days=self.years * 365)
+
+    def athlete_count(self) -> int:
+        return max(64, self.matches // 5)
+
+    def team_count(self) -> int:
+        return max(8, self.athlete_count() // 40)
+
+
+@dataclass
+class SyntheticSummary:
+    events: int = 0
+    divisions: int = 0
+    teams: int = 0
+    athletes: int = 0
+    matches: int = 0
+    participants: int = 0
+    medals: int = 0
+    default_golds: int = 0
+    open_class_matches: int = 0
+    promotions: int = 0
+    suspensions: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class SyntheticAthlete:
+    id: uuid.UUID
+    name: str
+    team_id: uuid.UUID
+    gender: str
+    birth_year: int
+    belt: str
+    weight: int
+    skill: float
+
+
+@dataclass
+class _Rows:
+    teams: List[dict] = field(default_factory=list)
+    athletes: List[dict] = field(default_factory=list)
+    events: List[dict] = field(default_factory=list)
+    divisions: List[dict] = field(default_factory=list)
+    matches: List[dict] = field(default_factory=list)
+    match_participants: List[dict] = field(default_factory=list)
+    medals: List[dict] = field(default_factory=list)
+    suspensions: List[dict] = field(default_factory=list)
+
+
+# parents before children, so foreign keys hold at every batch
+TABLES = [
+    ("teams", Team),
+    ("athletes", Athlete),
+    ("events", Event),
+    ("divisions", Division),
+    ("matches", Match),
+    ("match_participants", MatchParticipant),
+    ("medals", Medal),
+    ("suspensions", Suspension),
+]
+
+
+class SyntheticHistory:
+    def __init__(self, session: Session, config: SyntheticConfig):
+        self.session = session
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.rows = _Rows()
+        self.summary = SyntheticSummary()
+        self.athletes: List[SyntheticAthlete] = []
+        self.division_ids: Dict[Tuple[bool, str, str, str, str], uuid.UUID] = {}
+
+    def new_id(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def flush(self, force: bool = False) -> None:
+        if not force and len(self.rows.match_participants) < BATCH_SIZE:
+            return
+        for name, model in TABLES:
+            rows = getattr(self.rows, name)
+            if rows:
+                self.session.execute(insert(model.__table__), rows)
+                rows.clear()
+
+    def generate(self) -> SyntheticSummary:
+        config = self.config
+        rng = self.rng
+        start = config.start()
+
+        team_ids = []
+        for index in range(config.team_count()):
+            team_id = self.new_id()
+            team_ids.append(team_id)
+            self.rows.teams.append(
+                {
+                    "id": team_id,
+                    "name": f"Synthetic Team {index}",
+                    "normalized_name": f"synthetic team {index}",
+                }
+            )
+        self.summary.teams = len(team_ids)
+
+        for index in range(config.athlete_count()):
+            teen = rng.random() < config.teen_rate
+            age = rng.randint(11, 14) if teen else int(rng.triangular(16, 58, 24))
+            belt = (
+                rng.choice(TEEN_BELTS)
+                if teen
+                else rng.choices(ADULT_BELTS, ADULT_BELT_WEIGHTS)[0]
+            )
+            athlete = SyntheticAthlete(
+                self.new_id(),
+                f"Synthetic Athlete {index}",
+                rng.choice(team_ids),
+                FEMALE if rng.random() < config.female_rate else MALE,
+                start.year - age,
+                belt,
+                min(max(int(rng.gauss(4, 2)), 0), len(weight_class_order) - 1),
+                (
+                    rng.gauss(0, 1) + 0.5 * ADULT_BELTS.index(belt)
+                    if belt in ADULT_BELTS
+                    else rng.gauss(0, 1)
+                ),
+            )
+            self.athletes.append(athlete)
+            self.rows.athletes.append(
+                {
+                    "id": athlete.id,
+                    "name": athlete.name,
+                    "normalized_name": athlete.name.lower(),
+                    "slug": f"synthetic-athlete-{index}",
+                }
+            )
+        self.summary.athletes = len(self.athletes)
+
+        for athlete in rng.sample(
+            self.athletes,
+            max(1, int(len(self.athletes) * config.suspension_rate)),
+        ):
+            suspended_at = start + timedelta(days=rng.uniform(0, config.years * 365))
+            self.rows.suspensions.append(
+                {
+                    "id": self.new_id(),
+                    "athlete_name": athlete.name,
+                    "start_date": suspended_at,
+                    "end_date": suspended_at + timedelta(days=730),
+                    "reason": "Synthetic",
+                }
+            )
+            self.summary.suspensions += 1
+
+        # the remaining time is split evenly between the events still needed,
+        # estimated from the matches per event so far, so the last event lands
+        # on the end date
+        end = start + timedelta(days=config.years * 365)
+        happened_at = start
+        event_index = 0
+        while self.summary.matches < config.matches:
+            self.event(event_index, happened_at)
+            event_index += 1
+            self.flush()
+            remaining_events = math.ceil(
+                (config.matches - self.summary.matches)
+                * event_index
+                / max(1, self.summary.matches)
+            )
+            if remaining_events > 0:
+                happened_at += (end - happened_at) / remaining_events
+        self.flush(force=True)
+
+        self.summary.events = event_index
+        self.summary.divisions = len(self.division_ids)
+        log.info(
+            f"Generated {self.summary.matches} synthetic matches in "
+            f"{self.summary.events} events"
+        )
+        return self.summary
+
+    def division_id(self, gi: bool, gender: str, age: str, belt: str, weight: str):
+        key = (gi, gender, age, belt, weight)
+        division_id = self.division_ids.get(key)
+        if division_id is None:
+            division_id = self.division_ids[key] = self.new_id()
+            self.rows.divisions.append(
+                {
+                    "id": division_id,
+                    "gi": gi,
+                    "gender": gender,
+                    "age": age,
+                    "belt": belt,
+                    "weight": weight,
+                }
+            )
+        return division_id
+
+    def age_division(self, athlete: SyntheticAthlete, year: int) -> Optional[str]:
+        age = year - athlete.birth_year
+        if age < 13:
+            return None
+        if age in TEEN_AGES:
+            return TEEN_AGES[age]
+        if age < 18:
+            return JUVENILE
+        if self.rng.random() >= self.config.master_in_adult_rate:
+            for youngest, division_age in MASTER_AGES:
+                if age >= youngest:
+                    return division_age
+        return ADULT
+
+    def promote(self, athlete: SyntheticAthlete, year: int) -> None:
+        if year - athlete.birth_year >= 16 and athlete.belt in TEEN_BELTS:
+            # teens move to adult belts when they age out
+            athlete.belt = BLUE if athlete.belt == GREEN else WHITE
+            self.summary.promotions += 1
+        elif self.rng.random() < self.config.promotion_rate:
+            belts = TEEN_BELTS if athlete.belt in TEEN_BELTS else ADULT_BELTS
+            if year - athlete.birth_year < 18 and athlete.belt == PURPLE:
+                # purple is the highest juvenile belt
+                belts = belts[: belts.index(PURPLE) + 1]
+            index = belts.index(athlete.belt)
+            if index + 1 < len(belts):
+                athlete.belt = belts[index + 1]
+                athlete.skill += 0.5
+                self.summary.promotions += 1
+
+    def event(self, index: int, happened_at: datetime) -> None:
+        config = self.config
+        rng = self.rng
+        event_id = self.new_id()
+        medals_only = rng.random() < config.medals_only_rate
+        self.rows.events.append(
+            {
+                "id": event_id,
+                "name": f"Synthetic Open {index}",
+                "normalized_name": f"synthetic open {index}",
+                "slug": f"synthetic-open-{index}",
+                "medals_only": medals_only,
+            }
+        )
+        gi = rng.random() < config.gi_rate
+
+        entrants: Dict[Tuple[str, str, str], Dict[int, List[SyntheticAthlete]]] = {}
+        for athlete in rng.sample(
+            self.athletes, min(len(self.athletes), config.registrations_per_event)
+        ):
+            self.promote(athlete, happened_at.year)
+            age = self.age_division(athlete, happened_at.year)
+            if age is None:
+                continue
+            entrants.setdefault((athlete.gender, age, athlete.belt), {}).setdefault(
+                athlete.weight, []
+            ).append(athlete)
+
+        start = happened_at.replace(hour=9, minute=0, second=0, microsecond=0)
+        for offset, ((gender, age, belt), weights) in enumerate(
+            sorted(entrants.items())
+        ):
+            division_start = start + timedelta(minutes=3 * offset)
+            open_class = []
+            for weight, athletes in sorted(weights.items()):
+                self.bracket(
+                    event_id,
+                    self.division_id(gi, gender, age, belt, weight_class_order[weight]),
+                    division_start,
+                    athletes,
+                    medals_only,
+                )
+                open_class.extend(
+                    athlete
+                    for athlete in athletes
+                    if rng.random() < config.open_class_rate
+                )
+            if len(open_class) > 1:
+                # open classes run in the afternoon, after the weight divisions
+                self.summary.open_class_matches += self.bracket(
+                    event_id,
+                    self.division_id(gi, gender, age, belt, OPEN_CLASS),
+                    division_start + timedelta(hours=6),
+                    open_class,
+                    medals_only,
+                )
+
+    def bracket(
+        self,
+        event_id: uuid.UUID,
+        division_id: uuid.UUID,
+        start: datetime,
+        athletes: List[SyntheticAthlete],
+        medals_only: bool,
+    ) -> int:
+        rng = self.rng
+        entrants = list(athletes)
+        rng.shuffle(entrants)
+        seeds = {athlete.id: seed for seed, athlete in enumerate(entrants, 1)}
+        happened_at = start
+
+        if len(entrants) == 1:
+            self.medal(event_id, division_id, happened_at, entrants[0], 1, True)
+            return 0
+
+        matches = 0
+        bronze = []
+        round_entrants = list(entrants)
+        while len(round_entrants) > 1:
+            size = len(round_entrants)
+            final = size == 2
+            next_round = []
+            if size % 2:
+                # the last entrant gets a bye
+                next_round.append(round_entrants.pop())
+            for red, blue in zip(round_entrants[::2], round_entrants[1::2]):
+                happened_at += timedelta(minutes=rng.choice((0, 6, 7, 13)))
+                winner, loser = self.play(red, blue)
+                if not medals_only or final:
+                    self.match(
+                        event_id,
+                        division_id,
+                        happened_at,
+                        red,
+                        blue,
+                        winner,
+                        seeds,
+                        len(entrants),
+                        medals_only,
+                    )
+                    matches += 1
+                next_round.append(winner)
+                if final:
+                    self.medal(event_id, division_id, happened_at, winner, 1)
+                    self.medal(event_id, division_id, happened_at, loser, 2)
+                elif size <= 4:
+                    bronze.append(loser)
+            round_entrants = next_round
+            happened_at += timedelta(minutes=30)
+
+        for athlete in bronze:
+            self.medal(event_id, division_id, happened_at, athlete, 3)
+        return matches
+
+    def play(
+        self, red: SyntheticAthlete, blue: SyntheticAthlete
+    ) -> Tuple[SyntheticAthlete, SyntheticAthlete]:
+        red_wins = 1 / (1 + math.exp(blue.skill - red.skill))
+        if self.rng.random() < red_wins:
+            return red, blue
+        return blue, red
+
+    def match(
+        self,
+        event_id: uuid.UUID,
+        division_id: uuid.UUID,
+        happened_at: datetime,
+        red: SyntheticAthlete,
+        blue: SyntheticAthlete,
+        winner: SyntheticAthlete,
+        seeds: Dict[uuid.UUID, int],
+        division_size: int,
+        medals_only: bool,
+    ) -> None:
+        config = self.config
+        rng = self.rng
+        match_id = self.new_id()
+        self.rows.matches.append(
+            {
+                "id": match_id,
+                "happened_at": happened_at,
+                "event_id": event_id,
+                "division_id": division_id,
+                "rated": True,
+                "rated_winner_only": medals_only,
+                "division_size": division_size,
+            }
+        )
+        self.summary.matches += 1
+
+        winners = {winner.id}
+        notes: Dict[uuid.UUID, str] = {}
+        roll = rng.random()
+        if roll < config.no_show_rate:
+            loser = blue if winner is red else red
+            notes[loser.id] = NO_SHOW_NOTE
+        elif roll < config.no_show_rate + config.tie_rate:
+            winners = set()
+        elif (
+            roll
+            < config.no_show_rate + config.tie_rate + config.winner_not_recorded_rate
+        ):
+            winners = set()
+            notes[red.id] = WINNER_NOT_RECORDED
+
+        for athlete, is_red in ((red, True), (blue, False)):
+            self.rows.match_participants.append(
+                {
+                    "id": self.new_id(),
+                    "match_id": match_id,
+                    "athlete_id": athlete.id,
+                    "team_id": athlete.team_id,
+                    "seed": seeds[athlete.id],
+                    "red": is_red,
+                    "winner": athlete.id in winners,
+                    "note": notes.get(athlete.id),
+                    "start_rating": 0.0,
+                    "end_rating": 0.0,
+                    "start_match_count": 0,
+                    "end_match_count": 0,
+                }
+            )
+            self.summary.participants += 1
+
+    def medal(
+        self,
+        event_id: uuid.UUID,
+        division_id: uuid.UUID,
+        happened_at: datetime,
+        athlete: SyntheticAthlete,
+        place: int,
+        default_gold: bool = False,
+    ) -> None:
+        self.rows.medals.append(
+            {
+                "id": self.new_id(),
+                "happened_at": happened_at,
+                "event_id": event_id,
+                "division_id": division_id,
+                "athlete_id": athlete.id,
+                "team_id": athlete.team_id,
+                "place": place,
+                "default_gold": default_gold,
+            }
+        )
+        self.summary.medals += 1
+        if default_gold:
+            self.summary.default_golds += 1
+
+
+def generate_synthetic_history(
+    session: Session, config: Optional[SyntheticConfig] = None
+) -> SyntheticSummary:
+    """Insert a synthetic tournament history, without committing."""
+    return SyntheticHistory(session, config or SyntheticConfig()).generate()
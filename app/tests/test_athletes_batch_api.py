@@ -5,7 +5,10 @@ from datetime import datetime
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from sqlalchemy import event
+
 from constants import ADULT, BLACK, BROWN, LIGHT, MALE
+from current import refresh_latest_ratings
 from elo import BLACK_PROMOTION_RATING_BUMP, RATING_VERY_IMMATURE_COUNT
 from extensions import db
 from models import (
@@ -252,6 +255,9 @@ class AthletesBatchApiTestCase(TestDbMixin, unittest.TestCase):
         )
         db.session.add(future_registration_competitor)
         db.session.commit()
+        # as generate_current_ratings leaves it for the board rows above
+        refresh_latest_ratings(db.session, "athlete_ratings", "true, false")
+        db.session.commit()
 
     def setUp(self):
         self.client = self.app_module.app.test_client()
@@ -357,6 +363,29 @@ class AthletesBatchApiTestCase(TestDbMixin, unittest.TestCase):
         self.assertEqual(data[0]["nogi-rating"], 1510.0 + BLACK_PROMOTION_RATING_BUMP)
         self.assertEqual(data[0]["provisional"], True)
 
+    def count_batch_queries(self, ibjjf_ids):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app_module.app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            response = self.client.post("/api/athletes/batch", json=ibjjf_ids)
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def test_batch_lookup_query_count_does_not_grow_with_athletes(self):
+        # both need the fallback, D4 for gi and no-gi and C3 for no-gi
+        self.assertEqual(
+            self.count_batch_queries(["D4"]),
+            self.count_batch_queries(["A1", "B2", "C3", "D4", "MISSING"]),
+        )
+
     def test_batch_lookup_requires_json_array_of_strings(self):
         response = self.client.post(
             "/api/athletes/batch",
@@ -0,0 +1,166 @@
+import os
+import random
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+
+from backtest import (
+    CALIBRATION_BUCKETS,
+    EloParameters,
+    backtest,
+    expected_scores,
+    load_backtest_history,
+    parameter_grid,
+    replay_history,
+    run_backtest,
+)
+from constants import ADULT, BLUE, MALE
+from elo import COLOR_PROMOTION_RATING_BUMP, EloCompetitor
+from extensions import db
+from models import Division, Match, MatchParticipant, RatingCheckpoint
+from ratings import recompute_all_ratings
+from replay import load_suspensions_by_id
+from test_db import TestDbMixin
+from test_replay import restore, seed_history, snapshot
+
+
+class BacktestTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        seed_history(random.Random(4321))
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        self.initial = snapshot()
+
+    def tearDown(self):
+        restore(self.initial)
+        db.session.query(RatingCheckpoint).delete()
+        db.session.commit()
+        db.session.remove()
+        self.ctx.pop()
+
+    def recompute(self):
+        # a second pass settles the rated flags get_weight reads from later
+        # matches of the same event
+        for _ in range(2):
+            recompute_all_ratings(db, True, rerank=False)
+            db.session.commit()
+        db.session.expire_all()
+
+    def last_ratings(self, gender):
+        last = {}
+        for athlete_id, end_rating in (
+            db.session.query(MatchParticipant.athlete_id, MatchParticipant.end_rating)
+            .join(Match)
+            .join(Division)
+            .filter(Division.gi == True, Division.gender == gender)
+            .order_by(Match.happened_at, Match.id)
+        ):
+            last[athlete_id] = end_rating
+        return last
+
+    def test_current_parameters_reproduce_stored_ratings(self):
+        self.recompute()
+        history = load_backtest_history(
+            db.session, True, MALE, load_suspensions_by_id(db.session)
+        )
+        self.assertGreater(len(history), 0)
+
+        ratings = replay_history(history, [EloParameters.current()])
+        expected = self.last_ratings(MALE)
+        self.assertEqual(set(history.athlete_ids), set(expected))
+        for slot, athlete_id in enumerate(history.athlete_ids):
+            self.assertAlmostEqual(
+                ratings[slot, 0], expected[athlete_id], places=6, msg=str(athlete_id)
+            )
+
+    def test_parameter_sets_replay_side_by_side(self):
+        self.recompute()
+        history = load_backtest_history(
+            db.session, True, MALE, load_suspensions_by_id(db.session)
+        )
+        grid = parameter_grid(
+            [
+                {"name": "no bumps", "color_promotion_rating_bump": 0},
+                {"default_ratings": {BLUE: {ADULT: 1500}}},
+            ]
+        )
+        self.assertEqual([p.name for p in grid], ["current", "no bumps", "grid-2"])
+        self.assertEqual(
+            grid[0].color_promotion_rating_bump, COLOR_PROMOTION_RATING_BUMP
+        )
+
+        together = replay_history(history, grid)
+        for index, parameters in enumerate(grid):
+            alone = replay_history(history, [parameters])
+            np.testing.assert_array_equal(together[:, index], alone[:, 0])
+        self.assertFalse(np.array_equal(together[:, 0], together[:, 1]))
+
+    def test_metrics_and_parallel_backtest(self):
+        self.recompute()
+        grid = parameter_grid(
+            [{"age_k_factor_modifiers": {ADULT: 0.5}}, {"name": "same as current"}]
+        )
+        evaluate_from = datetime(2019, 1, 1)
+        serial = backtest(db.session, [True], grid, evaluate_from=evaluate_from)
+        parallel = backtest(
+            db.session, [True], grid, jobs=2, evaluate_from=evaluate_from
+        )
+        for one, other in zip(serial, parallel):
+            self.assertEqual(one.name, other.name)
+            self.assertEqual(one.matches, other.matches)
+            self.assertEqual(one.bucket_matches, other.bucket_matches)
+            self.assertAlmostEqual(one.log_loss, other.log_loss, places=9)
+            self.assertAlmostEqual(one.brier_score, other.brier_score, places=9)
+
+        current, halved, same = serial
+        self.assertGreater(current.matches, 0)
+        self.assertEqual(sum(current.bucket_matches), current.matches)
+        self.assertAlmostEqual(current.log_loss, same.log_loss, places=12)
+        self.assertNotEqual(current.log_loss, halved.log_loss)
+        self.assertGreater(current.log_loss, 0)
+        self.assertTrue(0 < current.brier_score < 1)
+        self.assertEqual(len(current.to_dict()["calibration"]), CALIBRATION_BUCKETS)
+
+        everything = run_backtest(
+            load_backtest_history(
+                db.session, True, MALE, load_suspensions_by_id(db.session)
+            ),
+            grid[:1],
+        )[0]
+        male_from = run_backtest(
+            load_backtest_history(
+                db.session, True, MALE, load_suspensions_by_id(db.session)
+            ),
+            grid[:1],
+            evaluate_from,
+        )[0]
+        self.assertLess(male_from.matches, everything.matches)
+
+    def test_expected_scores_match_elo_competitor(self):
+        red = np.array([1400.0, 1823.5, 0.0])
+        blue = np.array([1400.0, 1600.25, 2000.0])
+        for index, score in enumerate(expected_scores(red, blue)):
+            self.assertAlmostEqual(
+                score,
+                EloCompetitor(red[index]).expected_score(EloCompetitor(blue[index])),
+                places=12,
+            )
+
+    def test_rejects_unknown_parameters(self):
+        with self.assertRaises(ValueError):
+            parameter_grid([{"k_factor": 10}])
+        with self.assertRaises(ValueError):
+            parameter_grid([{"black_weight_handicaps": [0, 1]}])
+        with self.assertRaises(ValueError):
+            parameter_grid([{"name": "current"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,6 +19,9 @@ def setup_test_app():
         TESTING=True,
         SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}",
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        RESPONSE_CACHE_PATH=os.path.join(temp_dir, "response_cache.sqlite3"),
+        RATE_LIMIT_PATH=os.path.join(temp_dir, "rate_limits.sqlite3"),
+        METRICS_PATH=os.path.join(temp_dir, "request_metrics.sqlite3"),
     )
     with app_module.app.app_context():
         sqlalchemy_ext = app_module.app.extensions.get("sqlalchemy")
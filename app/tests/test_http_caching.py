@@ -0,0 +1,160 @@
+import os
+import sys
+import time
+import unittest
+import uuid
+from datetime import datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from extensions import db
+from http_caching import CachePolicy
+from models import Athlete, AthleteRating, RankingGeneration
+from test_db import TestDbMixin
+
+TOP_URL = "/api/top?gender=Male&age=Adult&belt=BLACK&gi=true"
+
+
+def new_generation(gi):
+    return RankingGeneration(
+        gi=gi,
+        generated_at=datetime.now(),
+        activity_period=datetime.now(),
+        previous_date=datetime.now(),
+        fingerprint="",
+        generation_id=uuid.uuid4(),
+    )
+
+
+@mock.patch("routes.top.get_s3_client", return_value=None)
+class ConditionalGetTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        athlete = Athlete(
+            name="Conditional Athlete",
+            normalized_name="conditional athlete",
+            slug="conditional-athlete",
+        )
+        db.session.add(athlete)
+        db.session.flush()
+        db.session.add(
+            AthleteRating(
+                athlete_id=athlete.id,
+                gender="Male",
+                age="Adult",
+                belt="BLACK",
+                gi=True,
+                weight="",
+                rating=1650.0,
+                match_happened_at=datetime.now(),
+                rank=1,
+                percentile=1.0,
+                match_count=10,
+            )
+        )
+        db.session.add_all([new_generation(True), new_generation(False)])
+        db.session.commit()
+
+    def setUp(self):
+        self.client = self.app_module.app.test_client()
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.app_module.app.config.pop("HTTP_CACHE_POLICIES", None)
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_matching_etag_is_answered_without_the_view(self, _mock_s3):
+        response = self.client.get(TOP_URL)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertEqual(
+            response.headers["Cache-Control"],
+            "public, max-age=60, stale-while-revalidate=300",
+        )
+        self.assertNotIn("Pragma", response.headers)
+
+        with mock.patch("routes.top.top") as view:
+            for if_none_match in (etag, f"W/{etag}", f'"other", {etag}'):
+                response = self.client.get(
+                    TOP_URL, headers={"If-None-Match": if_none_match}
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.headers["ETag"], etag)
+                self.assertEqual(response.data, b"")
+            view.assert_not_called()
+
+        other_page = self.client.get(
+            f"{TOP_URL}&page=2", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(other_page.status_code, 200)
+
+    def test_new_generation_changes_etag(self, _mock_s3):
+        etag = self.client.get(TOP_URL).headers["ETag"]
+        generation = db.session.get(RankingGeneration, True)
+        old_generation_id = generation.generation_id
+        generation.generation_id = uuid.uuid4()
+        db.session.commit()
+        try:
+            response = self.client.get(TOP_URL, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+        finally:
+            generation.generation_id = old_generation_id
+            db.session.commit()
+
+    def test_next_window_changes_etag(self, _mock_s3):
+        etag = self.client.get(TOP_URL).headers["ETag"]
+        with mock.patch("http_caching.time.time", return_value=time.time() + 600):
+            response = self.client.get(TOP_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_policy_is_configurable_per_blueprint(self, _mock_s3):
+        self.app_module.app.config["HTTP_CACHE_POLICIES"] = {
+            "top_route": CachePolicy(max_age=5, stale_while_revalidate=10, window=60)
+        }
+        response = self.client.get(TOP_URL)
+        self.assertEqual(
+            response.headers["Cache-Control"],
+            "public, max-age=5, stale-while-revalidate=10",
+        )
+        rank_history = self.client.get("/api/athlete/conditional-athlete/rank-history")
+        self.assertEqual(
+            rank_history.headers["Cache-Control"],
+            "public, max-age=60, stale-while-revalidate=300",
+        )
+
+    def test_errors_and_unversioned_boards_are_not_stored(self, _mock_s3):
+        response = self.client.get("/api/top?gender=Male")
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("ETag", response.headers)
+        self.assertIn("no-store", response.headers["Cache-Control"])
+
+        generation = db.session.get(RankingGeneration, False)
+        generation_id = generation.generation_id
+        generation.generation_id = None
+        db.session.commit()
+        try:
+            response = self.client.get(TOP_URL)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("ETag", response.headers)
+            self.assertIn("no-store", response.headers["Cache-Control"])
+        finally:
+            generation.generation_id = generation_id
+            db.session.commit()
+
+    def test_match_list_is_not_stored(self, _mock_s3):
+        # matches change between generations, so the generation ids cannot
+        # tell whether the list changed
+        with mock.patch("routes.matches.get_s3_client", return_value=None):
+            response = self.client.get("/api/matches?gi=true")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response.headers)
+        self.assertIn("no-store", response.headers["Cache-Control"])
+
+
+if __name__ == "__main__":
+    unittest.main()
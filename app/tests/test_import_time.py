@@ -0,0 +1,89 @@
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from warmup import LAZY_MODULES, warm_up
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# cumulative import time of the app module, generous for slow CI machines;
+# importing the lazy dependencies alone adds about half of it again
+DEFAULT_IMPORT_TIME_BUDGET_SECONDS = 2.5
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_app(**env):
+    """Import times by module, in microseconds, of a fresh `import app`."""
+    process_env = {
+        name: value for name, value in os.environ.items() if name != "WARMUP_MODULES"
+    }
+    process_env.update(env)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=APP_DIR,
+        env=process_env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    if result.returncode != 0:
+        raise AssertionError(result.stderr)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def imported(times, name):
+    """Whether the package of name shows up among the imported modules.
+
+    Modules loaded with importlib.import_module, as warm_up does, are not
+    reported by -X importtime themselves, only the submodules they import.
+    """
+    package = name.split(".")[0]
+    return any(
+        module == package or module.startswith(package + ".") for module in times
+    )
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    def test_heavy_dependencies_are_not_imported(self):
+        times = import_app()
+        for name in LAZY_MODULES:
+            with self.subTest(module=name):
+                self.assertFalse(imported(times, name))
+
+    def test_import_time_budget(self):
+        budget = float(
+            os.getenv("IMPORT_TIME_BUDGET_SECONDS", DEFAULT_IMPORT_TIME_BUDGET_SECONDS)
+        )
+        # the best of three, to keep a busy machine from failing the test
+        seconds = min(import_app()["app"] for _ in range(3)) / 1e6
+        self.assertLess(seconds, budget)
+
+    def test_warm_up_imports_only_when_asked(self):
+        times = import_app(WARMUP_MODULES="bs4, numpy")
+        self.assertTrue(imported(times, "bs4"))
+        self.assertTrue(imported(times, "numpy"))
+        self.assertFalse(imported(times, "boto3"))
+
+        times = import_app(WARMUP_MODULES="all")
+        for name in LAZY_MODULES:
+            with self.subTest(module=name):
+                self.assertTrue(imported(times, name))
+
+    def test_warm_up_skips_missing_modules(self):
+        self.assertEqual(warm_up(None), [])
+        with self.assertLogs("ibjjf", "WARNING"):
+            self.assertEqual(warm_up("json,no_such_module"), ["json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,353 @@
+import os
+import sys
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "scripts")),
+)
+
+from sqlalchemy import func, text
+
+from current import generate_current_ratings
+from extensions import db
+from models import (
+    AthleteLatestRating,
+    AthleteRating,
+    AthleteRatingAverage,
+    Division,
+    ManualPromotions,
+    Match,
+    RankingDirtyAthlete,
+    RankingGeneration,
+)
+from ranking_generations import clear_ranking_generations, ranking_generation_id
+from ratings import recompute_all_ratings
+from recompute_benchmark import flip_winner, rescore_flipped
+from synthetic import SyntheticConfig, generate_synthetic_history
+from test_db import TestDbMixin
+from test_replay import restore, snapshot
+
+from delete_match import delete_match
+
+
+def board_rows():
+    return sorted(
+        (
+            str(row.athlete_id),
+            row.gender,
+            row.age,
+            row.belt,
+            row.gi,
+            row.weight or "",
+            row.rating,
+            row.match_count,
+            row.rank,
+            row.percentile,
+            row.previous_rating,
+            row.previous_rank,
+            row.previous_match_count,
+            row.previous_percentile,
+        )
+        for row in db.session.query(AthleteRating)
+    )
+
+
+def board_averages():
+    return {
+        (row.gender, row.age, row.belt, row.gi, row.weight): row.avg_rating
+        for row in db.session.query(AthleteRatingAverage)
+    }
+
+
+def latest_rating_choices():
+    # the ratings of each athlete's most recent board rows
+    rows = {}
+    for row in db.session.query(AthleteRating):
+        latest = rows.setdefault((row.athlete_id, row.gi), [row])
+        if row.match_happened_at > latest[0].match_happened_at:
+            rows[(row.athlete_id, row.gi)] = [row]
+        elif (
+            row.match_happened_at == latest[0].match_happened_at
+            and row is not latest[0]
+        ):
+            latest.append(row)
+    return {
+        key: {(row.rating, row.match_count) for row in latest}
+        for key, latest in rows.items()
+    }
+
+
+def seed_history():
+    """A rated synthetic history, returning the time of its last gi match."""
+    # boards only show the last 13 months, so the history ends today
+    generate_synthetic_history(
+        db.session, SyntheticConfig(matches=600, seed=11, end=datetime.now())
+    )
+    db.session.commit()
+    for gi in (True, False):
+        recompute_all_ratings(db, gi, rerank=False)
+    db.session.commit()
+    return (
+        db.session.query(func.max(Match.happened_at))
+        .join(Division)
+        .filter(Division.gi == True)
+        .scalar()
+    )
+
+
+class IncrementalRankingTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        cls.last_gi_match_at = seed_history()
+        # changes from the previous ranking date on are rebuilt incrementally,
+        # so compare against a date before the last gi event
+        cls.previous_date = cls.last_gi_match_at - timedelta(days=1)
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        self.initial = snapshot()
+        self.flipped = None
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+
+    def tearDown(self):
+        if self.flipped is not None:
+            # flipping the same match again restores its winner
+            flip_winner(db.session, self.flipped.happened_at + timedelta(seconds=1))
+        restore(self.initial)
+        db.session.query(RankingDirtyAthlete).delete()
+        db.session.query(ManualPromotions).delete()
+        db.session.commit()
+        db.session.remove()
+        self.ctx.pop()
+
+    def flip_last_gi_match(self):
+        self.flipped = flip_winner(
+            db.session, self.last_gi_match_at + timedelta(seconds=1)
+        )
+        rescore_flipped(db, self.flipped)
+        db.session.commit()
+
+    def test_incremental_matches_full_regeneration(self):
+        self.flip_last_gi_match()
+        self.assertGreater(db.session.query(RankingDirtyAthlete).count(), 0)
+        before = board_rows()
+
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertTrue(regeneration.incremental)
+        self.assertGreaterEqual(regeneration.athletes, 2)
+        self.assertGreater(regeneration.boards, 0)
+        self.assertEqual(db.session.query(RankingDirtyAthlete).count(), 0)
+        incremental = board_rows()
+        incremental_averages = board_averages()
+        self.assertNotEqual(before, incremental)
+
+        regeneration = generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        self.assertFalse(regeneration.incremental)
+        self.assertEqual(incremental, board_rows())
+        full_averages = board_averages()
+        self.assertEqual(set(incremental_averages), set(full_averages))
+        for key, average in full_averages.items():
+            self.assertAlmostEqual(incremental_averages[key], average)
+
+    def test_previous_columns_come_from_the_snapshot(self):
+        self.flip_last_gi_match()
+        # rows written against an older snapshot, before it rolled over to
+        # previous_date, carry that week's previous columns
+        touched = [participant.athlete_id for participant in self.flipped.participants]
+        db.session.query(AthleteRating).filter(
+            AthleteRating.athlete_id.in_(touched)
+        ).update(
+            {
+                AthleteRating.previous_rating: 1000.0,
+                AthleteRating.previous_rank: 999,
+                AthleteRating.previous_match_count: 1,
+                AthleteRating.previous_percentile: 1.0,
+            },
+            synchronize_session=False,
+        )
+        db.session.commit()
+
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertTrue(regeneration.incremental)
+        incremental = board_rows()
+
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        self.assertEqual(incremental, board_rows())
+
+    def assertLatestRatingsMatchBoard(self):
+        latest = {
+            (row.athlete_id, row.gi): (row.rating, row.match_count)
+            for row in db.session.query(AthleteLatestRating)
+        }
+        choices = latest_rating_choices()
+        self.assertEqual(set(latest), set(choices))
+        for key, rating in latest.items():
+            self.assertIn(rating, choices[key])
+
+    def test_latest_ratings_follow_board(self):
+        self.assertLatestRatingsMatchBoard()
+        self.flip_last_gi_match()
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertTrue(regeneration.incremental)
+        self.assertLatestRatingsMatchBoard()
+
+    def test_nothing_changed(self):
+        before = board_rows()
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertTrue(regeneration.incremental)
+        self.assertEqual(before, board_rows())
+
+    def test_falls_back_without_generation(self):
+        clear_ranking_generations(db.session)
+        self.flip_last_gi_match()
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertFalse(regeneration.incremental)
+        self.assertEqual(db.session.query(RankingGeneration).count(), 2)
+
+    def test_falls_back_when_a_promotion_is_edited(self):
+        athlete_id = db.session.query(AthleteRating.athlete_id).first()[0]
+        promotion = ManualPromotions(
+            athlete_id=athlete_id,
+            belt="BROWN",
+            promoted_at=self.previous_date - timedelta(days=30),
+        )
+        db.session.add(promotion)
+        db.session.commit()
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+
+        # the edit keeps the number of promotions and the latest promotion date
+        promotion.belt = "BLACK"
+        db.session.commit()
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertFalse(regeneration.incremental)
+
+    def test_falls_back_for_changes_before_previous_date(self):
+        self.flip_last_gi_match()
+        db.session.query(RankingDirtyAthlete).update(
+            {RankingDirtyAthlete.happened_at: datetime.now() - timedelta(days=400)}
+        )
+        db.session.commit()
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertFalse(regeneration.incremental)
+        self.assertEqual(db.session.query(RankingDirtyAthlete).count(), 0)
+
+    def test_full_regeneration_swaps_in_board(self):
+        nogi_rows = [row for row in board_rows() if not row[4]]
+        generation_id = ranking_generation_id(db.session, True)
+
+        regeneration = generate_current_ratings(db, True, False, self.previous_date)
+        db.session.commit()
+        self.assertFalse(regeneration.incremental)
+        self.assertEqual(
+            regeneration.generation_id, ranking_generation_id(db.session, True)
+        )
+        self.assertNotEqual(regeneration.generation_id, generation_id)
+        self.assertEqual(ranking_generation_id(db.session, False), generation_id)
+
+        # the no-gi rows are carried into the swapped-in board
+        self.assertEqual(nogi_rows, [row for row in board_rows() if not row[4]])
+        schema = {
+            name: table
+            for name, table in db.session.execute(
+                text("SELECT name, tbl_name FROM sqlite_master")
+            )
+        }
+        self.assertNotIn("athlete_ratings_shadow", schema)
+        for index in AthleteRating.__table__.indexes:
+            self.assertEqual(schema[index.name], "athlete_ratings")
+
+    def test_per_match_path_forces_full_regeneration(self):
+        recompute_all_ratings(db, True, rerank=False, replay=False)
+        db.session.commit()
+        self.assertEqual(db.session.query(RankingGeneration).count(), 0)
+
+
+class DeleteMatchTestCase(TestDbMixin, unittest.TestCase):
+    # deleting a match cannot be undone, so it gets a history of its own
+
+    @classmethod
+    def _seed_data(cls):
+        cls.previous_date = seed_history() - timedelta(days=1)
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_deleting_a_last_match_regenerates_its_athletes(self):
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        # the last rated gi match is the last match of both its athletes, so
+        # no later row of theirs is rescored
+        match = (
+            db.session.query(Match)
+            .join(Division)
+            .filter(Division.gi == True, Match.rated == True)
+            .order_by(Match.happened_at.desc(), Match.id.desc())
+            .first()
+        )
+        touched = {participant.athlete_id for participant in match.participants}
+        before = [row for row in board_rows() if uuid.UUID(row[0]) in touched]
+        self.assertTrue(before)
+
+        delete_match(db, match)
+        db.session.commit()
+        self.assertEqual(
+            {
+                (row.gi, row.athlete_id)
+                for row in db.session.query(RankingDirtyAthlete)
+                if row.athlete_id in touched
+            },
+            {(gi, athlete_id) for gi in (True, False) for athlete_id in touched},
+        )
+
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertTrue(regeneration.incremental)
+        incremental = board_rows()
+        self.assertNotEqual(
+            before, [row for row in incremental if uuid.UUID(row[0]) in touched]
+        )
+
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        self.assertEqual(incremental, board_rows())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import os
 import sys
 import unittest
+import uuid
 from datetime import datetime
 from unittest import mock
 
@@ -29,6 +30,7 @@ from models import (
     MatchParticipant,
     Team,
 )
+from routes.matches import encode_match_cursor
 from test_db import TestDbMixin
 
 
@@ -872,6 +874,64 @@ class MatchesApiTestCase(TestDbMixin, unittest.TestCase):
         self.assertIn("Disqualified by technical desc.", all_notes)
         self.assertIn("Disqualified by disciplinary desc.", all_notes)
 
+    @mock.patch("routes.matches.MATCH_PAGE_SIZE", 2)
+    @mock.patch("routes.matches.get_s3_client", return_value=None)
+    @mock.patch("routes.matches.load_livestream_links")
+    def test_matches_cursor_pages_match_numbered_pages(
+        self, mock_livestreams, _mock_s3
+    ):
+        mock_livestreams.return_value = self._patch_livestreams()
+        by_page = []
+        page = 1
+        while True:
+            data = self.client.get(f"/api/matches?gi=true&page={page}").get_json()
+            by_page.append([row["id"] for row in data["rows"]])
+            if data["totalPages"] == page:
+                self.assertIsNone(data["nextCursor"])
+                break
+            page += 1
+        self.assertGreater(len(by_page), 2)
+
+        by_cursor = []
+        cursor = None
+        for page in range(1, len(by_page) + 1):
+            url = f"/api/matches?gi=true&page={page}"
+            if cursor:
+                url += f"&cursor={cursor}"
+            data = self.client.get(url).get_json()
+            by_cursor.append([row["id"] for row in data["rows"]])
+            cursor = data["nextCursor"]
+        self.assertIsNone(cursor)
+        self.assertEqual(by_cursor, by_page)
+
+    @mock.patch("routes.matches.get_s3_client", return_value=None)
+    @mock.patch("routes.matches.load_livestream_links")
+    def test_matches_cursor_breaks_ties_by_id(self, mock_livestreams, _mock_s3):
+        mock_livestreams.return_value = self._patch_livestreams()
+        happened_at = datetime(2024, 1, 1, 12, 0, 0)
+        match_id = (
+            db.session.query(Match.id).filter(Match.happened_at == happened_at).scalar()
+        )
+        after_all = encode_match_cursor(happened_at, uuid.UUID(int=2**128 - 1))
+        after_none = encode_match_cursor(happened_at, uuid.UUID(int=0))
+
+        rows = self.client.get(f"/api/matches?gi=true&cursor={after_all}").get_json()[
+            "rows"
+        ]
+        self.assertEqual([uuid.UUID(row["id"]) for row in rows], [match_id])
+        rows = self.client.get(f"/api/matches?gi=true&cursor={after_none}").get_json()[
+            "rows"
+        ]
+        self.assertEqual(rows, [])
+
+    def test_matches_rejects_invalid_cursor(self):
+        for cursor in (
+            "garbage",
+            encode_match_cursor(datetime.now(), uuid.uuid4())[:-4],
+        ):
+            response = self.client.get(f"/api/matches?gi=true&cursor={cursor}")
+            self.assertEqual(response.status_code, 400)
+
     def test_matches_requires_gi(self):
         response = self.client.get("/api/matches")
         self.assertEqual(response.status_code, 400)
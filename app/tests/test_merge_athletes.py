@@ -0,0 +1,118 @@
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "scripts")),
+)
+
+from extensions import db
+from models import (
+    Athlete,
+    Division,
+    Event,
+    Match,
+    MatchParticipant,
+    RankingDirtyAthlete,
+    Team,
+)
+from test_db import TestDbMixin
+
+from merge_athletes import merge_athletes
+
+
+class MergeAthletesTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        pass
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        # SQLite leaves foreign keys unchecked unless asked, Postgres does not
+        db.session.connection().exec_driver_sql("PRAGMA foreign_keys=ON")
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.connection().exec_driver_sql("PRAGMA foreign_keys=OFF")
+        db.session.remove()
+        self.ctx.pop()
+
+    def add_athlete(self, name, happened_at):
+        athlete = Athlete(name=name, normalized_name=name.lower(), slug=name.lower())
+        event = Event(
+            name=f"{name} Open",
+            normalized_name=f"{name} open",
+            slug=f"{name.lower()}-open",
+        )
+        team = Team(name=f"{name} Team", normalized_name=f"{name} team")
+        division = Division(
+            gi=True, gender="Male", age="Adult", belt="BLACK", weight="Light"
+        )
+        db.session.add_all([athlete, event, division, team])
+        db.session.flush()
+        match = Match(
+            happened_at=happened_at,
+            event_id=event.id,
+            division_id=division.id,
+            rated=True,
+        )
+        db.session.add(match)
+        db.session.flush()
+        db.session.add(
+            MatchParticipant(
+                match_id=match.id,
+                athlete_id=athlete.id,
+                team_id=team.id,
+                seed=1,
+                red=True,
+                winner=True,
+                start_rating=1500,
+                end_rating=1510,
+                start_match_count=0,
+                end_match_count=1,
+            )
+        )
+        db.session.flush()
+        return athlete
+
+    def add_dirty(self, athlete, gi, happened_at):
+        db.session.add(
+            RankingDirtyAthlete(gi=gi, athlete_id=athlete.id, happened_at=happened_at)
+        )
+
+    def test_pending_board_changes_move_to_the_athlete_kept(self):
+        keep = self.add_athlete("Keep", datetime(2024, 5, 1))
+        merge = self.add_athlete("Merge", datetime(2024, 3, 1))
+        keep_id, merge_id = keep.id, merge.id
+        self.add_dirty(keep, True, datetime(2024, 5, 1))
+        self.add_dirty(merge, True, datetime(2024, 3, 1))
+        self.add_dirty(merge, True, datetime(2024, 4, 1))
+        self.add_dirty(merge, False, datetime(2024, 6, 1))
+        db.session.commit()
+
+        merge_athletes(db.session, keep_id, merge_id)
+        db.session.commit()
+
+        self.assertIsNone(db.session.get(Athlete, merge_id))
+        self.assertEqual(
+            sorted(
+                (row.athlete_id, row.gi, row.happened_at)
+                for row in db.session.query(RankingDirtyAthlete)
+            ),
+            [
+                (keep_id, False, datetime(2024, 6, 1)),
+                (keep_id, True, datetime(2024, 3, 1)),
+            ],
+        )
+        self.assertEqual(
+            db.session.query(MatchParticipant).filter_by(athlete_id=keep_id).count(),
+            2,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
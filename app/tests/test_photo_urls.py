@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+import time
+import unittest
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import photos
+from photos import (
+    PHOTO_URL_CACHE_TTL,
+    get_public_photo_url,
+    get_public_photo_urls,
+    get_s3_client,
+    photo_url_cache,
+)
+
+
+def athlete_with_photo(saved_at=datetime(2026, 1, 1)):
+    return SimpleNamespace(id=uuid.uuid4(), profile_image_saved_at=saved_at)
+
+
+class PhotoUrlTestCase(unittest.TestCase):
+    def setUp(self):
+        photo_url_cache.clear()
+        self.s3_client = mock.Mock()
+        self.s3_client.generate_presigned_url.side_effect = (
+            lambda operation, Params, ExpiresIn: f"https://signed/{Params['Key']}"
+        )
+
+    def tearDown(self):
+        photo_url_cache.clear()
+
+    def test_page_is_signed_once(self):
+        first, second = athlete_with_photo(), athlete_with_photo()
+        without_photo = SimpleNamespace(id=uuid.uuid4(), profile_image_saved_at=None)
+        urls = get_public_photo_urls(
+            self.s3_client, [first, second, first, without_photo]
+        )
+        self.assertEqual(set(urls), {first.id, second.id})
+        self.assertEqual(
+            urls[first.id], f"https://signed/{photos.photo_key}/{first.id}.jpg"
+        )
+        self.assertEqual(self.s3_client.generate_presigned_url.call_count, 2)
+
+        # string ids from raw queries share the entries
+        row = SimpleNamespace(
+            id=str(first.id), profile_image_saved_at=first.profile_image_saved_at
+        )
+        self.assertEqual(get_public_photo_url(self.s3_client, row), urls[first.id])
+        self.assertEqual(self.s3_client.generate_presigned_url.call_count, 2)
+
+    def test_new_photo_and_expired_entries_are_signed_again(self):
+        athlete = athlete_with_photo()
+        get_public_photo_url(self.s3_client, athlete)
+        athlete.profile_image_saved_at = datetime(2026, 2, 1)
+        get_public_photo_url(self.s3_client, athlete)
+        self.assertEqual(self.s3_client.generate_presigned_url.call_count, 2)
+
+        photo_url_cache.expire(time.monotonic() + PHOTO_URL_CACHE_TTL)
+        get_public_photo_url(self.s3_client, athlete)
+        self.assertEqual(self.s3_client.generate_presigned_url.call_count, 3)
+
+    def test_without_client_there_are_no_urls(self):
+        self.assertEqual(get_public_photo_urls(None, [athlete_with_photo()]), {})
+
+    def test_client_is_reused_per_worker(self):
+        creds = {
+            "aws_access_key_id": "key",
+            "aws_secret_access_key": "secret",
+            "region": "us-east-1",
+        }
+        with mock.patch.dict(os.environ, {"AWS_CREDS": json.dumps(creds)}):
+            client = get_s3_client()
+            self.assertIs(get_s3_client(), client)
+            with mock.patch("photos.os.getpid", return_value=os.getpid() + 1):
+                self.assertIsNot(get_s3_client(), client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,278 @@
+import os
+import re
+import sys
+import unittest
+from contextlib import contextmanager
+from datetime import datetime
+from unittest import mock
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import event, func, text
+
+from constants import ADULT, BLACK, MALE, MIDDLE, OPEN_CLASS
+from elo import get_last_matches, get_match_count, get_weight
+from extensions import db
+from models import Athlete, Division, Event, Match, MatchParticipant, Medal
+from ratings import recompute_all_ratings
+from seeding import add_seeding_data
+from synthetic import SyntheticConfig, generate_synthetic_history
+from test_db import TestDbMixin
+
+# Plan regression tests for the hot queries. A synthetic history is loaded
+# into SQLite and analyzed, the queries are captured as they run and each is
+# checked with EXPLAIN QUERY PLAN: a plain SCAN of one of the large tables
+# means the query fell back to a full table scan, usually because an index was
+# dropped or a filter changed shape. Scans of small tables (divisions, events,
+# registration links, ranking generations) are expected. SQLite's planner is a
+# proxy for Postgres, so a failure here is worth an EXPLAIN there too.
+
+CONFIG = SyntheticConfig(matches=2000, seed=11, registrations_per_event=150)
+
+LARGE_TABLES = {
+    "matches",
+    "match_participants",
+    "medals",
+    "athlete_ratings",
+    "athletes",
+}
+
+_TABLE_REFERENCE = re.compile(
+    r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b)(\w+))?",
+    re.IGNORECASE,
+)
+# an automatic index is built from a full scan, for this query only
+_FULL_SCAN = re.compile(r"^(?:SCAN (\w+)$|SEARCH (\w+) USING AUTOMATIC )")
+
+
+@contextmanager
+def captured_queries():
+    """The (statement, parameters) of every SELECT run in the block."""
+    queries = []
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if re.match(r"\s*(?:SELECT|WITH)\b", statement, re.IGNORECASE):
+            queries.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def query_plan(statement, parameters):
+    rows = (
+        db.session.connection()
+        .exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        .fetchall()
+    )
+    return [row[3] for row in rows]
+
+
+def full_scans(statement, plan):
+    """Large tables the plan reads without an index."""
+    tables = {}
+    for table, alias in _TABLE_REFERENCE.findall(statement):
+        tables[table] = table
+        if alias:
+            tables[alias] = table
+    scans = []
+    for detail in plan:
+        match = _FULL_SCAN.match(detail)
+        if match is None:
+            continue
+        name = match.group(1) or match.group(2)
+        if tables.get(name, name) in LARGE_TABLES:
+            scans.append(tables.get(name, name))
+    return scans
+
+
+class QueryPlanTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        generate_synthetic_history(db.session, CONFIG)
+        db.session.commit()
+        recompute_all_ratings(db, True)
+        db.session.commit()
+
+        # the last events of each year become Worlds and Pans, so the Grand
+        # Slam and world champion seeding queries have events to look up
+        starts = (
+            db.session.query(Event, func.min(Match.happened_at))
+            .join(Match, Match.event_id == Event.id)
+            .group_by(Event.id)
+            .order_by(func.min(Match.happened_at))
+            .all()
+        )
+        by_year = {}
+        for event_row, started_at in starts:
+            by_year.setdefault(started_at.year, []).append(event_row)
+        for year, events in by_year.items():
+            events[-1].name = f"World IBJJF Jiu-Jitsu Championship {year}"
+            if len(events) > 1:
+                events[-2].name = f"Pan IBJJF Jiu-Jitsu Championship {year}"
+        db.session.commit()
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        self.client = self.app_module.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def assertNoFullScans(self, queries):
+        self.assertTrue(queries)
+        for statement, parameters in queries:
+            plan = query_plan(statement, parameters)
+            scans = full_scans(statement, plan)
+            if scans:
+                self.fail(
+                    f"full scan of {', '.join(scans)}:\n{statement}\n" + "\n".join(plan)
+                )
+
+    def assertUsesIndex(self, queries, index_prefix):
+        details = [
+            detail
+            for statement, parameters in queries
+            for detail in query_plan(statement, parameters)
+        ]
+        self.assertTrue(
+            any(f"INDEX {index_prefix}" in detail for detail in details),
+            "\n".join(details),
+        )
+
+    def open_class_participant(self):
+        return (
+            db.session.query(MatchParticipant)
+            .join(Match)
+            .join(Division)
+            .filter(Division.weight == OPEN_CLASS)
+            .order_by(Match.happened_at.desc(), MatchParticipant.id)
+            .first()
+        )
+
+    def test_rating_history_queries(self):
+        participant = self.open_class_participant()
+        match = participant.match
+        with captured_queries() as last_matches:
+            get_last_matches(
+                db, match.division, participant.athlete_id, match.happened_at, match.id
+            )
+        with captured_queries() as match_count:
+            get_match_count(
+                db,
+                datetime(2000, 1, 1),
+                match.division,
+                participant.athlete_id,
+                match.happened_at,
+                match.id,
+            )
+        with captured_queries() as weight:
+            get_weight(
+                db,
+                match.division,
+                participant.athlete_id,
+                match.happened_at,
+                match.event_id,
+            )
+        for queries in (last_matches, match_count, weight):
+            self.assertNoFullScans(queries)
+            self.assertUsesIndex(queries, "ix_match_participants_")
+
+    @mock.patch("routes.top.get_s3_client", return_value=None)
+    def test_top_page_query(self, _mock_s3):
+        with captured_queries() as queries:
+            response = self.client.get(
+                "/api/top?gender=Male&age=Adult&belt=BLACK&gi=true"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(queries)
+        self.assertUsesIndex(queries, "ix_athlete_ratings_all")
+
+    @mock.patch("routes.matches.get_s3_client", return_value=None)
+    def test_matches_queries(self, _mock_s3):
+        athlete = db.session.query(Athlete).order_by(Athlete.name).first()
+        event_row = db.session.query(Event).order_by(Event.name).first()
+        filter_sets = [
+            {},
+            {"athlete_name": athlete.name},
+            {"athlete_id": str(athlete.id)},
+            {"event_name": event_row.name},
+            {"age_adult": "true", "belt_black": "true", "weight_middle": "true"},
+            {"gender_female": "true", "date_start": "2024-01-01"},
+        ]
+        for filters in filter_sets:
+            with self.subTest(filters=filters):
+                with captured_queries() as queries:
+                    response = self.client.get(
+                        "/api/matches?" + urlencode({"gi": "true", **filters})
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertNoFullScans(queries)
+
+    def test_seeding_medal_queries(self):
+        athlete_ids = [
+            athlete_id
+            for (athlete_id,) in db.session.query(Medal.athlete_id)
+            .join(Division)
+            .filter(Division.gi == True, Division.belt == BLACK, Division.age == ADULT)
+            .distinct()
+            .limit(16)
+        ]
+        self.assertTrue(athlete_ids)
+        rows = [{"id": athlete_id} for athlete_id in athlete_ids]
+        divdata = {"age": ADULT, "belt": BLACK, "weight": MIDDLE, "gender": MALE}
+        with captured_queries() as queries:
+            add_seeding_data(rows, divdata, True)
+        medal_queries = [
+            (statement, parameters)
+            for statement, parameters in queries
+            if "FROM medals" in statement
+        ]
+        # regular season, Grand Slam and the world champion lookups
+        self.assertGreaterEqual(len(medal_queries), 3)
+        self.assertNoFullScans(queries)
+
+    def test_dropped_indexes_are_reported(self):
+        participant = self.open_class_participant()
+        match = participant.match
+        indexes = [
+            index
+            for index in MatchParticipant.__table__.indexes
+            if index.name.startswith("ix_match_participants_")
+        ]
+        db.session.commit()
+        for index in indexes:
+            index.drop(db.engine)
+        try:
+            with captured_queries() as queries:
+                get_match_count(
+                    db,
+                    datetime(2000, 1, 1),
+                    match.division,
+                    participant.athlete_id,
+                    match.happened_at,
+                    match.id,
+                )
+            with self.assertRaisesRegex(
+                AssertionError, "full scan of match_participants"
+            ):
+                self.assertNoFullScans(queries)
+        finally:
+            db.session.rollback()
+            for index in indexes:
+                index.create(db.engine)
+            db.session.execute(text("ANALYZE"))
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    unittest.main()
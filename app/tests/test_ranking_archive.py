@@ -0,0 +1,273 @@
+import os
+import sys
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import func
+
+from current import generate_current_ratings
+from extensions import db
+from models import (
+    AthleteRating,
+    Division,
+    Match,
+    RankingArchive,
+    RankingDirtyAthlete,
+    RankingSnapshot,
+)
+from ranking_archive import (
+    athlete_rank_history,
+    decode_board,
+    encode_board,
+    load_board_as_of,
+)
+from ranking_snapshots import clear_snapshots
+from ratings import recompute_all_ratings
+from recompute_benchmark import flip_winner, rescore_flipped
+from synthetic import SyntheticConfig, generate_synthetic_history
+from test_db import TestDbMixin
+from test_replay import restore, snapshot
+
+
+def archived_keys():
+    return [
+        (row.gender, row.age, row.belt, row.gi, row.weight)
+        for row in db.session.query(RankingArchive)
+    ]
+
+
+def current_board(key):
+    gender, age, belt, gi, weight = key
+    return [
+        (row.athlete_id, row.rank, round(row.rating), row.match_count)
+        for row in db.session.query(AthleteRating)
+        .filter(
+            AthleteRating.gender == gender,
+            AthleteRating.age == age,
+            AthleteRating.belt == belt,
+            AthleteRating.gi == gi,
+            AthleteRating.weight == weight,
+        )
+        .order_by(
+            AthleteRating.rank,
+            AthleteRating.match_happened_at.desc(),
+            AthleteRating.athlete_id,
+        )
+    ]
+
+
+def archived_board(key, as_of):
+    board = load_board_as_of(db.session, key, as_of)
+    return [
+        (board.athlete_id(index), row["rank"], row["rating"], row["match_count"])
+        for index, row in ((index, board.row(index)) for index in range(len(board)))
+    ]
+
+
+class BoardEncodingTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        athlete_ids = [uuid.uuid4() for _ in range(500)]
+        ranks = [index // 3 + 1 for index in range(499)] + [None]
+        ratings = [2000 - index * 1.37 for index in range(500)]
+        match_counts = [index % 40 for index in range(500)]
+        percentiles = [(index + 1) / 500 for index in range(499)] + [None]
+
+        data, digest = encode_board(
+            athlete_ids, ranks, ratings, match_counts, percentiles
+        )
+        board = decode_board(data, datetime(2024, 1, 2))
+        self.assertEqual(len(board), 500)
+        self.assertEqual([board.athlete_id(i) for i in range(500)], athlete_ids)
+        self.assertEqual(board.position(athlete_ids[123]), 123)
+        self.assertIsNone(board.position(uuid.uuid4()))
+        self.assertEqual(
+            board.row(1),
+            {
+                "rank": 1,
+                "rating": round(ratings[1]),
+                "match_count": 1,
+                "percentile": percentiles[1],
+            },
+        )
+        self.assertEqual(
+            board.row(499),
+            {"rank": None, "rating": 1316, "match_count": 19, "percentile": None},
+        )
+        # the ids are most of the size; the delta columns compress away
+        self.assertLess(len(data), 500 * 16 + 500 * 4)
+
+        self.assertEqual(
+            digest,
+            encode_board(athlete_ids, ranks, ratings, match_counts, percentiles)[1],
+        )
+        ranks[0] = 2
+        self.assertNotEqual(
+            digest,
+            encode_board(athlete_ids, ranks, ratings, match_counts, percentiles)[1],
+        )
+
+
+class RankingArchiveTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        generate_synthetic_history(
+            db.session, SyntheticConfig(matches=600, seed=17, end=datetime.now())
+        )
+        db.session.commit()
+        for gi in (True, False):
+            recompute_all_ratings(db, gi, rerank=False)
+        db.session.commit()
+        cls.last_gi_match_at = (
+            db.session.query(func.max(Match.happened_at))
+            .join(Division)
+            .filter(Division.gi == True)
+            .scalar()
+        )
+        cls.previous_date = cls.last_gi_match_at - timedelta(days=1)
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        self.client = self.app_module.app.test_client()
+        self.initial = snapshot()
+        self.flipped = None
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+
+    def tearDown(self):
+        if self.flipped is not None:
+            flip_winner(db.session, self.flipped.happened_at + timedelta(seconds=1))
+        restore(self.initial)
+        db.session.query(RankingArchive).delete()
+        if db.session.query(RankingSnapshot).count():
+            clear_snapshots(db.session, True)
+            clear_snapshots(db.session, False)
+        db.session.query(RankingDirtyAthlete).delete()
+        db.session.commit()
+        db.session.remove()
+        self.ctx.pop()
+
+    def board_keys(self):
+        return {
+            (row.gender, row.age, row.belt, row.gi, row.weight)
+            for row in db.session.query(AthleteRating)
+        }
+
+    def test_full_regeneration_archives_every_board(self):
+        keys = archived_keys()
+        self.assertEqual(sorted(keys), sorted(self.board_keys()))
+        for key in keys:
+            self.assertEqual(archived_board(key, datetime.now()), current_board(key))
+
+    def test_unchanged_boards_are_not_archived_again(self):
+        count = db.session.query(RankingArchive).count()
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        self.assertEqual(db.session.query(RankingArchive).count(), count)
+
+    def test_incremental_archives_touched_boards(self):
+        archived_at = datetime.now()
+        before = {key: current_board(key) for key in self.board_keys()}
+        self.flipped = flip_winner(
+            db.session, self.last_gi_match_at + timedelta(seconds=1)
+        )
+        rescore_flipped(db, self.flipped)
+        db.session.commit()
+
+        regeneration = generate_current_ratings(
+            db, True, True, self.previous_date, incremental=True
+        )
+        db.session.commit()
+        self.assertTrue(regeneration.incremental)
+
+        changed = [
+            key for key in self.board_keys() if current_board(key) != before.get(key)
+        ]
+        self.assertTrue(changed)
+        count = db.session.query(RankingArchive).count()
+        self.assertEqual(count - len(before), len(changed))
+        for key in changed:
+            self.assertEqual(archived_board(key, datetime.now()), current_board(key))
+            # the earlier archive still answers for before the regeneration
+            self.assertEqual(archived_board(key, archived_at), before[key])
+
+    def test_nothing_archived_before_first_generation(self):
+        key = next(iter(self.board_keys()))
+        self.assertIsNone(
+            load_board_as_of(db.session, key, datetime.now() - timedelta(days=1))
+        )
+
+    def test_athlete_rank_history(self):
+        key = next(iter(self.board_keys()))
+        athlete_id, rank, rating, match_count = current_board(key)[0]
+        history = athlete_rank_history(db.session, athlete_id, key)
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]["rank"], rank)
+        self.assertEqual(history[0]["rating"], rating)
+
+        gender, age, belt, gi, weight = key
+        response = self.client.get(
+            f"/api/athlete/{athlete_id}/rank-history?gi={str(gi).lower()}"
+            f"&gender={gender}&age={age}&belt={belt}&weight={weight}"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0]["history"], history)
+
+        response = self.client.get(
+            f"/api/athlete/{athlete_id}/rank-history?gi={str(gi).lower()}"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            (gender, age, belt, weight),
+            [
+                (board["gender"], board["age"], board["belt"], board["weight"])
+                for board in response.get_json()
+            ],
+        )
+
+    @mock.patch("routes.top.get_s3_client", return_value=None)
+    def test_top_as_of(self, _mock_s3):
+        key = max(self.board_keys(), key=lambda key: len(current_board(key)))
+        gender, age, belt, gi, weight = key
+        url = (
+            f"/api/top?gender={gender}&age={age}&belt={belt}"
+            f"&gi={str(gi).lower()}&weight={weight}"
+        )
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        current = self.client.get(url).get_json()
+        archived = self.client.get(f"{url}&as_of={today}").get_json()
+        self.assertEqual(archived["totalPages"], current["totalPages"])
+        self.assertEqual(archived["generation"], current["generation"])
+        self.assertEqual(
+            [
+                (row["athlete_id"], row["rank"], row["rating"])
+                for row in archived["rows"]
+            ],
+            [
+                (row["athlete_id"], row["rank"], row["rating"])
+                for row in current["rows"]
+            ],
+        )
+
+        name = archived["rows"][0]["name"]
+        filtered = self.client.get(f'{url}&as_of={today}&name="{name}"').get_json()
+        self.assertEqual(
+            [row["name"] for row in filtered["rows"]],
+            [row["name"] for row in archived["rows"] if row["name"] == name],
+        )
+
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        self.assertEqual(self.client.get(f"{url}&as_of={yesterday}").status_code, 404)
+        self.assertEqual(self.client.get(f"{url}&as_of=today").status_code, 400)
+        self.assertEqual(
+            self.client.get(f"{url}&as_of={today}&changed=true").status_code, 400
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
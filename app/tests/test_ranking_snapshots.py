@@ -0,0 +1,175 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import func
+
+from current import generate_current_ratings, previous_tuesday
+from extensions import db
+from models import (
+    Division,
+    ManualPromotions,
+    Match,
+    RankingDirtyAthlete,
+    RankingSnapshot,
+    RankingSnapshotRow,
+    RatingCheckpoint,
+)
+from ranking_snapshots import clear_snapshots
+from ratings import recompute_all_ratings
+from recompute_benchmark import flip_winner, rescore_flipped
+from synthetic import SyntheticConfig, generate_synthetic_history
+from test_db import TestDbMixin
+from test_incremental_ranking import board_rows
+from test_replay import restore, snapshot
+
+
+def snapshot_ids():
+    return {
+        (row.gi, row.snapshot_date): row.id for row in db.session.query(RankingSnapshot)
+    }
+
+
+class RankingSnapshotTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        generate_synthetic_history(
+            db.session, SyntheticConfig(matches=600, seed=13, end=datetime.now())
+        )
+        db.session.commit()
+        for gi in (True, False):
+            recompute_all_ratings(db, gi, rerank=False)
+        db.session.commit()
+        cls.last_gi_match_at = (
+            db.session.query(func.max(Match.happened_at))
+            .join(Division)
+            .filter(Division.gi == True)
+            .scalar()
+        )
+        cls.previous_date = cls.last_gi_match_at - timedelta(days=1)
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        self.initial = snapshot()
+        self.flipped = None
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+
+    def tearDown(self):
+        if self.flipped is not None:
+            flip_winner(db.session, self.flipped.happened_at + timedelta(seconds=1))
+        restore(self.initial)
+        clear_snapshots(db.session, True)
+        clear_snapshots(db.session, False)
+        db.session.query(RankingDirtyAthlete).delete()
+        db.session.query(RatingCheckpoint).delete()
+        db.session.query(ManualPromotions).delete()
+        db.session.commit()
+        db.session.remove()
+        self.ctx.pop()
+
+    def flip_before(self, happened_before):
+        self.flipped = flip_winner(db.session, happened_before)
+        rescore_flipped(db, self.flipped)
+        db.session.commit()
+
+    def rebuilt_board(self):
+        # the board with every snapshot built from the match history
+        clear_snapshots(db.session, True)
+        clear_snapshots(db.session, False)
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        return board_rows()
+
+    def test_snapshot_is_reused(self):
+        ids = snapshot_ids()
+        self.assertEqual(len(ids), 2)
+        self.assertGreater(db.session.query(RankingSnapshotRow).count(), 0)
+        rows = board_rows()
+        self.assertTrue(any(row[10] is not None for row in rows))
+
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        self.assertEqual(ids, snapshot_ids())
+        self.assertEqual(rows, board_rows())
+
+    def test_change_before_snapshot_rebuilds_it(self):
+        ids = snapshot_ids()
+        snapshot_date = db.session.query(
+            func.max(RankingSnapshot.snapshot_date)
+        ).scalar()
+        self.flip_before(snapshot_date)
+
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        self.assertNotEqual(
+            ids[(True, snapshot_date)], snapshot_ids()[(True, snapshot_date)]
+        )
+        self.assertEqual(board_rows(), self.rebuilt_board())
+
+    def test_change_after_snapshot_keeps_it(self):
+        ids = snapshot_ids()
+        self.flip_before(self.last_gi_match_at + timedelta(seconds=1))
+
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        self.assertEqual(ids, snapshot_ids())
+        self.assertEqual(board_rows(), self.rebuilt_board())
+
+    def test_corrected_promotion_rebuilds_it(self):
+        athlete_id = db.session.query(RankingSnapshotRow.athlete_id).first()[0]
+        promotion = ManualPromotions(
+            athlete_id=athlete_id,
+            belt="BROWN",
+            promoted_at=self.previous_date - timedelta(days=60),
+        )
+        db.session.add(promotion)
+        db.session.commit()
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        ids = snapshot_ids()
+
+        # the correction keeps the number of promotions and the latest date
+        promotion.belt = "BLACK"
+        db.session.commit()
+        generate_current_ratings(db, True, True, self.previous_date)
+        db.session.commit()
+        self.assertFalse(set(ids.values()) & set(snapshot_ids().values()))
+        self.assertEqual(board_rows(), self.rebuilt_board())
+
+    def test_per_match_path_clears_later_snapshots(self):
+        recompute_all_ratings(
+            db,
+            True,
+            start_date=self.previous_date - timedelta(days=30),
+            rerank=False,
+            replay=False,
+        )
+        db.session.commit()
+        self.assertEqual([gi for gi, _ in snapshot_ids()], [False])
+
+    def test_previous_date_steps_back_to_matches(self):
+        generate_current_ratings(
+            db, True, False, self.last_gi_match_at + timedelta(days=60)
+        )
+        db.session.commit()
+        snapshot_date = (
+            db.session.query(func.max(RankingSnapshot.snapshot_date))
+            .filter(RankingSnapshot.gi == True)
+            .scalar()
+        )
+        self.assertEqual(snapshot_date.weekday(), 1)
+        self.assertLessEqual(snapshot_date, self.last_gi_match_at)
+        self.assertGreater(snapshot_date, self.last_gi_match_at - timedelta(days=7))
+        self.assertEqual(
+            snapshot_date,
+            previous_tuesday(self.last_gi_match_at + timedelta(days=1)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
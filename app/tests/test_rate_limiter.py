@@ -0,0 +1,116 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from rate_limiter import RateLimiter, get_rate_limiter
+from test_db import TestDbMixin
+
+# the start of a 10 second window
+NOW = 1_700_000_000.0
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "limits.sqlite3")
+        self.now = NOW
+        patcher = mock.patch("rate_limiter.time.time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def requests(self, limiter, count, client="1.2.3.4"):
+        return [limiter.allow("matches_route", client) for _ in range(count)]
+
+    def test_limit_is_shared_between_workers(self):
+        worker, other_worker = RateLimiter(self.path), RateLimiter(self.path)
+        self.assertEqual(self.requests(worker, 10), [True] * 10)
+        self.assertEqual(self.requests(other_worker, 6), [True] * 5 + [False])
+        self.assertEqual(self.requests(worker, 1, client="5.6.7.8"), [True])
+        self.assertEqual(
+            worker.stats()["matches_route"],
+            {
+                "allowed": 16,
+                "rejected": 1,
+                "penalized": 1,
+                "clients": 2,
+                "penalized_clients": 1,
+            },
+        )
+
+    def test_window_slides(self):
+        limiter = RateLimiter(self.path)
+        self.assertEqual(self.requests(limiter, 15), [True] * 15)
+        # halfway through the next window, half of those still count
+        self.now += 15
+        self.assertEqual(self.requests(limiter, 9), [True] * 8 + [False])
+
+    def test_penalty_halves_the_limit_until_it_ends(self):
+        limiter = RateLimiter(self.path)
+        self.assertEqual(self.requests(limiter, 16), [True] * 15 + [False])
+
+        # limit 7 for the penalty, and each rejection halves it again
+        self.now += 20
+        self.assertEqual(self.requests(limiter, 9), [True] * 7 + [False, False])
+        self.now += 20
+        self.assertEqual(self.requests(limiter, 2), [True, False])
+
+        # the last rejection extended the penalty
+        self.now += 59
+        self.assertEqual(self.requests(limiter, 2), [True, False])
+        self.now += 61
+        self.assertEqual(self.requests(limiter, 16), [True] * 15 + [False])
+
+    def test_idle_clients_are_evicted(self):
+        limiter = RateLimiter(self.path, max_clients=2)
+        for client in ("a", "b", "c"):
+            self.now += 1
+            self.requests(limiter, 1, client=client)
+        limiter.evict()
+        self.assertEqual(limiter.stats()["matches_route"]["clients"], 2)
+
+        self.requests(limiter, 16, client="d")
+        self.now += 30
+        limiter.evict()
+        # only the penalized client is kept
+        self.assertEqual(limiter.stats()["matches_route"]["clients"], 1)
+        self.assertEqual(self.requests(limiter, 8, client="d"), [True] * 7 + [False])
+
+    def test_unusable_store_lets_requests_through(self):
+        limiter = RateLimiter(self.temp_dir)
+        self.assertEqual(self.requests(limiter, 20), [True] * 20)
+
+
+class MatchesRateLimitTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        pass
+
+    def setUp(self):
+        self.client = self.app_module.app.test_client()
+
+    def test_matches_are_rate_limited_per_client(self):
+        with self.app_module.app.app_context():
+            limiter = get_rate_limiter()
+        with mock.patch.object(limiter, "limit", 2):
+            statuses = [
+                self.client.get(
+                    "/api/matches", headers={"CF-Connecting-IP": "9.9.9.9"}
+                ).status_code
+                for _ in range(3)
+            ]
+            self.assertEqual(statuses, [400, 400, 429])
+            # without a client address there is nothing to limit
+            self.assertEqual(self.client.get("/api/matches").status_code, 400)
+        self.assertEqual(limiter.stats()["matches_route"]["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import json
+import os
+import random
+import sys
+import unittest
+from contextlib import nullcontext
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from extensions import db
+from models import Division, Match, RatingCheckpoint
+from progress_bar import Bar
+from rating_profile import (
+    Histogram,
+    count,
+    normalize_statement,
+    profile_pipeline,
+    timed,
+)
+from ratings import recompute_all_ratings
+from test_db import TestDbMixin
+from test_replay import restore, seed_history, snapshot
+
+
+class RatingProfileTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        seed_history(random.Random(2468))
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        self.initial = snapshot()
+
+    def tearDown(self):
+        restore(self.initial)
+        db.session.query(RatingCheckpoint).delete()
+        db.session.commit()
+        db.session.remove()
+        self.ctx.pop()
+
+    def gi_matches(self):
+        return (
+            db.session.query(Match).join(Division).filter(Division.gi == True).count()
+        )
+
+    def test_per_match_path(self):
+        with profile_pipeline(db.engine) as profile:
+            recompute_all_ratings(db, True, rerank=False, replay=False)
+            db.session.commit()
+        report = profile.to_dict()
+        json.dumps(report)
+
+        matches = self.gi_matches()
+        self.assertEqual(report["matches"], matches)
+        self.assertEqual(
+            report["queries"], sum(s["count"] for s in report["statements"])
+        )
+        # every match looks up both athletes' history with its own queries
+        self.assertGreater(report["queries_per_match"], 2)
+        for name in ("load", "history", "elo"):
+            self.assertIn(name, report["phases"])
+        self.assertEqual(report["phases"]["history"]["count"], matches)
+        self.assertEqual(
+            sum(report["phases"]["history"]["histogram"].values()), matches
+        )
+        self.assertGreater(report["phases"]["history"]["queries"], 2 * matches)
+        self.assertTrue(any(row["phase"] == "history" for row in report["statements"]))
+
+    def test_replay_path_and_rank(self):
+        with profile_pipeline(db.engine) as profile:
+            recompute_all_ratings(db, True)
+            db.session.commit()
+        report = profile.to_dict()
+
+        self.assertEqual(report["matches"], self.gi_matches())
+        self.assertLess(report["phases"]["load"]["queries"], 10)
+        self.assertEqual(report["phases"]["replay"]["count"], 2)
+        self.assertNotIn("history", report["phases"])
+        for name in ("rank", "rank/current", "rank/previous"):
+            self.assertEqual(report["phases"][name]["count"], 1)
+        self.assertGreater(report["phases"]["rank"]["queries"], 0)
+
+    def test_inactive_profile(self):
+        self.assertIsInstance(timed("history"), nullcontext)
+        count("matches")
+
+        with profile_pipeline(db.engine) as profile:
+            with timed("outer"):
+                with timed("inner"):
+                    db.session.query(Match).count()
+            count("matches", 3)
+        queries = profile.queries
+        db.session.query(Match).count()
+
+        self.assertEqual(profile.queries, queries)
+        self.assertEqual(profile.counters, {"matches": 3})
+        self.assertEqual(set(profile.phases), {"outer", "outer/inner"})
+        self.assertEqual([phase for phase, _ in profile.statements], ["outer/inner"])
+
+    def test_histogram_and_statements(self):
+        histogram = Histogram()
+        for seconds in (0.00005, 0.003, 0.003, 10):
+            histogram.add(seconds)
+        row = histogram.to_dict()
+        self.assertEqual(row["count"], 4)
+        self.assertEqual(row["max_seconds"], 10)
+        self.assertEqual(row["histogram"]["0.1ms"], 1)
+        self.assertEqual(row["histogram"]["5ms"], 2)
+        self.assertEqual(row["histogram"]["inf"], 1)
+
+        self.assertEqual(
+            normalize_statement("SELECT a\n  FROM t WHERE id IN (?, ?,  ?)"),
+            "SELECT a FROM t WHERE id IN (...)",
+        )
+        self.assertEqual(
+            normalize_statement("SELECT * FROM t WHERE a = %(a)s"),
+            "SELECT * FROM t WHERE a = %(a)s",
+        )
+
+    def test_bar_reports_rate(self):
+        bar = Bar("test", max=10, check_tty=False, no_tty=True)
+        self.assertEqual(bar.rate, 0)
+        bar.avg = 0.01
+        self.assertAlmostEqual(bar.rate, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
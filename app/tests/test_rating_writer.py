@@ -0,0 +1,124 @@
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy.dialects import postgresql
+
+from constants import ADULT, BLUE, LIGHT, MALE
+from extensions import db
+from models import Athlete, Division, Event, Match, MatchParticipant, Team
+from rating_writer import (
+    PARTICIPANT_RATING_COLUMNS,
+    RatingWriter,
+    participant_rating_updates,
+    staged_update,
+)
+from test_db import TestDbMixin
+
+
+class RatingWriterTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        team = Team(name="Writer Team", normalized_name="writer team")
+        event = Event(name="Writer Open", normalized_name="writer open", slug="w")
+        division = Division(gi=True, gender=MALE, age=ADULT, belt=BLUE, weight=LIGHT)
+        athletes = [
+            Athlete(name=f"Writer {i}", normalized_name=f"writer {i}", slug=f"w-{i}")
+            for i in range(2)
+        ]
+        db.session.add_all([team, event, division] + athletes)
+        db.session.flush()
+        for i in range(3):
+            match = Match(
+                happened_at=datetime(2024, 1, 1, 10, i),
+                event_id=event.id,
+                division_id=division.id,
+                rated=True,
+            )
+            db.session.add(match)
+            db.session.flush()
+            for red, athlete in zip((True, False), athletes):
+                db.session.add(
+                    MatchParticipant(
+                        match_id=match.id,
+                        athlete_id=athlete.id,
+                        team_id=team.id,
+                        seed=1,
+                        red=red,
+                        winner=red,
+                        start_rating=1400.0,
+                        end_rating=1400.0,
+                        start_match_count=0,
+                        end_match_count=0,
+                    )
+                )
+        db.session.commit()
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_writes_batches_and_counts_real_changes(self):
+        participants = db.session.query(MatchParticipant).all()
+        writer = RatingWriter(db.session, batch_size=4)
+        for index, participant in enumerate(participants):
+            # every other row is written back unchanged
+            end_rating = 1400.0 if index % 2 else 1416.0
+            writer.participant(
+                participant.id,
+                1400.0,
+                end_rating,
+                None,
+                None if index % 2 else "note",
+                0,
+                0 if index % 2 else 1,
+            )
+        writer.close()
+
+        self.assertEqual(writer.participants_changed, 3)
+        db.session.expire_all()
+        rows = db.session.query(MatchParticipant).all()
+        self.assertEqual(
+            sorted(row.end_rating for row in rows), [1400.0] * 3 + [1416.0] * 3
+        )
+        self.assertEqual(
+            {row.rating_note for row in rows if row.end_rating == 1416.0}, {"note"}
+        )
+
+    def test_writes_match_rated_flags(self):
+        matches = db.session.query(Match).all()
+        writer = RatingWriter(db.session)
+        writer.match(matches[0].id, False)
+        writer.match(matches[1].id, True)
+        writer.close()
+
+        self.assertEqual(writer.matches_changed, 1)
+        db.session.expire_all()
+        self.assertFalse(db.session.get(Match, matches[0].id).rated)
+        self.assertTrue(db.session.get(Match, matches[1].id).rated)
+
+    def test_postgres_update_from_staging_compiles(self):
+        statement = staged_update(
+            participant_rating_updates,
+            MatchParticipant.__table__,
+            PARTICIPANT_RATING_COLUMNS,
+        )
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("FROM temp_participant_rating_updates", sql)
+        self.assertIn(
+            "match_participants.end_rating IS DISTINCT FROM "
+            "temp_participant_rating_updates.end_rating",
+            sql,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
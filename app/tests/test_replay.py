@@ -0,0 +1,562 @@
+import csv
+import io
+import os
+import random
+import sys
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import event
+
+from constants import (
+    ADULT,
+    BLACK,
+    BLUE,
+    BROWN,
+    FEMALE,
+    GREEN,
+    JUVENILE,
+    LIGHT,
+    MALE,
+    MASTER_1,
+    MEDIUM_HEAVY,
+    MIDDLE,
+    OPEN_CLASS,
+    PURPLE,
+    TEEN_1,
+    WHITE,
+)
+from elo import WINNER_NOT_RECORDED
+from extensions import db
+from models import (
+    Athlete,
+    Division,
+    Event,
+    Match,
+    MatchParticipant,
+    Medal,
+    RatingCheckpoint,
+    Suspension,
+    Team,
+)
+from ratings import recompute_all_ratings, rescore_after_match_change
+from rating_checkpoints import latest_checkpoint_at
+from rating_diff import dry_run_ratings, write_rating_diff
+from replay import replay_ratings_in_parallel
+from test_db import TestDbMixin
+
+BELTS = [WHITE, BLUE, PURPLE, BROWN, BLACK]
+AGES = [JUVENILE, ADULT, ADULT, MASTER_1, TEEN_1]
+WEIGHTS = [LIGHT, MIDDLE, MEDIUM_HEAVY, OPEN_CLASS]
+
+
+def division_key(gi, profile, weight):
+    belt = BELTS[profile["belt"]]
+    age = profile["age"]
+    if age == TEEN_1:
+        belt = GREEN
+    elif age == JUVENILE and belt in (BROWN, BLACK):
+        age = ADULT
+    return (gi, profile["gender"], age, belt, weight)
+
+
+def seed_history(rng: random.Random, athlete_count=30, event_count=14):
+    teams = [Team(name=f"Team {i}", normalized_name=f"team {i}") for i in range(3)]
+    db.session.add_all(teams)
+
+    divisions = {}
+    for gi in (True, False):
+        for gender in (MALE, FEMALE):
+            for age in set(AGES):
+                for belt in BELTS + [GREEN]:
+                    for weight in WEIGHTS:
+                        division = Division(
+                            gi=gi, gender=gender, age=age, belt=belt, weight=weight
+                        )
+                        divisions[(gi, gender, age, belt, weight)] = division
+    db.session.add_all(divisions.values())
+
+    athletes = []
+    for i in range(athlete_count):
+        athlete = Athlete(
+            name=f"Replay Athlete {i}",
+            normalized_name=f"replay athlete {i}",
+            slug=f"replay-athlete-{i}",
+        )
+        athletes.append(athlete)
+    db.session.add_all(athletes)
+    db.session.flush()
+
+    profiles = {
+        athlete.id: {
+            "gender": MALE if i % 3 else FEMALE,
+            "belt": rng.randrange(len(BELTS) - 1),
+            "age": rng.choice(AGES),
+            "weight": rng.choice(WEIGHTS[:-1]),
+            "team": rng.choice(teams),
+        }
+        for i, athlete in enumerate(athletes)
+    }
+
+    db.session.add(
+        Suspension(
+            athlete_name="Replay Athlete 4",
+            start_date=datetime(2019, 6, 1),
+            end_date=datetime(2021, 6, 1),
+        )
+    )
+
+    start = datetime(2018, 1, 6, 10, 0)
+    for event_index in range(event_count):
+        event = Event(
+            name=f"Replay Open {event_index}",
+            normalized_name=f"replay open {event_index}",
+            slug=f"replay-open-{event_index}",
+        )
+        db.session.add(event)
+        db.session.flush()
+        happened_at = start + timedelta(days=event_index * 45)
+        gi = event_index % 4 != 3
+
+        # promote or age some athletes between events
+        for profile in profiles.values():
+            if rng.random() < 0.08 and profile["belt"] < len(BELTS) - 1:
+                profile["belt"] += 1
+            if rng.random() < 0.05:
+                profile["age"] = rng.choice(AGES)
+
+        for _ in range(25):
+            red_athlete, blue_athlete = rng.sample(athletes, 2)
+            red_profile = profiles[red_athlete.id]
+            open_class = rng.random() < 0.2
+            weight = OPEN_CLASS if open_class else red_profile["weight"]
+            division = divisions[division_key(gi, red_profile, weight)]
+            happened_at += timedelta(minutes=rng.choice([0, 7, 13]))
+
+            red_winner = rng.random() < 0.5
+            blue_winner = not red_winner
+            red_note = blue_note = None
+            roll = rng.random()
+            if roll < 0.04:
+                red_winner = blue_winner = True
+            elif roll < 0.07:
+                red_winner = blue_winner = False
+            elif roll < 0.10:
+                blue_note = "Disqualified by no show"
+            elif roll < 0.12:
+                red_note = WINNER_NOT_RECORDED
+
+            rated_winner_only = rng.choice([False, False, False, True, None])
+            match = Match(
+                happened_at=happened_at,
+                event_id=event.id,
+                division_id=division.id,
+                rated=rng.random() < 0.9,
+                rated_winner_only=rated_winner_only,
+            )
+            db.session.add(match)
+            db.session.flush()
+
+            for athlete, winner, note, red in (
+                (red_athlete, red_winner, red_note, True),
+                (blue_athlete, blue_winner, blue_note, False),
+            ):
+                db.session.add(
+                    MatchParticipant(
+                        match_id=match.id,
+                        athlete_id=athlete.id,
+                        team_id=profiles[athlete.id]["team"].id,
+                        seed=1,
+                        red=red,
+                        winner=winner,
+                        note=note,
+                        start_rating=0,
+                        end_rating=0,
+                        start_match_count=0,
+                        end_match_count=0,
+                    )
+                )
+
+            if rng.random() < 0.3:
+                places = (1, 2) if red_winner else (2, 1)
+                for athlete, place in zip((red_athlete, blue_athlete), places):
+                    existing = (
+                        db.session.query(Medal)
+                        .filter_by(
+                            event_id=event.id,
+                            division_id=division.id,
+                            athlete_id=athlete.id,
+                        )
+                        .first()
+                    )
+                    if existing is None:
+                        db.session.add(
+                            Medal(
+                                happened_at=happened_at,
+                                event_id=event.id,
+                                division_id=division.id,
+                                athlete_id=athlete.id,
+                                team_id=profiles[athlete.id]["team"].id,
+                                place=place,
+                                default_gold=False,
+                            )
+                        )
+
+        # a default gold in a non-open division, which open class weights can use
+        gold_athlete = rng.choice(athletes)
+        gold_profile = profiles[gold_athlete.id]
+        gold_division = divisions[
+            division_key(gi, gold_profile, rng.choice(WEIGHTS[:-1]))
+        ]
+        if (
+            db.session.query(Medal)
+            .filter_by(
+                event_id=event.id,
+                division_id=gold_division.id,
+                athlete_id=gold_athlete.id,
+            )
+            .first()
+            is None
+        ):
+            db.session.add(
+                Medal(
+                    happened_at=happened_at,
+                    event_id=event.id,
+                    division_id=gold_division.id,
+                    athlete_id=gold_athlete.id,
+                    team_id=gold_profile["team"].id,
+                    place=1,
+                    default_gold=True,
+                )
+            )
+
+    db.session.commit()
+
+
+def snapshot():
+    participants = {
+        row.id: (
+            row.start_rating,
+            row.end_rating,
+            row.weight_for_open,
+            row.rating_note,
+            row.start_match_count,
+            row.end_match_count,
+        )
+        for row in db.session.query(MatchParticipant)
+    }
+    matches = {row.id: row.rated for row in db.session.query(Match)}
+    return participants, matches
+
+
+def restore(state):
+    participants, matches = state
+    db.session.execute(
+        db.update(MatchParticipant),
+        [
+            {
+                "id": id,
+                "start_rating": values[0],
+                "end_rating": values[1],
+                "weight_for_open": values[2],
+                "rating_note": values[3],
+                "start_match_count": values[4],
+                "end_match_count": values[5],
+            }
+            for id, values in participants.items()
+        ],
+    )
+    db.session.execute(
+        db.update(Match),
+        [{"id": id, "rated": rated} for id, rated in matches.items()],
+    )
+    db.session.commit()
+    db.session.expire_all()
+
+
+def checkpoint_rows():
+    return sorted(
+        (
+            row.gi,
+            row.gender,
+            row.checkpoint_at,
+            str(row.athlete_id),
+            row.last_participant_id,
+            row.ages,
+            row.counted,
+            row.weight_participant_id,
+            row.default_gold_at,
+            row.default_gold_weight,
+        )
+        for row in db.session.query(RatingCheckpoint)
+    )
+
+
+class RatingReplayTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        seed_history(random.Random(1234))
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        self.initial = snapshot()
+
+    def tearDown(self):
+        restore(self.initial)
+        # checkpoints describe the stored values they were written with
+        db.session.query(RatingCheckpoint).delete()
+        db.session.commit()
+        db.session.remove()
+        self.ctx.pop()
+
+    def assert_same_as_queries(self, **kwargs):
+        recompute_all_ratings(db, True, rerank=False, replay=False, **kwargs)
+        db.session.commit()
+        expected = snapshot()
+
+        restore(self.initial)
+        recompute_all_ratings(db, True, rerank=False, replay=True, **kwargs)
+        db.session.commit()
+        db.session.expire_all()
+        actual = snapshot()
+
+        self.assertEqual(expected[1], actual[1])
+        for id, values in expected[0].items():
+            self.assertEqual(values, actual[0][id], f"participant {id}")
+
+    def test_full_replay_matches_per_match_queries(self):
+        self.assert_same_as_queries()
+
+    def test_full_replay_changes_ratings(self):
+        recompute_all_ratings(db, True, rerank=False)
+        db.session.commit()
+        rated = (
+            db.session.query(MatchParticipant)
+            .filter(MatchParticipant.end_rating > 0)
+            .count()
+        )
+        self.assertGreater(rated, 0)
+
+    def test_partial_replays_match_per_match_queries(self):
+        # seed stored values from a full run, then perturb the later history so
+        # the scoped recomputes have something to correct
+        recompute_all_ratings(db, True, rerank=False)
+        db.session.commit()
+        midpoint = datetime(2019, 1, 1)
+        db.session.query(MatchParticipant).filter(
+            MatchParticipant.match_id.in_(
+                db.session.query(Match.id).filter(Match.happened_at >= midpoint)
+            )
+        ).update({"end_rating": 1000.0}, synchronize_session=False)
+        db.session.commit()
+        self.initial = snapshot()
+
+        athlete = (
+            db.session.query(Athlete)
+            .filter(Athlete.normalized_name == "replay athlete 7")
+            .one()
+        )
+
+        with self.subTest("start date"):
+            self.assert_same_as_queries(start_date=midpoint)
+        restore(self.initial)
+        with self.subTest("gender"):
+            self.assert_same_as_queries(gender=FEMALE, start_date=midpoint)
+        restore(self.initial)
+        with self.subTest("athlete"):
+            self.assert_same_as_queries(start_date=midpoint, athlete_id=str(athlete.id))
+        restore(self.initial)
+        with self.subTest("teens"):
+            self.assert_same_as_queries(teens=True)
+
+    def test_per_match_path_prefetches_medals_and_suspensions(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            recompute_all_ratings(db, True, rerank=False, replay=False)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        # get_weight still looks up default golds per match, medal places and
+        # suspended athletes are each resolved once
+        place_queries = [
+            statement
+            for statement in statements
+            if "FROM medals" in statement and "default_gold" not in statement
+        ]
+        athlete_queries = [
+            statement for statement in statements if "FROM athletes" in statement
+        ]
+        self.assertEqual(len(place_queries), 1)
+        self.assertEqual(len(athlete_queries), 1)
+
+    def test_start_date_replay_resumes_from_checkpoint(self):
+        recompute_all_ratings(db, True, rerank=False)
+        db.session.commit()
+        checkpoints = checkpoint_rows()
+        self.assertGreater(len(checkpoints), 0)
+
+        midpoint = datetime(2019, 6, 1)
+        resume_at = latest_checkpoint_at(db.session, True, MALE, midpoint)
+        self.assertIsNotNone(resume_at)
+        self.assertLess(resume_at, midpoint)
+
+        # perturb everything from the checkpoint on, so the resumed replay has
+        # something to correct
+        db.session.query(MatchParticipant).filter(
+            MatchParticipant.match_id.in_(
+                db.session.query(Match.id).filter(Match.happened_at >= resume_at)
+            )
+        ).update({"end_rating": 1000.0}, synchronize_session=False)
+        db.session.commit()
+        self.initial = snapshot()
+
+        self.assert_same_as_queries(start_date=midpoint)
+
+        # the replayed part writes the same checkpoints again
+        restore(self.initial)
+        recompute_all_ratings(db, True, rerank=False)
+        recompute_all_ratings(db, True, rerank=False, start_date=midpoint)
+        db.session.commit()
+        self.assertEqual(checkpoints, checkpoint_rows())
+
+    def test_rescoring_affected_matches_matches_recompute(self):
+        # the second pass sees the rated flags the first one wrote for later
+        # matches at the same event, after that the stored ratings are stable
+        recompute_all_ratings(db, True, rerank=False)
+        recompute_all_ratings(db, True, rerank=False)
+        db.session.commit()
+
+        match = (
+            db.session.query(Match)
+            .join(Division)
+            .filter(
+                Division.gi == True,
+                Division.gender == MALE,
+                Division.weight != OPEN_CLASS,
+                Match.rated == True,
+                Match.happened_at >= datetime(2019, 1, 1),
+            )
+            .order_by(Match.happened_at, Match.id)
+            .first()
+        )
+        participants = (
+            db.session.query(MatchParticipant).filter_by(match_id=match.id).all()
+        )
+        for participant in participants:
+            participant.winner = not participant.winner
+        db.session.commit()
+        edited = snapshot()
+
+        affected = rescore_after_match_change(
+            db,
+            True,
+            MALE,
+            match.happened_at,
+            match.event_id,
+            [participant.athlete_id for participant in participants],
+        )
+        db.session.commit()
+        db.session.expire_all()
+        actual = snapshot()
+
+        restore(edited)
+        event_start = (
+            db.session.query(db.func.min(Match.happened_at))
+            .join(Division)
+            .filter(
+                Division.gi == True,
+                Division.gender == MALE,
+                Match.event_id == match.event_id,
+            )
+            .scalar()
+        )
+        recompute_all_ratings(
+            db, True, gender=MALE, start_date=event_start, rerank=False
+        )
+        db.session.commit()
+        db.session.expire_all()
+
+        expected = snapshot()
+        for id, values in expected[0].items():
+            self.assertEqual(values, actual[0][id], f"participant {id}")
+        self.assertEqual(expected[1], actual[1])
+        later = (
+            db.session.query(Match)
+            .join(Division)
+            .filter(
+                Division.gi == True,
+                Division.gender == MALE,
+                Match.happened_at >= event_start,
+            )
+            .count()
+        )
+        self.assertGreater(affected.matches, 0)
+        self.assertLess(affected.matches, later)
+        self.assertTrue(
+            {participant.athlete_id for participant in participants}
+            <= affected.athletes
+        )
+
+    def test_dry_run_diff_matches_recompute_without_writing(self):
+        checkpoints = db.session.query(RatingCheckpoint).count()
+        total, changes = dry_run_ratings(db, [True])
+        out = io.StringIO()
+        summary = write_rating_diff(db.session, changes, out)
+        db.session.rollback()
+
+        self.assertEqual(snapshot(), self.initial)
+        self.assertEqual(db.session.query(RatingCheckpoint).count(), checkpoints)
+
+        recompute_all_ratings(db, True, rerank=False)
+        db.session.commit()
+        db.session.expire_all()
+        participants, matches = snapshot()
+
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        expected = {
+            str(id)
+            for id, values in participants.items()
+            if (values[0], values[1], values[3])
+            != (
+                self.initial[0][id][0],
+                self.initial[0][id][1],
+                self.initial[0][id][3],
+            )
+        }
+        self.assertEqual({row["participant_id"] for row in rows}, expected)
+        self.assertEqual(summary.participants_changed, len(expected))
+        for row in rows:
+            values = participants[uuid.UUID(row["participant_id"])]
+            self.assertEqual(float(row["new_end_rating"]), values[1])
+        self.assertEqual(
+            summary.rated_flags_changed,
+            sum(rated != self.initial[1][id] for id, rated in matches.items()),
+        )
+        self.assertGreater(total, 0)
+
+    def test_parallel_replay_matches_serial_replay(self):
+        recompute_all_ratings(db, True, rerank=False)
+        recompute_all_ratings(db, False, rerank=False)
+        db.session.commit()
+        expected = snapshot()
+
+        restore(self.initial)
+        changed = replay_ratings_in_parallel(db, [True, False], 2)
+        db.session.commit()
+        db.session.expire_all()
+
+        self.assertGreater(changed, 0)
+        self.assertEqual(expected, snapshot())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import re
+import sys
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import g
+
+from extensions import db
+from models import Athlete, AthleteRating
+from request_metrics import (
+    RequestTimings,
+    _observe_statement,
+    get_metrics_store,
+)
+from test_db import TestDbMixin
+
+TOP_URL = "/api/top?gender=Male&age=Adult&belt=BLACK&gi=true"
+
+
+@mock.patch("routes.top.get_s3_client", return_value=None)
+class RequestMetricsTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        athlete = Athlete(
+            name="Metrics Athlete",
+            normalized_name="metrics athlete",
+            slug="metrics-athlete",
+        )
+        db.session.add(athlete)
+        db.session.flush()
+        db.session.add(
+            AthleteRating(
+                athlete_id=athlete.id,
+                gender="Male",
+                age="Adult",
+                belt="BLACK",
+                gi=True,
+                weight="",
+                rating=1600.0,
+                match_happened_at=datetime.now(),
+                rank=1,
+                percentile=1.0,
+                match_count=10,
+            )
+        )
+        db.session.commit()
+
+    def setUp(self):
+        self.client = self.app_module.app.test_client()
+        with self.app_module.app.app_context():
+            get_metrics_store().clear()
+
+    def tearDown(self):
+        for name in ("METRICS_TOKEN", "REQUEST_STATEMENT_LOG_THRESHOLD"):
+            self.app_module.app.config.pop(name, None)
+
+    def test_server_timing_header(self, _mock_s3):
+        response = self.client.get(TOP_URL)
+        self.assertEqual(response.status_code, 200)
+        timings = response.headers.getlist("Server-Timing")
+        self.assertEqual(
+            [timing.split(";")[0] for timing in timings], ["db", "serialize", "total"]
+        )
+        statements = int(re.search(r'desc="(\d+) statements', timings[0]).group(1))
+        self.assertGreater(statements, 0)
+
+    def test_statements_over_threshold_are_logged(self, _mock_s3):
+        self.app_module.app.config["REQUEST_STATEMENT_LOG_THRESHOLD"] = 1
+        with self.assertLogs("ibjjf", "WARNING") as logs:
+            self.client.get(TOP_URL)
+        self.assertIn("SQL statements in", logs.output[0])
+        self.assertTrue(any("SELECT" in line for line in logs.output[1:]))
+
+        self.app_module.app.config["REQUEST_STATEMENT_LOG_THRESHOLD"] = 1000
+        with mock.patch("request_metrics.log") as log:
+            self.client.get(TOP_URL)
+        log.warning.assert_not_called()
+
+    def test_metrics_endpoint(self, _mock_s3):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.app_module.app.config["METRICS_TOKEN"] = "secret"
+        self.assertEqual(
+            self.client.get(
+                "/metrics", headers={"Authorization": "Bearer wrong"}
+            ).status_code,
+            404,
+        )
+
+        self.client.get(TOP_URL)
+        self.client.get(TOP_URL)
+        response = self.client.get(
+            "/metrics", headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn(
+            'ibjjf_http_request_duration_seconds_count{endpoint="/api/top",method="GET"} 2',
+            body,
+        )
+        self.assertIn(
+            'ibjjf_http_request_duration_seconds_bucket{endpoint="/api/top",method="GET",le="+Inf"} 2',
+            body,
+        )
+        statements = re.search(
+            r'ibjjf_db_statements_total\{endpoint="/api/top",method="GET"\} (\d+)', body
+        )
+        self.assertGreater(int(statements.group(1)), 0)
+        self.assertIn("ibjjf_response_cache_total", body)
+
+    def test_rows_reported_by_the_driver_are_counted(self, _mock_s3):
+        connection = SimpleNamespace(info={})
+        with self.app_module.app.test_request_context():
+            g.request_timings = RequestTimings(started=0)
+            for description, rowcount in ((("id",),), 3), (None, 2), ((("id",),), -1):
+                cursor = SimpleNamespace(description=description, rowcount=rowcount)
+                _observe_statement(connection, cursor, "SELECT 1", (), False, 0.001)
+            self.assertEqual(g.request_timings.statements, 3)
+            self.assertEqual(g.request_timings.rows, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
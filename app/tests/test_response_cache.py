@@ -0,0 +1,169 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+from datetime import datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from extensions import db
+from models import Athlete, AthleteRating, RankingGeneration
+from response_cache import ResponseCache, get_response_cache
+from test_db import TestDbMixin
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "cache.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_hits_and_misses_are_shared_between_workers(self):
+        worker, other_worker = ResponseCache(self.path), ResponseCache(self.path)
+        self.assertIsNone(worker.get("top", "a"))
+        worker.put("top", "a", b"body")
+        self.assertEqual(other_worker.get("top", "a"), b"body")
+        self.assertIsNone(other_worker.get("other", "a"))
+        self.assertEqual(
+            worker.stats(),
+            {
+                "top": {"hits": 1, "misses": 1, "entries": 1, "bytes": 4},
+                "other": {"misses": 1},
+            },
+        )
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.path, max_entries=2, max_bytes=10)
+        cache.put("top", "a", b"aaa")
+        cache.put("top", "b", b"bbb")
+        time.sleep(0.01)
+        cache.get("top", "a")
+        cache.put("top", "c", b"ccc")
+        self.assertIsNone(cache.get("top", "b"))
+        self.assertEqual(cache.get("top", "a"), b"aaa")
+
+        # over the byte bound, as many entries go as needed
+        cache.put("top", "d", b"dddddddd")
+        self.assertIsNone(cache.get("top", "a"))
+        self.assertIsNone(cache.get("top", "c"))
+        self.assertEqual(cache.get("top", "d"), b"dddddddd")
+        self.assertEqual(cache.stats()["top"]["evictions"], 3)
+
+        cache.put("top", "e", b"x" * 11)
+        self.assertIsNone(cache.get("top", "e"))
+
+    def test_entries_expire(self):
+        cache = ResponseCache(self.path, ttl_seconds=60)
+        cache.put("top", "a", b"body")
+        with mock.patch("response_cache.time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("top", "a"))
+        self.assertNotIn("entries", cache.stats()["top"])
+
+    def test_clear_namespace(self):
+        cache = ResponseCache(self.path)
+        cache.put("top", "a", b"body")
+        cache.put("other", "a", b"body")
+        cache.clear("top")
+        self.assertIsNone(cache.get("top", "a"))
+        self.assertEqual(cache.get("other", "a"), b"body")
+
+    def test_unusable_store_is_a_miss(self):
+        cache = ResponseCache(self.temp_dir)
+        cache.put("top", "a", b"body")
+        self.assertIsNone(cache.get("top", "a"))
+
+
+class TopResponseCacheTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        athlete = Athlete(
+            name="Cached Athlete",
+            normalized_name="cached athlete",
+            slug="cached-athlete",
+            country="BR",
+        )
+        db.session.add(athlete)
+        db.session.flush()
+        db.session.add(
+            AthleteRating(
+                athlete_id=athlete.id,
+                gender="Male",
+                age="Adult",
+                belt="BLACK",
+                gi=True,
+                weight="",
+                rating=1700.0,
+                match_happened_at=datetime.now(),
+                rank=1,
+                percentile=1.0,
+                match_count=10,
+            )
+        )
+        db.session.add(
+            RankingGeneration(
+                gi=True,
+                generated_at=datetime.now(),
+                activity_period=datetime.now(),
+                previous_date=datetime.now(),
+                fingerprint="",
+                generation_id=uuid.uuid4(),
+            )
+        )
+        db.session.commit()
+
+    def setUp(self):
+        self.client = self.app_module.app.test_client()
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        get_response_cache().clear()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    @mock.patch("routes.top.get_s3_client", return_value=None)
+    def test_top_is_cached_per_generation(self, _mock_s3):
+        counters = get_response_cache().stats().get("top", {})
+        lookups = (counters.get("hits", 0), counters.get("misses", 0))
+        url = "/api/top?gender=Male&age=Adult&belt=BLACK&gi=true"
+        first = self.client.get(url)
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        second = self.client.get(f"{url}&page=1&country=")
+        self.assertEqual(second.headers["X-Cache"], "HIT")
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual(second.get_json()["rows"][0]["name"], "Cached Athlete")
+        self.assertEqual(
+            self.client.get(f"{url}&name=cached").headers["X-Cache"], "MISS"
+        )
+
+        # a new generation misses, and does not see the old board's response
+        db.session.query(AthleteRating).update({AthleteRating.rating: 1800.0})
+        db.session.query(RankingGeneration).update(
+            {RankingGeneration.generation_id: uuid.uuid4()}
+        )
+        db.session.commit()
+        third = self.client.get(url)
+        self.assertEqual(third.headers["X-Cache"], "MISS")
+        self.assertEqual(third.get_json()["rows"][0]["rating"], 1800)
+
+        counters = get_response_cache().stats()["top"]
+        self.assertEqual(
+            (counters["hits"] - lookups[0], counters["misses"] - lookups[1]), (1, 3)
+        )
+
+    def test_errors_are_not_cached(self):
+        response = self.client.get(
+            "/api/top?gender=Male&age=Adult&belt=BLACK&gi=true&page=0"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("entries", get_response_cache().stats().get("top", {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
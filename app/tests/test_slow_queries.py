@@ -0,0 +1,189 @@
+import importlib
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy import create_engine, text
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from extensions import db  # noqa: E402
+from models import Athlete, SlowQuery  # noqa: E402
+from slow_queries import fingerprint_statement, recorder  # noqa: E402
+from test_db import TestDbMixin  # noqa: E402
+
+ATHLETE_BY_NAME = "SELECT id, name FROM athletes WHERE normalized_name = :name"
+
+
+class FingerprintTestCase(unittest.TestCase):
+    def test_literals_and_placeholder_lists_are_masked(self):
+        self.assertEqual(
+            fingerprint_statement(
+                "SELECT *  FROM matches\n WHERE rated = 1 AND belt = 'BLACK' "
+                "AND id IN (?, ?, ?) LIMIT 10"
+            ),
+            "SELECT * FROM matches WHERE rated = ? AND belt = ? AND id IN (...) LIMIT ?",
+        )
+        self.assertEqual(
+            fingerprint_statement("SELECT m1.id FROM matches m1 WHERE note = 'it''s'"),
+            "SELECT m1.id FROM matches m1 WHERE note = ?",
+        )
+
+    def test_fast_statements_are_not_queued(self):
+        conn = SimpleNamespace(engine=None)
+        cursor = SimpleNamespace()
+        with mock.patch.object(recorder, "threshold_seconds", 0.5):
+            recorder.observe(conn, cursor, "SELECT 1", (), False, 0.1)
+        with mock.patch.object(recorder, "threshold_seconds", 0):
+            recorder.observe(conn, cursor, "SELECT 1", (), False, 10)
+        self.assertTrue(recorder._queue.empty())
+
+    def test_executemany_keeps_the_first_parameter_set(self):
+        conn = SimpleNamespace(engine=None)
+        cursor = SimpleNamespace()
+        with mock.patch.multiple(recorder, threshold_seconds=0.5, background=False):
+            recorder.observe(
+                conn, cursor, "INSERT INTO t VALUES (?)", [(1,), (2,), (3,)], True, 1
+            )
+        slow = recorder._queue.get_nowait()
+        self.assertEqual(slow.parameters, (1,))
+        self.assertTrue(slow.executemany)
+
+
+class SlowQueriesTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        db.session.add(
+            Athlete(
+                name="Slow Athlete",
+                normalized_name="slow athlete",
+                slug="slow-athlete",
+            )
+        )
+        db.session.commit()
+
+    def setUp(self):
+        self.app_context = self.app_module.app.app_context()
+        self.app_context.push()
+        SlowQuery.query.delete()
+        db.session.commit()
+        patcher = mock.patch.multiple(
+            recorder, threshold_seconds=1e-9, background=False
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        recorder.threshold_seconds = 0
+        recorder.drain()
+        db.session.remove()
+        self.app_context.pop()
+
+    def record(self, statement, **parameters):
+        with self.app_module.app.test_request_context():
+            db.session.execute(text(statement), parameters).fetchall()
+            db.session.rollback()
+        recorder.drain()
+
+    def recorded(self, statement):
+        recorder.threshold_seconds = 0
+        fingerprint = fingerprint_statement(statement.replace(":name", "?"))
+        return SlowQuery.query.filter_by(statement=fingerprint).one_or_none()
+
+    def test_statements_are_grouped_by_fingerprint_with_a_plan(self):
+        self.record(ATHLETE_BY_NAME, name="slow athlete")
+        self.record(ATHLETE_BY_NAME, name="someone else")
+
+        slow_query = self.recorded(ATHLETE_BY_NAME)
+        self.assertEqual(slow_query.calls, 2)
+        self.assertGreaterEqual(slow_query.total_seconds, slow_query.max_seconds)
+        self.assertIn("athletes", slow_query.plan)
+        self.assertNotIn("EXPLAIN failed", slow_query.plan)
+        self.assertIsNotNone(slow_query.explained_at)
+        self.assertIn(
+            slow_query.example_parameters, ('["slow athlete"]', '["someone else"]')
+        )
+
+    def test_plans_are_refreshed_at_most_every_interval(self):
+        with mock.patch.object(recorder, "_explain", return_value="plan") as explain:
+            self.record(ATHLETE_BY_NAME, name="slow athlete")
+            self.record(ATHLETE_BY_NAME, name="slow athlete")
+            self.assertEqual(explain.call_count, 1)
+
+            recorder.threshold_seconds = 0
+            slow_query = self.recorded(ATHLETE_BY_NAME)
+            slow_query.explained_at = datetime.utcnow() - timedelta(hours=2)
+            db.session.commit()
+            recorder.threshold_seconds = 1e-9
+            self.record(ATHLETE_BY_NAME, name="slow athlete")
+            self.assertEqual(explain.call_count, 2)
+
+    def test_statements_outside_requests_are_not_recorded(self):
+        db.session.execute(text(ATHLETE_BY_NAME), {"name": "slow athlete"}).fetchall()
+        db.session.rollback()
+        self.assertTrue(recorder._queue.empty())
+        recorder.drain()
+        self.assertIsNone(self.recorded(ATHLETE_BY_NAME))
+
+    def test_recorder_statements_are_not_recorded(self):
+        self.record(ATHLETE_BY_NAME, name="slow athlete")
+        recorder.threshold_seconds = 0
+        statements = [slow_query.statement for slow_query in SlowQuery.query.all()]
+        self.assertTrue(statements)
+        self.assertFalse(
+            any("slow_queries" in statement for statement in statements), statements
+        )
+
+    def test_admin_page_ranks_by_total_time(self):
+        recorder.threshold_seconds = 0
+        now = datetime.utcnow()
+        for fingerprint, statement, total_seconds in (
+            ("a" * 40, "SELECT cheap", 1.0),
+            ("b" * 40, "SELECT expensive", 30.0),
+        ):
+            db.session.add(
+                SlowQuery(
+                    fingerprint=fingerprint,
+                    statement=statement,
+                    example_statement=statement,
+                    calls=3,
+                    total_seconds=total_seconds,
+                    max_seconds=total_seconds / 2,
+                    first_seen_at=now,
+                    last_seen_at=now,
+                )
+            )
+        db.session.commit()
+
+        admin_module = importlib.import_module("admin.app")
+        db_path = os.path.join(self.temp_dir, "test.db")
+        admin_module.app.config.update(
+            TESTING=True, SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}"
+        )
+        with admin_module.app.app_context():
+            admin_module.app.extensions["sqlalchemy"].engines[None] = create_engine(
+                f"sqlite:///{db_path}"
+            )
+        client = admin_module.app.test_client()
+        self.assertEqual(client.get("/slow_queries").status_code, 302)
+
+        with client.session_transaction() as session:
+            session["logged_in"] = True
+        body = client.get("/slow_queries").get_data(as_text=True)
+        self.assertLess(body.index("SELECT expensive"), body.index("SELECT cheap"))
+
+        client.post("/slow_queries", data={"action": "delete", "fingerprint": "b" * 40})
+        db.session.expire_all()
+        self.assertEqual(
+            [slow_query.statement for slow_query in SlowQuery.query.all()],
+            ["SELECT cheap"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from rating_profile import profile_pipeline
+from statement_timing import (
+    _STARTS,
+    add_statement_observer,
+    remove_statement_observer,
+)
+
+
+class StatementTimingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.seen = []
+        add_statement_observer(self.observe)
+        self.addCleanup(remove_statement_observer, self.observe)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def observe(self, conn, cursor, statement, parameters, executemany, seconds):
+        self.seen.append((statement, seconds))
+
+    def test_observers_are_added_once(self):
+        add_statement_observer(self.observe)
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        self.assertEqual([statement for statement, _ in self.seen], ["SELECT 1"])
+        self.assertGreaterEqual(self.seen[0][1], 0)
+
+    def test_failed_statements_leave_no_start(self):
+        with self.engine.connect() as connection:
+            with self.assertRaises(OperationalError):
+                connection.execute(text("SELECT * FROM missing"))
+            self.assertEqual(connection.info.get(_STARTS), [])
+            connection.execute(text("SELECT 1"))
+            self.assertEqual(connection.info.get(_STARTS), [])
+        self.assertEqual([statement for statement, _ in self.seen], ["SELECT 1"])
+
+    def test_profile_only_sees_its_engine(self):
+        other = create_engine("sqlite://")
+        self.addCleanup(other.dispose)
+        with profile_pipeline(self.engine) as profile:
+            with self.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            with other.connect() as connection:
+                connection.execute(text("SELECT 2"))
+        self.assertEqual(profile.queries, 1)
+        self.assertEqual(len(self.seen), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
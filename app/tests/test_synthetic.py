@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import func
+
+from extensions import db
+from models import Division, Event, Match, MatchParticipant, Medal, Suspension
+from ratings import recompute_all_ratings
+from recompute_benchmark import run_recompute_benchmark
+from synthetic import SyntheticConfig, generate_synthetic_history
+from test_db import TestDbMixin
+from test_replay import restore, snapshot
+
+CONFIG = SyntheticConfig(
+    matches=600, seed=7, end=datetime(2025, 6, 1), registrations_per_event=150
+)
+
+
+class SyntheticHistoryTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        cls.summary = generate_synthetic_history(db.session, CONFIG)
+        db.session.commit()
+
+    def setUp(self):
+        self.ctx = self.app_module.app.app_context()
+        self.ctx.push()
+        self.initial = snapshot()
+
+    def tearDown(self):
+        restore(self.initial)
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_summary_matches_rows(self):
+        summary = self.summary
+        self.assertGreaterEqual(summary.matches, CONFIG.matches)
+        self.assertEqual(db.session.query(Match).count(), summary.matches)
+        self.assertEqual(
+            db.session.query(MatchParticipant).count(), 2 * summary.matches
+        )
+        self.assertEqual(db.session.query(Medal).count(), summary.medals)
+        self.assertEqual(db.session.query(Event).count(), summary.events)
+        self.assertEqual(db.session.query(Suspension).count(), summary.suspensions)
+        self.assertGreater(summary.default_golds, 0)
+        self.assertGreater(summary.open_class_matches, 0)
+        self.assertGreater(summary.promotions, 0)
+        # the last event is held on the end day
+        self.assertLess(
+            db.session.query(func.max(Match.happened_at)).scalar(),
+            CONFIG.end + timedelta(days=1),
+        )
+
+    def test_brackets_are_single_elimination(self):
+        medals_only = {
+            event.id for event in db.session.query(Event).filter(Event.medals_only)
+        }
+        brackets = (
+            db.session.query(
+                Match.event_id,
+                Match.division_id,
+                func.count(Match.id),
+                func.max(Match.division_size),
+            )
+            .group_by(Match.event_id, Match.division_id)
+            .all()
+        )
+        self.assertGreater(len(brackets), 0)
+        for event_id, division_id, matches, size in brackets:
+            self.assertEqual(matches, 1 if event_id in medals_only else size - 1)
+            places = sorted(
+                place
+                for (place,) in db.session.query(Medal.place).filter(
+                    Medal.event_id == event_id, Medal.division_id == division_id
+                )
+            )
+            self.assertEqual(places[:2], [1, 2])
+            self.assertLessEqual(len(places), 4)
+
+        default_golds = db.session.query(Medal).filter(Medal.default_gold).all()
+        self.assertEqual(len(default_golds), self.summary.default_golds)
+        for medal in default_golds:
+            self.assertEqual(medal.place, 1)
+            self.assertEqual(
+                db.session.query(Match)
+                .filter(
+                    Match.event_id == medal.event_id,
+                    Match.division_id == medal.division_id,
+                )
+                .count(),
+                0,
+            )
+
+    def test_replay_matches_per_match_queries(self):
+        recompute_all_ratings(db, True, rerank=False, replay=False)
+        db.session.commit()
+        expected = snapshot()
+
+        restore(self.initial)
+        recompute_all_ratings(db, True, rerank=False)
+        db.session.commit()
+        db.session.expire_all()
+        actual = snapshot()
+
+        self.assertEqual(expected, actual)
+        rated_ages = (
+            db.session.query(func.count(MatchParticipant.id))
+            .join(Match)
+            .join(Division)
+            .filter(Division.gi == True, MatchParticipant.end_rating > 0)
+            .scalar()
+        )
+        self.assertGreater(rated_ages, 0)
+
+    def test_benchmark_report(self):
+        report = run_recompute_benchmark(db, CONFIG, generate=False)
+        json.dumps(report)
+        phases = [phase["name"] for phase in report["phases"]]
+        self.assertEqual(
+            phases,
+            [
+                "score_gi",
+                "score_nogi",
+                "rank",
+                "rerank",
+                "score_gi_last_year",
+                "rank_incremental",
+                "rescore_match",
+            ],
+        )
+        self.assertEqual(report["matches"], self.summary.matches)
+        self.assertIsNone(report["dataset"])
+        score_gi = report["phases"][0]
+        self.assertGreater(score_gi["matches_per_second"], 0)
+        # the replay loads a partition with a handful of queries
+        self.assertLess(score_gi["queries_per_match"], 1)
+        self.assertIn("replay", score_gi["profile"]["phases"])
+        # only the first regeneration builds the previous-ranking snapshot
+        rank, rerank = report["phases"][2:4]
+        self.assertIn("rank/previous/snapshot", rank["profile"]["phases"])
+        self.assertNotIn("rank/previous/snapshot", rerank["profile"]["phases"])
+        # the history ended long ago, so the boards are empty and the
+        # incremental regeneration reports that it rebuilt them in full
+        self.assertIs(report["phases"][5]["incremental"], False)
+
+
+class CurrentBenchmarkTestCase(TestDbMixin, unittest.TestCase):
+    @classmethod
+    def _seed_data(cls):
+        # a history up to today, so its last events are on the boards
+        generate_synthetic_history(
+            db.session, SyntheticConfig(matches=600, seed=7, end=datetime.now())
+        )
+        db.session.commit()
+
+    def test_rank_incremental_phase_is_incremental(self):
+        with self.app_module.app.app_context():
+            report = run_recompute_benchmark(db, generate=False)
+        phase = report["phases"][5]
+        self.assertEqual(phase["name"], "rank_incremental")
+        self.assertIs(phase["incremental"], True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,15 @@
 import os
 import sys
 import unittest
+import uuid
 from datetime import datetime
 from unittest import mock
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from extensions import db
-from models import Athlete, AthleteRating
+from models import Athlete, AthleteRating, RankingGeneration
+from response_cache import get_response_cache
 from test_db import TestDbMixin
 
 
@@ -63,11 +65,110 @@ class TopApiTestCase(TestDbMixin, unittest.TestCase):
         self.assertEqual(len(data["rows"]), 1)
         self.assertEqual(data["rows"][0]["name"], "Test Athlete")
         self.assertEqual(data["rows"][0]["rank"], 1)
+        # the board was not generated, so there is no generation to report
+        self.assertIsNone(data["generation"])
 
     def test_top_missing_params(self):
         response = self.client.get("/api/top")
         self.assertEqual(response.status_code, 400)
 
 
+@mock.patch("routes.top.RATINGS_PAGE_SIZE", 2)
+@mock.patch("routes.top.get_s3_client", return_value=None)
+class TopPaginationTestCase(TestDbMixin, unittest.TestCase):
+    URL = "/api/top?gender=Male&age=Adult&belt=BLACK&gi=true"
+
+    @classmethod
+    def _seed_data(cls):
+        for index in range(5):
+            athlete = Athlete(
+                name=f"Paged Athlete {index}",
+                normalized_name=f"paged athlete {index}",
+                slug=f"paged-athlete-{index}",
+                country="BR" if index < 3 else "US",
+            )
+            db.session.add(athlete)
+            db.session.flush()
+            db.session.add(
+                AthleteRating(
+                    athlete_id=athlete.id,
+                    gender="Male",
+                    age="Adult",
+                    belt="BLACK",
+                    gi=True,
+                    weight="",
+                    rating=1600.0 - index,
+                    match_happened_at=datetime.utcnow(),
+                    rank=index + 1,
+                    percentile=0.1,
+                    match_count=10,
+                )
+            )
+        db.session.add(
+            RankingGeneration(
+                gi=True,
+                generated_at=datetime.now(),
+                activity_period=datetime.now(),
+                previous_date=datetime.now(),
+                fingerprint="",
+                generation_id=uuid.uuid4(),
+            )
+        )
+        db.session.commit()
+
+    def setUp(self):
+        self.client = self.app_module.app.test_client()
+        with self.app_module.app.app_context():
+            get_response_cache().clear()
+
+    def _count_lookups(self):
+        with self.app_module.app.app_context():
+            counters = get_response_cache().stats().get("top-count", {})
+        return counters.get("hits", 0), counters.get("misses", 0)
+
+    def test_counts_are_cached_per_filter_combination(self, _mock_s3):
+        hits, misses = self._count_lookups()
+        pages = [
+            self.client.get(f"{self.URL}&page={page}").get_json() for page in (1, 2, 3)
+        ]
+        self.assertEqual([data["totalPages"] for data in pages], [3, 3, 3])
+        self.assertEqual([data["hasMore"] for data in pages], [True, True, False])
+        self.assertEqual(self._count_lookups(), (hits + 2, misses + 1))
+
+        data = self.client.get(f"{self.URL}&country=us").get_json()
+        self.assertEqual(data["totalPages"], 1)
+        self.assertEqual(self._count_lookups(), (hits + 2, misses + 2))
+
+    def test_counts_are_not_shared_across_casings(self, _mock_s3):
+        # board columns are compared case-sensitively, so a lowercase request
+        # matches no rows and must not hand its count to the real board
+        data = self.client.get(
+            "/api/top?gender=male&age=adult&belt=black&gi=true"
+        ).get_json()
+        self.assertEqual(data["rows"], [])
+        self.assertEqual(data["totalPages"], 0)
+
+        data = self.client.get(self.URL).get_json()
+        self.assertEqual(len(data["rows"]), 2)
+        self.assertEqual(data["totalPages"], 3)
+        self.assertTrue(data["hasMore"])
+
+    def test_name_filter_is_not_counted(self, _mock_s3):
+        with mock.patch("routes.top._top_count") as top_count:
+            pages = [
+                self.client.get(f"{self.URL}&name=paged&page={page}").get_json()
+                for page in (1, 2, 3, 4)
+            ]
+            top_count.assert_not_called()
+        self.assertEqual(
+            [[row["rank"] for row in data["rows"]] for data in pages],
+            [[1, 2], [3, 4], [5], []],
+        )
+        self.assertEqual([data["totalPages"] for data in pages], [2, 3, 3, 3])
+        self.assertEqual(
+            [data["hasMore"] for data in pages], [True, True, False, False]
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,56 @@
+import importlib
+import logging
+import time
+from typing import List, Optional
+
+log = logging.getLogger("ibjjf")
+
+# Heavy dependencies are imported by the functions that use them, so a web
+# worker boots without them and only loads what its requests need; the import
+# time budget is checked by tests/test_import_time.py. The first request to
+# need one pays for its import. WARMUP_MODULES moves that cost to startup for
+# the comma separated modules it names, or for all of LAZY_MODULES with "all".
+# Under gunicorn --preload the master imports them once, before forking.
+
+# the lazily imported dependencies and what they are for
+LAZY_MODULES = (
+    # S3 photo uploads and presigned URLs
+    "boto3",
+    # bracket, registration and Instagram page parsing
+    "bs4",
+    # bracket pages, news and Instagram fetches
+    "requests",
+    # uploaded photo and highlight asset validation
+    "PIL.Image",
+    # archived ranking boards
+    "numpy",
+)
+
+
+def warm_up(modules: Optional[str]) -> List[str]:
+    """Import the modules named in modules, "all" for LAZY_MODULES.
+
+    Returns the modules imported. A module that fails to import is logged and
+    skipped, so a typo cannot keep a worker from booting.
+    """
+    if not modules or not modules.strip():
+        return []
+    if modules.strip() == "all":
+        names = list(LAZY_MODULES)
+    else:
+        names = [name.strip() for name in modules.split(",") if name.strip()]
+
+    imported = []
+    start = time.perf_counter()
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            log.warning(f"Warm-up could not import {name}: {e}")
+            continue
+        imported.append(name)
+    log.info(
+        f"Warmed up {', '.join(imported) or 'nothing'} in "
+        f"{(time.perf_counter() - start) * 1000:.0f}ms"
+    )
+    return imported
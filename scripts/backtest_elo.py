@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import argparse
+import json
+from datetime import datetime
+import logging
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from backtest import backtest, parameter_grid
+from constants import (
+    MALE,
+    FEMALE,
+)
+from app import db, app
+
+log = logging.getLogger("ibjjf")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Backtest Elo parameter sets against the stored match history."
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--nogi",
+        action="store_true",
+        help="Use this flag to backtest only no gi.",
+    )
+    group.add_argument(
+        "--gi", action="store_true", help="Use this flag to backtest only gi."
+    )
+    parser.add_argument("--gender", type=str, help="Filter by gender.")
+    parser.add_argument(
+        "--grid",
+        type=str,
+        help="JSON file with a list of parameter overrides to compare with the current parameters.",
+    )
+    parser.add_argument(
+        "--since",
+        type=str,
+        help="Only score predictions for matches on or after this date (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Replay the parameter sets in this many processes.",
+    )
+    parser.add_argument(
+        "--output", type=str, help="Write the JSON report to this file."
+    )
+
+    args = parser.parse_args()
+
+    if args.gender and args.gender not in (MALE, FEMALE):
+        log.error(f"Invalid gender. Must be one of {MALE}, {FEMALE}")
+        return -1
+    if args.jobs < 1:
+        log.error("Invalid jobs. Must be at least 1")
+        return -1
+
+    since = None
+    if args.since:
+        try:
+            since = datetime.strptime(args.since, "%Y-%m-%d")
+        except ValueError:
+            log.error("Invalid since date format. Must be YYYY-MM-DD")
+            return -1
+
+    entries = []
+    if args.grid:
+        with open(args.grid) as f:
+            entries = json.load(f)
+    try:
+        parameters = parameter_grid(entries)
+    except ValueError as e:
+        log.error(f"Invalid grid: {e}")
+        return -1
+
+    if args.gi == args.nogi:
+        gis = [True, False]
+    else:
+        gis = [args.gi]
+
+    with app.app_context():
+        results = backtest(
+            db.session,
+            gis,
+            parameters,
+            gender=args.gender,
+            jobs=args.jobs,
+            evaluate_from=since,
+        )
+        db.session.rollback()
+
+    report = sorted(
+        (metrics.to_dict() for metrics in results),
+        key=lambda row: (row["log_loss"] is None, row["log_loss"]),
+    )
+    for row in report:
+        log.info(
+            f"{row['name']}: log loss {row['log_loss']}, "
+            f"Brier score {row['brier_score']} over {row['matches']} matches"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        log.info(f"Wrote backtest report to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
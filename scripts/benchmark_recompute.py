@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import argparse
+import json
+import logging
+import shutil
+import tempfile
+
+# the benchmark always runs on its own SQLite file, never on DATABASE_URL
+os.environ.pop("DATABASE_URL", None)
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from sqlalchemy import create_engine
+
+from recompute_benchmark import run_recompute_benchmark
+from synthetic import SyntheticConfig
+from app import db, app
+
+log = logging.getLogger("ibjjf")
+
+
+def use_database(path):
+    url = f"sqlite:///{os.path.abspath(path)}"
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    with app.app_context():
+        app.extensions["sqlalchemy"].engines[None] = create_engine(url)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time rating recomputes on a synthetic tournament history."
+    )
+    parser.add_argument(
+        "--matches",
+        type=int,
+        default=10000,
+        help="Number of synthetic matches to generate.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=1, help="Random seed for the synthetic history."
+    )
+    parser.add_argument(
+        "--database",
+        type=str,
+        help="SQLite file to generate into and keep. A temporary file is used otherwise.",
+    )
+    parser.add_argument(
+        "--reuse",
+        action="store_true",
+        help="Benchmark the history already in --database instead of generating one.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Also time a parallel replay with this many processes.",
+    )
+    parser.add_argument(
+        "--per-match",
+        action="store_true",
+        help="Also time the per-match query path (slow).",
+    )
+    parser.add_argument(
+        "--output", type=str, help="Write the JSON report to this file."
+    )
+
+    args = parser.parse_args()
+
+    if args.matches < 1:
+        log.error("Invalid matches. Must be at least 1")
+        return -1
+    if args.jobs < 1:
+        log.error("Invalid jobs. Must be at least 1")
+        return -1
+    if args.reuse and not (args.database and os.path.exists(args.database)):
+        log.error("--reuse requires an existing --database")
+        return -1
+    if args.database and os.path.exists(args.database) and not args.reuse:
+        log.error(f"{args.database} already exists, use --reuse or another path")
+        return -1
+
+    temp_dir = None
+    path = args.database
+    if path is None:
+        temp_dir = tempfile.mkdtemp()
+        path = os.path.join(temp_dir, "benchmark.db")
+
+    try:
+        use_database(path)
+        with app.app_context():
+            db.create_all()
+            report = run_recompute_benchmark(
+                db,
+                SyntheticConfig(matches=args.matches, seed=args.seed),
+                generate=not args.reuse,
+                jobs=args.jobs,
+                per_match=args.per_match,
+            )
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+    report["database_bytes"] = None if temp_dir else os.path.getsize(path)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        log.info(f"Wrote benchmark report to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
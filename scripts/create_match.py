@@ -12,7 +12,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app"))
 import argparse
 from app import db, app
 from models import Match, MatchParticipant, Medal, Division
-from ratings import recompute_all_ratings
+from ratings import rescore_after_match_change
 from match_division_sizes import refresh_match_division_sizes
 from photos import get_s3_client, bucket_name
 
@@ -237,15 +237,18 @@ if __name__ == "__main__":
                 db.session.add(medal)
         db.session.commit()
 
-        for athlete_id in athlete_uuids:
-            print("Recomputing ratings for", athlete_id)
-            recompute_all_ratings(
-                db,
-                gi_bool,
-                start_date=happened_at,
-                rerank=False,
-                athlete_id=str(athlete_id),
-            )
+        print("Rescoring matches affected by the new match")
+        affected = rescore_after_match_change(
+            db,
+            gi_bool,
+            args.gender,
+            happened_at,
+            event_uuid,
+            athlete_uuids,
+        )
+        print(
+            f"Rescored {affected.matches} matches of {len(affected.athletes)} athletes"
+        )
 
         event_name = match.event.name
         athlete1_name = participant1.athlete.name
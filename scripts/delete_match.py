@@ -11,10 +11,26 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app"))
 import argparse
 from app import db, app
 from models import Match, MatchParticipant
-from ratings import recompute_all_ratings
+from ratings import rescore_after_match_change
 from photos import get_s3_client, bucket_name
 
 
+def delete_match(db, match):
+    """Delete the match and rescore what it affected."""
+    division = match.division
+    athlete_ids = [participant.athlete_id for participant in match.participants]
+    db.session.query(MatchParticipant).filter_by(match_id=match.id).delete()
+    db.session.delete(match)
+    return rescore_after_match_change(
+        db,
+        division.gi,
+        division.gender,
+        match.happened_at,
+        match.event_id,
+        athlete_ids,
+    )
+
+
 def download_deleted_matches_file(s3_client, file_name):
     file_path = os.path.join(os.getcwd(), file_name)
     try:
@@ -97,21 +113,11 @@ if __name__ == "__main__":
             f"gi = {division.gi}, gender = {division.gender}."
         )
 
-        ids = set([str(participant.athlete_id) for participant in participants])
-        db.session.query(MatchParticipant).filter_by(match_id=match_uuid).delete()
-        db.session.delete(match)
-
-        for athlete_id in ids:
-            print("Recomputing ratings for", athlete_id)
-            recompute_all_ratings(
-                db,
-                gi,
-                gender,
-                happened_at,
-                score=True,
-                rerank=False,
-                athlete_id=athlete_id,
-            )
+        print("Rescoring matches affected by the deletion")
+        affected = delete_match(db, match)
+        print(
+            f"Rescored {affected.matches} matches of {len(affected.athletes)} athletes"
+        )
 
         with open(file_path, "a", newline="") as csvfile:
             writer = csv.writer(csvfile)
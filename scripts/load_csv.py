@@ -436,6 +436,7 @@ def process_file(csv_file_path: str, no_scores: bool):
                         rerank=not has_nogi,
                         rerankgi=True,
                         reranknogi=False,
+                        incremental_rank=True,
                     )
                 if has_nogi and not no_scores:
                     recompute_all_ratings(
@@ -448,6 +449,7 @@ def process_file(csv_file_path: str, no_scores: bool):
                         rerank=True,
                         rerankgi=has_gi,
                         reranknogi=True,
+                        incremental_rank=True,
                     )
 
                 db.session.commit()
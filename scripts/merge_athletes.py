@@ -8,7 +8,76 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app"))
 
 import argparse
 from app import db, app
-from models import Athlete, Medal, MatchParticipant, AthleteRating
+from models import (
+    Athlete,
+    Medal,
+    Match,
+    MatchParticipant,
+    AthleteRating,
+    AthleteLatestRating,
+    RankingDirtyAthlete,
+    RatingCheckpoint,
+)
+from rating_checkpoints import clear_checkpoints
+
+
+def merge_athletes(session, keep_uuid, merge_uuid):
+    """Move the merged athlete's matches, medals and pending board changes to
+    the athlete kept, then delete the merged athlete."""
+    # checkpoints from the first merged match or medal on no longer hold
+    first_merged = min(
+        filter(
+            None,
+            (
+                session.query(db.func.min(Match.happened_at))
+                .join(MatchParticipant)
+                .filter(MatchParticipant.athlete_id == merge_uuid)
+                .scalar(),
+                session.query(db.func.min(Medal.happened_at))
+                .filter(Medal.athlete_id == merge_uuid)
+                .scalar(),
+            ),
+        ),
+        default=None,
+    )
+    if first_merged is not None:
+        for gi in (True, False):
+            clear_checkpoints(session, gi, after=first_merged)
+    session.query(RatingCheckpoint).filter_by(athlete_id=merge_uuid).delete()
+    keep_medal_keys = {
+        (medal.event_id, medal.division_id)
+        for medal in session.query(Medal).filter_by(athlete_id=keep_uuid).all()
+    }
+    for medal in session.query(Medal).filter_by(athlete_id=merge_uuid).all():
+        if (medal.event_id, medal.division_id) in keep_medal_keys:
+            session.delete(medal)
+        else:
+            medal.athlete_id = keep_uuid
+            keep_medal_keys.add((medal.event_id, medal.division_id))
+    for match_participant in (
+        session.query(MatchParticipant).filter_by(athlete_id=merge_uuid).all()
+    ):
+        match_participant.athlete_id = keep_uuid
+    # a rescore still waiting for the boards moves to the athlete kept, from
+    # the earliest change of either athlete
+    for gi in (True, False):
+        dirty = session.query(RankingDirtyAthlete).filter(
+            RankingDirtyAthlete.gi == gi,
+            RankingDirtyAthlete.athlete_id.in_([keep_uuid, merge_uuid]),
+        )
+        earliest = dirty.with_entities(
+            db.func.min(RankingDirtyAthlete.happened_at)
+        ).scalar()
+        if earliest is None:
+            continue
+        dirty.delete(synchronize_session=False)
+        session.add(
+            RankingDirtyAthlete(gi=gi, athlete_id=keep_uuid, happened_at=earliest)
+        )
+    session.query(AthleteRating).filter_by(athlete_id=merge_uuid).delete()
+    session.query(AthleteLatestRating).filter_by(athlete_id=merge_uuid).delete()
+    session.delete(session.get(Athlete, merge_uuid))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Merge two athletes")
@@ -45,22 +114,7 @@ if __name__ == "__main__":
             sys.exit(1)
 
         print(f"Merging {merge.name} into {keep.name}")
-        keep_medal_keys = {
-            (medal.event_id, medal.division_id)
-            for medal in db.session.query(Medal).filter_by(athlete_id=keep_uuid).all()
-        }
-        for medal in db.session.query(Medal).filter_by(athlete_id=merge_uuid).all():
-            if (medal.event_id, medal.division_id) in keep_medal_keys:
-                db.session.delete(medal)
-            else:
-                medal.athlete_id = keep_uuid
-                keep_medal_keys.add((medal.event_id, medal.division_id))
-        for match_participant in (
-            db.session.query(MatchParticipant).filter_by(athlete_id=merge_uuid).all()
-        ):
-            match_participant.athlete_id = keep_uuid
-        db.session.query(AthleteRating).filter_by(athlete_id=merge_uuid).delete()
-        db.session.delete(merge)
+        merge_athletes(db.session, keep_uuid, merge_uuid)
         db.session.commit()
 
         print("Merge complete, make sure to recompute ratings.")
@@ -3,6 +3,8 @@
 import sys
 import os
 import argparse
+import json
+from contextlib import ExitStack
 from datetime import datetime
 import logging
 import daemon
@@ -10,7 +12,9 @@ from daemon import pidfile
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app"))
 
-from ratings import recompute_all_ratings
+from ratings import recompute_all_ratings, recompute_ratings_in_parallel
+from rating_diff import dry_run_ratings, write_rating_diff
+from rating_profile import profile_pipeline
 from constants import (
     MALE,
     FEMALE,
@@ -51,6 +55,42 @@ def main():
         action="store_true",
         help="Only recompute ratings for teens.",
     )
+    parser.add_argument(
+        "--no-replay",
+        action="store_true",
+        help="Rescore with per-match history queries instead of the in-memory replay.",
+    )
+    parser.add_argument(
+        "--no-checkpoints",
+        action="store_true",
+        help="Replay the full history instead of resuming from a rating checkpoint.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only rebuild the ranking board rows of athletes whose matches changed since the last generation.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Replay gi/no-gi and gender partitions in this many processes.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Compute new ratings in memory and report the changes without writing them.",
+    )
+    parser.add_argument(
+        "--diff",
+        type=str,
+        help="With --dry-run, write the participants whose ratings would change to this CSV file.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="Time each pipeline phase and SQL statement and write the JSON report to this file.",
+    )
     parser.add_argument(
         "--bg",
         action="store_true",
@@ -59,8 +99,16 @@ def main():
 
     args = parser.parse_args()
 
+    if args.diff and not args.dry_run:
+        log.error("--diff requires --dry-run")
+        return -1
+    if args.dry_run and (args.rank_only or args.no_replay):
+        log.error("--dry-run cannot be combined with --rank-only or --no-replay")
+        return -1
+
     if (
-        not args.start_date
+        not args.dry_run
+        and not args.start_date
         and not args.rank_only
         and not args.athlete_id
         and not args.teens
@@ -123,8 +171,37 @@ def run_recompute(args):
                 )
                 return -1
 
-    with app.app_context():
-        if (not args.gi and not args.nogi) or (args.gi and args.nogi):
+    if args.jobs < 1:
+        log.error("Invalid jobs. Must be at least 1")
+        return -1
+
+    if args.gi == args.nogi:
+        gis = [True, False]
+    else:
+        gis = [args.gi]
+
+    if args.dry_run:
+        return run_dry_run(args, gis, start_date)
+
+    with app.app_context(), ExitStack() as stack:
+        profile = None
+        if args.profile:
+            profile = stack.enter_context(profile_pipeline(db.engine))
+
+        if args.jobs > 1 and not args.rank_only and not args.no_replay:
+            recompute_ratings_in_parallel(
+                db,
+                gis,
+                args.jobs,
+                gender=args.gender,
+                start_date=start_date,
+                rank_previous_date=rank_previous_date,
+                athlete_id=args.athlete_id,
+                teens=args.teens,
+                use_checkpoints=not args.no_checkpoints,
+                incremental_rank=args.incremental,
+            )
+        elif (not args.gi and not args.nogi) or (args.gi and args.nogi):
             recompute_all_ratings(
                 db,
                 True,
@@ -137,6 +214,9 @@ def run_recompute(args):
                 rank_previous_date=rank_previous_date,
                 athlete_id=args.athlete_id,
                 teens=args.teens,
+                replay=not args.no_replay,
+                use_checkpoints=not args.no_checkpoints,
+                incremental_rank=args.incremental,
             )
             recompute_all_ratings(
                 db,
@@ -150,6 +230,9 @@ def run_recompute(args):
                 rank_previous_date=rank_previous_date,
                 athlete_id=args.athlete_id,
                 teens=args.teens,
+                replay=not args.no_replay,
+                use_checkpoints=not args.no_checkpoints,
+                incremental_rank=args.incremental,
             )
         else:
             recompute_all_ratings(
@@ -164,14 +247,49 @@ def run_recompute(args):
                 rank_previous_date=rank_previous_date,
                 athlete_id=args.athlete_id,
                 teens=args.teens,
+                replay=not args.no_replay,
+                use_checkpoints=not args.no_checkpoints,
+                incremental_rank=args.incremental,
             )
 
         db.session.commit()
 
+    if profile is not None:
+        profile.log_summary()
+        with open(args.profile, "w") as f:
+            json.dump(profile.to_dict(), f, indent=2)
+        log.info(f"Wrote profile to {args.profile}")
+
     log.info("Complete")
 
     return 0
 
 
+def run_dry_run(args, gis, start_date):
+    with app.app_context():
+        total, changes = dry_run_ratings(
+            db,
+            gis,
+            gender=args.gender,
+            start_date=start_date,
+            athlete_id=args.athlete_id,
+            teens=args.teens,
+            use_checkpoints=not args.no_checkpoints,
+        )
+        if args.diff:
+            with open(args.diff, "w", newline="") as out:
+                summary = write_rating_diff(db.session, changes, out)
+            log.info(f"Wrote rating diff to {args.diff}")
+        else:
+            summary = write_rating_diff(db.session, changes)
+        summary.matches_replayed = total
+        db.session.rollback()
+
+    for key, value in summary.to_dict().items():
+        log.info(f"{key}: {value}")
+
+    return 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -12,7 +12,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app"))
 import argparse
 from app import db, app
 from models import Match, MatchParticipant, Athlete
-from ratings import recompute_all_ratings
+from ratings import rescore_after_match_change
 from elo import WINNER_NOT_RECORDED
 from photos import get_s3_client, bucket_name
 
@@ -159,18 +159,19 @@ if __name__ == "__main__":
         if args.loser_no_show:
             print("Skipping rating recomputation because match is marked as unrated.")
         else:
-            ids = set([str(participant.athlete_id) for participant in participants])
-            for athlete_id in ids:
-                print("Recomputing ratings for", athlete_id)
-                recompute_all_ratings(
-                    db,
-                    gi,
-                    gender,
-                    happened_at,
-                    score=True,
-                    rerank=False,
-                    athlete_id=athlete_id,
-                )
+            print("Rescoring matches affected by the new result")
+            affected = rescore_after_match_change(
+                db,
+                gi,
+                gender,
+                happened_at,
+                match.event_id,
+                [participant.athlete_id for participant in participants],
+            )
+            print(
+                f"Rescored {affected.matches} matches of "
+                f"{len(affected.athletes)} athletes"
+            )
 
         with open(file_path, "a", newline="") as csvfile:
             writer = csv.writer(csvfile)